@@ -1,6 +1,8 @@
 #!/bin/bash
 
-# Removes trailing | symbols in file
+# Removes trailing | symbols in the .tbl files of the current directory, into output/
+# Wrapper around transform/transformtbl.py, which does this in parallel and can also
+# redelimit and transform the files in the same pass. See its --help. Like the sed loop
+# it replaces, it leaves only the data files in output/, without the manifest of a rerun.
 
-mkdir output
-for i in `ls *.tbl`; do sed 's/|$//' $i > output/$i; echo $i; done;
+python "$(dirname "$0")/transform/transformtbl.py" . --nomanifest "$@"
@@ -1,34 +1,13 @@
 #!/bin/bash
 
 # Splits a file in parts defined by the number of lines provided as the second
-# parameter.
-# Works ONLY for filenames without dots (.) in the filename, other than the
-# one separating the extension
-# Assumes CSV has header
+# parameter. Every part gets the header of the file.
+# Wrapper around transform/splitcsv.py, which does this in one pass and only cuts
+# between records. See its --help for splitting by size or straight into a transformer.
 
 if [ -z ${2+x} ]; then
    echo "Missing parameters. Provide filename and number of lines to split to";
    exit
 fi
 
-FILENAME=$1
-LINES_EACH=$2
-
-split -l $LINES_EACH $FILENAME
-
-NAME=`echo "$FILENAME" | cut -d'.' -f1`
-EXT=`echo "$FILENAME" | cut -d'.' -f2`
-
-HEADER=$(head -1 $FILENAME)
-
-for file in x*; do
-    if [ "$(head -1 $file)" != "$HEADER" ]; then
-	    cat <(echo $HEADER) $file > tmpfile
-        mv tmpfile "$NAME.$file.$EXT"
-        rm $file
-	else
-	    mv $file "$NAME.$file.$EXT"
-    fi
-done
-
-mv $FILENAME "$FILENAME.full"
+python "$(dirname "$0")/transform/splitcsv.py" "$1" --rows "$2"
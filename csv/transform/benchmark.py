@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import generatecsv
+
+'''
+Benchmarks the transformers on the same data and reports the results as JSON, to have a baseline
+to check changes to the engine against.
+
+Every engine is run as a separate process, so the peak RSS and CPU time of a run can be taken
+from the rusage of that process and its workers. Peak RSS is the maximum of the single largest
+process, not the sum over the workers. CPU utilisation is the CPU time divided by the wall time,
+so 2.0 means two cores were kept busy on average.
+
+The data is either an existing directory of CSV files or generated with generatecsv.py in a
+temporary directory.
+'''
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+
+engines = {
+    "monetdb-chain": ["transformcsv-monetdb.py", "--chain"],
+    "monetdb-compiled": ["transformcsv-monetdb.py"],
+    "monetdb-bytes": ["transformcsv-monetdb.py", "--bytes"],
+    "monetdb-columns": ["transformcsv-monetdb.py", "--columns"],
+    "mysql-postgres-chain": ["transformcsv-mysql-postgres.py", "--chain"],
+    "mysql-postgres-compiled": ["transformcsv-mysql-postgres.py"],
+    "mysql-postgres-bytes": ["transformcsv-mysql-postgres.py", "--bytes"],
+    "mysql-postgres-columns": ["transformcsv-mysql-postgres.py", "--columns"],
+    "sed": None
+}
+
+defaultengines = "monetdb-chain,monetdb-compiled,monetdb-bytes,monetdb-columns,sed"
+
+
+def list_data_files(directory: str) -> List[str]:
+    return sorted(directory + "/" + f for f in os.listdir(directory)
+                  if f.endswith(".csv") and os.path.isfile(directory + "/" + f))
+
+
+def count_lines(files: List[str]) -> int:
+    lines = 0
+
+    for file in files:
+        with open(file, "rb") as inputfile:
+            for block in iter(lambda: inputfile.read(16 * 1024 * 1024), b""):
+                lines += block.count(b"\n")
+
+    return lines
+
+
+def engine_command(engine: str, directory: str, workers: int = None) -> List[str]:
+    if engines[engine] is None:
+        outputdir = directory + "/output_sed"
+        os.makedirs(outputdir, exist_ok=True)
+
+        # One file after the other, like transformcsv.sh is used
+        script = 'for f in "$1"/*.csv; do bash "$2" "$f" > "$3/$(basename "$f")"; done'
+        return ["bash", "-c", script, "sed", directory, scriptdir + "/transformcsv.sh", outputdir]
+
+    (script, *options) = engines[engine]
+    command = [sys.executable, scriptdir + "/" + script, directory, "--restart"] + options
+
+    if workers is not None:
+        command += ["--workers", str(workers)]
+
+    return command
+
+
+'''
+Runs command and returns its wall time and the rusage of the process and all its children
+'''
+
+
+def run_command(command: List[str]) -> Dict:
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, cwd=scriptdir)
+    (pid, status, rusage) = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode != 0:
+        raise RuntimeError("%s exited with %d" % (" ".join(command), process.returncode))
+
+    return {
+        "seconds": seconds,
+        "cpuseconds": rusage.ru_utime + rusage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "peakrssmb": rusage.ru_maxrss / 1024
+    }
+
+
+# Output directories of the engines, removed before every run and after the benchmark
+outputdirs = ["output_monetdb", "output_mysql_postgres", "output_sed"]
+
+
+def remove_outputs(directory: str):
+    for name in outputdirs:
+        if os.path.isdir(directory + "/" + name):
+            shutil.rmtree(directory + "/" + name)
+
+
+def benchmark_engine(engine: str, directory: str, lines: int, size: int, repeat: int = 1,
+                     workers: int = None) -> Dict:
+    runs = []
+
+    for _ in range(repeat):
+        remove_outputs(directory)
+        runs.append(run_command(engine_command(engine, directory, workers)))
+
+    # The median run is reported, the separate wall times are kept to show the spread
+    run = sorted(runs, key=lambda r: r["seconds"])[len(runs) // 2]
+
+    return {
+        "engine": engine,
+        "lines": lines,
+        "bytes": size,
+        "seconds": run["seconds"],
+        "linespersecond": lines / run["seconds"],
+        "mbpersecond": size / (1024 * 1024) / run["seconds"],
+        "peakrssmb": run["peakrssmb"],
+        "cpuseconds": run["cpuseconds"],
+        "cpuutilisation": run["cpuseconds"] / run["seconds"],
+        "runs": [r["seconds"] for r in runs]
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=scriptdir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_to_baseline(results: List[Dict], baselinefile: str):
+    with open(baselinefile, "r") as inputfile:
+        baseline = {result["engine"]: result for result in json.load(inputfile)["results"]}
+
+    for result in results:
+        if result["engine"] in baseline:
+            result["speedup"] = result["linespersecond"] / baseline[result["engine"]]["linespersecond"]
+
+
+def generate_data(directory: str, files: int, rows: int, columns: str, datedensity: float, emptyratio: float,
+                  linelength: int, seed: int) -> List[Dict]:
+    return [generatecsv.generate_csv("%s/bench%d.csv" % (directory, i), rows, generatecsv.parse_columns(columns),
+                                     datedensity, emptyratio, linelength, seed + i)
+            for i in range(files)]
+
+
+def run_benchmark(directory: str, enginenames: List[str], repeat: int = 1, workers: int = None,
+                  generated: List[Dict] = None) -> Dict:
+    files = list_data_files(directory)
+    lines = count_lines(files)
+    size = sum(os.stat(file).st_size for file in files)
+    results = []
+
+    for engine in enginenames:
+        result = benchmark_engine(engine, directory, lines, size, repeat, workers)
+        print("%s: %f lines/sec, %f MB/s, peak RSS %f MB, CPU %f" %
+              (engine, result["linespersecond"], result["mbpersecond"], result["peakrssmb"],
+               result["cpuutilisation"]), file=sys.stderr)
+        results.append(result)
+
+    remove_outputs(directory)
+
+    return {
+        "revision": git_revision(),
+        "system": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cores": os.cpu_count()
+        },
+        "data": {
+            "directory": directory,
+            "files": len(files),
+            "lines": lines,
+            "bytes": size,
+            "generated": generated
+        },
+        "workers": workers,
+        "results": results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', nargs='?', default=None,
+                        help="Directory with CSV files to benchmark on, its output_* directories of the "
+                             "transformers are removed. Without it, data is generated in a temporary directory")
+    parser.add_argument('--engines', default=defaultengines,
+                        help="Comma separated engines to run, out of: %s" % ", ".join(engines))
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per engine, the median run is reported")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes of the Python engines")
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file instead of stdout")
+    parser.add_argument('--baseline', default=None,
+                        help="Earlier JSON report to compare against, adds the speedup per engine")
+    parser.add_argument('--files', type=int, default=1, help="Number of files to generate")
+    parser.add_argument('--rows', type=int, default=100000, help="Rows per generated file")
+    parser.add_argument('--columns', default=generatecsv.defaultcolumns,
+                        help="Column mix of the generated files, see generatecsv.py")
+    parser.add_argument('--datedensity', type=float, default=0.5,
+                        help="Fraction of the generated date values that has to be converted")
+    parser.add_argument('--emptyratio', type=float, default=0.1, help="Fraction of the generated fields that is \"\"")
+    parser.add_argument('--linelength', type=int, default=200, help="Approximate length of a generated line")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generator")
+
+    args = parser.parse_args()
+
+    enginenames = args.engines.split(",")
+
+    for engine in enginenames:
+        if engine not in engines:
+            parser.error("Unknown engine %s" % engine)
+
+    if args.directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            generated = generate_data(directory, args.files, args.rows, args.columns, args.datedensity,
+                                      args.emptyratio, args.linelength, args.seed)
+            report = run_benchmark(directory, enginenames, args.repeat, args.workers, generated)
+    else:
+        report = run_benchmark(args.directory, enginenames, args.repeat, args.workers)
+
+    if args.baseline is not None:
+        compare_to_baseline(report["results"], args.baseline)
+
+    if args.output is None:
+        print(json.dumps(report, indent=1))
+    else:
+        with open(args.output, "w") as outputfile:
+            json.dump(report, outputfile, indent=1)
@@ -0,0 +1,130 @@
+import os
+import random
+import argparse
+from typing import Dict, List
+
+'''
+Generates synthetic CSV files shaped like the exports the transformcsv-* scripts are run on, to
+benchmark the transformers on reproducible data (see benchmark.py).
+
+The column mix is given as type=count pairs. Date columns hold a date in the exported
+dd/mm/yyyy format, which every transformer has to rewrite, in datedensity of the rows and an ISO
+date that passes through untouched otherwise. Any quoted field is "" in emptyratio of the rows.
+Text fields are padded so the lines come out at roughly linelength bytes.
+'''
+
+columntypes = ["text", "integer", "decimal", "date", "bogusdate", "boolean"]
+defaultcolumns = "text=4,integer=2,decimal=1,date=2,bogusdate=1,boolean=1"
+
+words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+         "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "true", "false",
+         "12", "3/4/2018", "C:\\temp", "a,b", 'say ""hi""']
+
+
+def parse_columns(spec: str) -> List[str]:
+    columns = []
+
+    for pair in spec.split(","):
+        (name, count) = pair.split("=")
+
+        if name not in columntypes:
+            raise ValueError("Unknown column type %s, expected one of %s" % (name, ", ".join(columntypes)))
+
+        columns += [name] * int(count)
+
+    return columns
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    text = []
+    total = 0
+
+    while total < length:
+        word = rng.choice(words)
+        text.append(word)
+        total += len(word) + 1
+
+    return '"%s"' % " ".join(text)
+
+
+def random_time(rng: random.Random) -> str:
+    return "%02d:%02d:%02d" % (rng.randrange(24), rng.randrange(60), rng.randrange(60))
+
+
+def random_value(rng: random.Random, columntype: str, datedensity: float, textlength: int) -> str:
+    if columntype == "integer":
+        return '"%d"' % rng.randrange(1000000)
+
+    if columntype == "decimal":
+        return "%d.%02d" % (rng.randrange(100000), rng.randrange(100))
+
+    if columntype == "date":
+        (year, month, day) = (rng.randrange(1990, 2030), rng.randrange(1, 13), rng.randrange(1, 29))
+
+        if rng.random() < datedensity:
+            zone = " +%02d:00" % rng.randrange(12) if rng.random() < 0.5 else ""
+            return '"%d/%d/%d %s%s"' % (day, month, year, random_time(rng), zone)
+
+        return '"%d-%02d-%02d %s"' % (year, month, day, random_time(rng))
+
+    if columntype == "bogusdate":
+        year = rng.choice([1899, 9476]) if rng.random() < datedensity else rng.randrange(1990, 2030)
+        return '"%d-%02d-%02d %s"' % (year, rng.randrange(1, 13), rng.randrange(1, 29), random_time(rng))
+
+    if columntype == "boolean":
+        return rng.choice(['"true"', '"false"'])
+
+    return random_text(rng, textlength)
+
+
+def generate_csv(file: str, rows: int, columns: List[str], datedensity: float = 0.5, emptyratio: float = 0.1,
+                 linelength: int = 200, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    texts = columns.count("text")
+
+    # Roughly 16 bytes per non text field, the rest of the line is divided over the text fields
+    textlength = max(1, (linelength - 16 * (len(columns) - texts)) // texts) if texts else 0
+
+    with open(file, "w", newline="") as outputfile:
+        outputfile.write(",".join('"%s%d"' % (columntype, i) for (i, columntype) in enumerate(columns)) + "\n")
+
+        for _ in range(rows):
+            values = []
+
+            for columntype in columns:
+                if columntype != "decimal" and rng.random() < emptyratio:
+                    values.append('""')
+                else:
+                    values.append(random_value(rng, columntype, datedensity, textlength))
+
+            outputfile.write(",".join(values) + "\n")
+
+    return {
+        "file": file,
+        "rows": rows,
+        "bytes": os.stat(file).st_size,
+        "columns": columns,
+        "datedensity": datedensity,
+        "emptyratio": emptyratio,
+        "linelength": linelength,
+        "seed": seed
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', help="CSV file to write")
+    parser.add_argument('--rows', type=int, default=100000, help="Number of rows, excluding the header")
+    parser.add_argument('--columns', default=defaultcolumns,
+                        help="Column mix as type=count pairs, types: %s" % ", ".join(columntypes))
+    parser.add_argument('--datedensity', type=float, default=0.5,
+                        help="Fraction of the date values in the exported format that has to be converted")
+    parser.add_argument('--emptyratio', type=float, default=0.1, help="Fraction of the quoted fields that is \"\"")
+    parser.add_argument('--linelength', type=int, default=200, help="Approximate length of a line in bytes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator")
+
+    args = parser.parse_args()
+
+    result = generate_csv(args.file, args.rows, parse_columns(args.columns), args.datedensity, args.emptyratio,
+                          args.linelength, args.seed)
+    print("Generated %s: %d rows, %d bytes" % (result["file"], result["rows"], result["bytes"]))
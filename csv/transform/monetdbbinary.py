@@ -0,0 +1,368 @@
+import os
+import re
+import struct
+import decimal
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from transformcolumns import iterrecords, tokenize, infer_types, sample_records, defaultsamplerows
+
+'''
+Writes the binary column files of MonetDB's COPY BINARY INTO, so the server does not have to
+parse every value again. Every column of a table becomes one little-endian file:
+
+- tinyint, smallint, int and bigint as arrays of 1, 2, 4 and 8 byte integers, NULL being the
+  smallest value of the type
+- decimal(p,s) as integers scaled by 10^s of the width MonetDB uses for the precision
+- boolean as bytes 0 and 1, NULL being 0x80
+- real and double as IEEE floats, NULL being NaN
+- date as {uint8 day, uint8 month, int16 year}, time as {uint32 ms, uint8 seconds, uint8 minutes,
+  uint8 hours, uint8 padding} and timestamp as a time followed by a date, NULL having all bytes
+  set to 0xFF
+- strings as NUL terminated UTF-8, NULL being 0x80 and the NUL
+
+Load them with the statement printed for every file, COPY LITTLE ENDIAN BINARY INTO table FROM
+('table.0000.bin', ...). The column types are given as a comma separated list of MonetDB types or
+inferred from the first rows of a file. Inferred decimals become double, give the types to load
+them into a DECIMAL column.
+
+The values of every chunk are collected per column and encoded in one NumPy array. As the engine
+writes one output file per range, the workers write a container of (column, length, data)
+blocks, which split_container cuts into the column files once all ranges of a file are done.
+'''
+
+blockheader = struct.Struct("<II")
+
+# MonetDB type of every type transformcolumns can infer
+inferredtypes = {
+    "date": "timestamp",
+    "bogusdate": "timestamp",
+    "timestamp": "timestamp",
+    "boolean": "boolean",
+    "integer": "bigint",
+    "decimal": "double",
+    "text": "varchar"
+}
+
+integertypes = {
+    "tinyint": np.dtype("<i1"),
+    "smallint": np.dtype("<i2"),
+    "int": np.dtype("<i4"),
+    "integer": np.dtype("<i4"),
+    "bigint": np.dtype("<i8"),
+}
+
+floattypes = {
+    "real": np.dtype("<f4"),
+    "double": np.dtype("<f8"),
+}
+
+stringtypes = ("varchar", "clob", "string", "text", "char")
+
+datedtype = np.dtype([("day", "u1"), ("month", "u1"), ("year", "<i2")])
+timedtype = np.dtype([("ms", "<u4"), ("seconds", "u1"), ("minutes", "u1"), ("hours", "u1"), ("padding", "u1")])
+timestampdtype = np.dtype([("ms", "<u4"), ("seconds", "u1"), ("minutes", "u1"), ("hours", "u1"), ("padding", "u1"),
+                           ("day", "u1"), ("month", "u1"), ("year", "<i2")])
+
+truevalues = ("t", "true", "1", "y", "yes")
+falsevalues = ("f", "false", "0", "n", "no")
+
+typeregex = re.compile(r'(\w+)(?:\((\d+)(?:,\s*(\d+))?\))?')
+timestampregex = re.compile(r'(?:(\d+)-(\d+)-(\d+))?[ T]?(?:(\d+):(\d+):(\d+)(?:\.(\d{1,6}))?)?')
+
+
+def unquote(field: str) -> str:
+    if field.startswith('"'):
+        return field[1:-1].replace('""', '"')
+
+    return field
+
+
+def decimal_dtype(precision: int) -> np.dtype:
+    if precision <= 2:
+        return np.dtype("<i1")
+    if precision <= 4:
+        return np.dtype("<i2")
+    if precision <= 9:
+        return np.dtype("<i4")
+    if precision <= 18:
+        return np.dtype("<i8")
+
+    raise ValueError("decimal(%d) needs a 128 bit integer, which is not supported" % precision)
+
+
+def encode_integers(values: List[str], dtype: np.dtype, scale: int = None) -> bytes:
+    nil = np.iinfo(dtype).min
+    numbers = []
+
+    for value in values:
+        if value is None:
+            numbers.append(nil)
+        elif scale is None:
+            numbers.append(int(value))
+        else:
+            numbers.append(int((decimal.Decimal(value) * 10 ** scale).to_integral_value(decimal.ROUND_HALF_UP)))
+
+    try:
+        array = np.array(numbers, dtype=np.int64)
+    except OverflowError:
+        raise ValueError("Integer out of range of %s" % dtype) from None
+
+    if dtype != np.int64 and len(array) and (array.min() < nil or array.max() > np.iinfo(dtype).max):
+        raise ValueError("Integer out of range of %s" % dtype)
+
+    return array.astype(dtype).tobytes()
+
+
+def encode_booleans(values: List[str]) -> bytes:
+    result = bytearray(len(values))
+
+    for (i, value) in enumerate(values):
+        if value is None:
+            result[i] = 0x80
+            continue
+
+        lowered = value.lower()
+
+        if lowered in truevalues:
+            result[i] = 1
+        elif lowered not in falsevalues:
+            raise ValueError("Not a boolean: %r" % value)
+
+    return bytes(result)
+
+
+def encode_floats(values: List[str], dtype: np.dtype) -> bytes:
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=dtype).tobytes()
+
+
+def encode_temporal(values: List[str], dtype: np.dtype) -> bytes:
+    hasdate = "day" in dtype.names
+    hastime = "ms" in dtype.names
+    fields = {name: [] for name in ("year", "month", "day", "hours", "minutes", "seconds", "ms")}
+    nulls = []
+
+    for value in values:
+        match = timestampregex.fullmatch(value) if value is not None else None
+
+        if value is not None and (match is None or (hasdate and match.group(1) is None) or
+                                  (not hasdate and match.group(4) is None)):
+            raise ValueError("Not a %s: %r" % ("timestamp" if hasdate and hastime else "date" if hasdate else "time",
+                                                value))
+
+        nulls.append(value is None)
+        (year, month, day, hours, minutes, seconds, fraction) = match.groups() if match is not None else (None,) * 7
+
+        fields["year"].append(int(year or 0))
+        fields["month"].append(int(month or 0))
+        fields["day"].append(int(day or 0))
+        fields["hours"].append(int(hours or 0))
+        fields["minutes"].append(int(minutes or 0))
+        fields["seconds"].append(int(seconds or 0))
+        fields["ms"].append(int((fraction or "0").ljust(6, "0")) // 1000)
+
+    array = np.zeros(len(values), dtype=dtype)
+
+    for name in dtype.names:
+        if name != "padding":
+            array[name] = fields[name]
+
+    data = array.view(np.uint8).reshape(len(values), dtype.itemsize)
+    data[np.array(nulls, dtype=bool)] = 0xFF
+
+    return data.tobytes()
+
+
+def encode_strings(values: List[str]) -> bytes:
+    result = []
+
+    for value in values:
+        if value is None:
+            result.append(b"\x80\x00")
+        elif "\x00" in value:
+            raise ValueError("String with a NUL character: %r" % value)
+        else:
+            result.append(value.encode("UTF-8", "surrogateescape") + b"\x00")
+
+    return b"".join(result)
+
+
+'''
+Returns the function encoding a list of unquoted values (None being NULL) of the MonetDB type
+spec, for example int, varchar(100) or decimal(18,2)
+'''
+
+
+def column_encoder(spec: str) -> Callable[[List[str]], bytes]:
+    match = typeregex.fullmatch(spec.strip().lower())
+
+    if match is None:
+        raise ValueError("Can not parse the type %s" % spec)
+
+    (name, precision, scale) = match.groups()
+
+    if name in integertypes:
+        return lambda values: encode_integers(values, integertypes[name])
+
+    if name in ("decimal", "numeric"):
+        (precision, scale) = (int(precision or 18), int(scale or 3))
+        return lambda values: encode_integers(values, decimal_dtype(precision), scale)
+
+    if name in floattypes:
+        return lambda values: encode_floats(values, floattypes[name])
+
+    if name == "boolean":
+        return encode_booleans
+
+    if name == "date":
+        return lambda values: encode_temporal(values, datedtype)
+
+    if name == "time":
+        return lambda values: encode_temporal(values, timedtype)
+
+    if name == "timestamp":
+        return lambda values: encode_temporal(values, timestampdtype)
+
+    if name in stringtypes:
+        return encode_strings
+
+    raise ValueError("Unsupported type %s" % spec)
+
+
+def parse_types(spec: str) -> List[str]:
+    # Commas within the parentheses of decimal(18,2) do not separate types
+    types = [t.strip() for t in re.split(r',(?![^(]*\))', spec)]
+
+    for t in types:
+        column_encoder(t)
+
+    return types
+
+
+def infer_monetdbtypes(file: str, samplerows: int = defaultsamplerows) -> List[str]:
+    types = [inferredtypes[t] for t in infer_types(sample_records(file, samplerows))]
+    print("MonetDB types for %s: %s" % (file, ",".join(types)))
+
+    return types
+
+
+class MonetDBBinaryWriter:
+    '''
+    Chunk transformer turning whole CSV records into a block per column. types are the MonetDB
+    types of the columns, converters optionally maps a type name to a function run on the quoted
+    field before it is encoded. An empty field is NULL, "" is the empty string in string columns and
+    NULL in all others. The header record of the CSV file is skipped when header is set.
+    '''
+
+    def __init__(self, types: List[str], converters: Dict[str, Callable[[str], str]] = None,
+                 header: bool = True, validate: bool = True):
+        self.types = types
+        self.header = header
+        self.errors = "strict" if validate else "surrogateescape"
+        self.skip = False
+        self.columns = []
+
+        converters = converters or {}
+
+        for t in types:
+            name = typeregex.fullmatch(t.strip().lower()).group(1)
+            self.columns.append((column_encoder(t), converters.get(name), name in stringtypes))
+
+    def begin(self, first: bool) -> bytes:
+        self.skip = first and self.header
+
+        return b""
+
+    def finish(self, last: bool) -> bytes:
+        return b""
+
+    def __call__(self, chunk: bytes) -> bytes:
+        text = chunk.decode("UTF-8", self.errors)
+        values = [[] for _ in self.columns]
+
+        for record in iterrecords(text):
+            if self.skip:
+                self.skip = False
+                continue
+
+            if not record.strip("\r\n"):
+                continue
+
+            fields = tokenize(record)
+
+            if fields is None or len(fields) != len(self.columns):
+                raise ValueError("Record does not match the %d columns %s: %r" %
+                                 (len(self.columns), ",".join(self.types), record[:200]))
+
+            for (field, column, (encode, convert, isstring)) in zip(fields, values, self.columns):
+                if field == "" or (field == '""' and not isstring):
+                    column.append(None)
+                else:
+                    column.append(unquote(convert(field) if convert is not None else field))
+
+        if not values[0]:
+            return b""
+
+        blocks = []
+
+        for (i, (column, (encode, convert, isstring))) in enumerate(zip(values, self.columns)):
+            try:
+                data = encode(column)
+            except ValueError as e:
+                raise ValueError("Column %d (%s): %s" % (i + 1, self.types[i], e)) from None
+
+            blocks.append(blockheader.pack(i, len(data)))
+            blocks.append(data)
+
+        return b"".join(blocks)
+
+
+def column_filename(container: str, column: int) -> str:
+    return "%s.%04d.bin" % (os.path.splitext(container)[0], column)
+
+
+'''
+Cuts the container written by MonetDBBinaryWriter into its column files and removes it. Returns
+the column files, the ones of columns without any block are created empty.
+'''
+
+
+def split_container(container: str, columns: int) -> List[str]:
+    outputs = [column_filename(container, column) for column in range(columns)]
+    outputfiles = [open(output, "wb") for output in outputs]
+
+    try:
+        with open(container, "rb") as inputfile:
+            while True:
+                header = inputfile.read(blockheader.size)
+
+                if not header:
+                    break
+
+                (column, length) = blockheader.unpack(header)
+                outputfiles[column].write(inputfile.read(length))
+    finally:
+        for outputfile in outputfiles:
+            outputfile.close()
+
+    os.remove(container)
+
+    return outputs
+
+
+def count_columns(file: str) -> int:
+    records = sample_records(file, 1, header=False)
+
+    return len(records[0]) if records else 0
+
+
+def copy_statement(table: str, outputs: List[str]) -> str:
+    return "COPY LITTLE ENDIAN BINARY INTO %s FROM (%s);" % \
+           (table, ", ".join("'%s'" % os.path.abspath(output) for output in outputs))
+
+
+def finalize(filepath: str, container: str, types: List[str] = None) -> Tuple[List[str], List[str]]:
+    outputs = split_container(container, len(types) if types is not None else count_columns(filepath))
+
+    return (outputs, [copy_statement(os.path.splitext(filepath.split("/")[-1])[0], outputs)])
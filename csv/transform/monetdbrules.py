@@ -0,0 +1,198 @@
+import re
+import functools
+from typing import Dict, List
+
+import transformcolumns
+from transformcache import CachedConverter
+from transformmetrics import TimedRule, TimedChain, timed_rules, timed_converters
+from transformrules import *
+
+'''
+Changes occurrences of the format "20/12/2016 20:08:51 +00:00" or "20/12/2016 20:08:51" to
+"2016-12-20 20:08:51"
+'''
+
+
+def transformdates(line: str):
+    return re.sub(r'"(?P<day>\d+)/(?P<month>\d+)/(?P<year>\d+) (?P<time>\d+:\d+:\d+)( \+\d+:\d+)?"',
+                  "\g<year>-\g<month>-\g<day> \g<time>", line)
+
+
+def transformbogusdates(line: str):
+    result = line
+    result = re.sub(r'"1899-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"1970-\g<rest>"', result)
+    result = re.sub(r'"9476-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"2018-\g<rest>"', result)
+    return result
+
+
+def transformemptystrings(line: str) -> str:
+    return re.sub(r',(""(?=,)|""$)', ",NULL", line)
+
+
+def transformbooleans(line: str) -> str:
+    line = re.sub(r'"true"', "1", line, flags=re.I)
+    return re.sub(r'"false"', "0", line, flags=re.I)
+
+
+def transformintegers(line: str) -> str:
+    result = line
+    result = re.sub(r'"(?P<int>\d+)"', "\g<int>", result)
+    return result
+
+
+def escapeoctals(line: str) -> str:
+    result = line
+    result = re.sub(r'\\(?P<digit>\d+)', r'\\\\\g<digit>', result)
+    return result
+
+
+def transformline_chain(line: str) -> str:
+    result = line
+
+    result = transformdates(result)
+    result = transformbogusdates(result)
+    result = transformbooleans(result)
+    result = transformintegers(result)
+    result = escapeoctals(result)
+
+    return result
+
+
+'''
+Compiled version of transformline_chain, see transformrules.py. Same output, one scan per line
+'''
+
+
+def convertdate(text: str) -> str:
+    (date, time) = text[1:-1].split(" ")[0:2]
+    (day, month, year) = date.split("/")
+
+    return year + "-" + month + "-" + day + " " + time
+
+
+rules = [
+    # Dumps repeat the same dates, each one is only converted once
+    Rule("dates", datepattern, CachedConverter("dates", convertdate)),
+    Rule("bogusdates", bogusdatepattern, convertbogusdate),
+    Rule("true", truepattern, converttrue, ignorecase=True),
+    Rule("false", falsepattern, convertfalse, ignorecase=True),
+    Rule("integers", integerpattern, convertinteger),
+    # Last rule of the chain and never part of a field rule match, so it can not interact
+    Rule("octals", octalpattern, convertoctal, field=False, starts="\\", requires="\\"),
+]
+
+ruleset = RuleSet(rules, transformline_chain)
+
+
+def transformline(line: str) -> str:
+    return ruleset.transformline(line)
+
+
+def transformchunk(chunk: bytes, validate: bool = True) -> bytes:
+    return ruleset.transformchunk(chunk, validate)
+
+
+'''
+Timed variants for --rulestats, see transformmetrics.py. Every rule and step of the chain counts
+its own calls, changes and time, the chain run as fallback of the compiled rules counts as one.
+'''
+
+transformline_chain_timed = TimedChain([transformdates, transformbogusdates, transformbooleans,
+                                        transformintegers, escapeoctals])
+
+timedruleset = RuleSet(timed_rules(rules), TimedRule("fallback", transformline_chain))
+
+
+def transformline_timed(line: str) -> str:
+    return timedruleset.transformline(line)
+
+
+def transformchunk_timed(chunk: bytes, validate: bool = True) -> bytes:
+    return timedruleset.transformchunk(chunk, validate)
+
+
+'''
+Column plan mode, see transformcolumns.py
+'''
+
+dateregex = re.compile(datepattern)
+
+
+def converttimestamp(text: str) -> str:
+    if dateregex.fullmatch(text):
+        return convertdate(text)
+
+    return convertisodate(text)
+
+
+columnconverters = {
+    "date": convertdate,
+    "bogusdate": convertisodate,
+    "timestamp": converttimestamp,
+    "boolean": convertboolean,
+    "integer": convertinteger,
+}
+
+# Shared by all the plans of a process, so a worker keeps one capped cache per type
+cachedcolumnconverters = transformcolumns.cached_converters(columnconverters)
+timedcolumnconverters = transformcolumns.cached_converters(timed_converters(columnconverters))
+
+
+def columnplan(file: str, types: List[str] = None, samplerows: int = transformcolumns.defaultsamplerows,
+               validate: bool = True, timed: bool = False):
+    if timed:
+        plan = transformcolumns.plan_file(file, timedcolumnconverters, transformline_timed, None,
+                                          TimedRule("escapeoctals", escapeoctals), samplerows, types)
+    else:
+        plan = transformcolumns.plan_file(file, cachedcolumnconverters, transformline, None, escapeoctals,
+                                          samplerows, types)
+
+    return functools.partial(plan.transformchunk, validate=validate)
+
+
+'''
+Plan of a file for columnplan, made once per file by transformengine.transformcsvfiles: the
+inferred column types, so the parts of a split file do not sample it again and get the same plan
+'''
+
+
+def columntypes(file: str, samplerows: int = transformcolumns.defaultsamplerows) -> Dict:
+    return {"types": transformcolumns.infer_file_types(file, samplerows)}
+
+
+'''
+MonetDB binary column files, see monetdbbinary.py. Timestamps get the same conversions as in the
+CSV output before they are encoded. Octals are not escaped, the server does not parse the values.
+
+monetdbbinary needs numpy, so it is only imported once binary output is asked for: the CSV rules
+run without numpy.
+'''
+
+cachedtimestamp = CachedConverter("timestamp", converttimestamp)
+
+binaryconverters = {
+    "timestamp": cachedtimestamp,
+    "date": cachedtimestamp,
+}
+
+
+def binarywriter(file: str, types: List[str] = None, samplerows: int = transformcolumns.defaultsamplerows,
+                 validate: bool = True) -> "monetdbbinary.MonetDBBinaryWriter":
+    import monetdbbinary
+
+    if types is None:
+        types = monetdbbinary.infer_monetdbtypes(file, samplerows)
+
+    return monetdbbinary.MonetDBBinaryWriter(types, binaryconverters, validate=validate)
+
+
+'''
+Plan of a file for binarywriter, made once per file by transformengine.transformcsvfiles: the
+inferred types, so the parts of a split file do not sample it again
+'''
+
+
+def binaryplan(file: str, samplerows: int = transformcolumns.defaultsamplerows) -> Dict:
+    import monetdbbinary
+
+    return {"types": monetdbbinary.infer_monetdbtypes(file, samplerows)}
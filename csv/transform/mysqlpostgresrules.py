@@ -0,0 +1,181 @@
+import re
+import functools
+from typing import Dict, List
+
+import pgcopy
+import transformcolumns
+from transformcache import CachedConverter
+from transformmetrics import TimedRule, TimedChain, timed_rules, timed_converters
+from transformrules import *
+
+'''
+Changes occurrences of the format "20/12/2016 20:08:51 +00:00" or "20/12/2016 20:08:51" to
+"2016-12-20 20:08:51"
+'''
+
+
+def transformdates(line: str):
+    return re.sub(r'"(?P<day>\d+)/(?P<month>\d+)/(?P<year>\d+) (?P<time>\d+:\d+:\d+)( \+\d+:\d+)?"',
+                  "\"\g<year>-\g<month>-\g<day> \g<time>\"", line)
+
+def transformbogusdates(line: str):
+    result = line
+    result = re.sub(r'"1899-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"1970-\g<rest>"', result)
+    result = re.sub(r'"9476-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"2018-\g<rest>"', result)
+    return result
+
+
+def transformemptystrings(line: str) -> str:
+    return re.sub(r',(""(?=,)|""$)', ",NULL", line)
+
+
+def transformbooleans(line: str) -> str:
+    line = re.sub(r'"true"', "1", line, flags=re.I)
+    return re.sub(r'"false"', "0", line, flags=re.I)
+
+def transformline_chain(line: str) -> str:
+    result = line
+
+    result = transformdates(result)
+    result = transformbogusdates(result)
+    result = transformemptystrings(result)
+    result = transformbooleans(result)
+
+    return result
+
+
+'''
+Compiled version of transformline_chain, see transformrules.py. Same output, one scan per line
+'''
+
+
+def convertdate(text: str) -> str:
+    (date, time) = text[1:-1].split(" ")[0:2]
+    (day, month, year) = date.split("/")
+
+    # The chain runs transformbogusdates on the output of transformdates
+    if year == "1899":
+        year = "1970"
+    elif year == "9476":
+        year = "2018"
+
+    return '"' + year + "-" + month + "-" + day + " " + time + '"'
+
+
+rules = [
+    # Dumps repeat the same dates, each one is only converted once
+    Rule("dates", datepattern, CachedConverter("dates", convertdate)),
+    Rule("bogusdates", bogusdatepattern, convertbogusdate),
+    # Only matches ,"" followed by a comma or the line ending, which no other rule matches or produces
+    Rule("emptystrings", emptystringpattern, convertemptystring, field=False, starts=","),
+    Rule("true", truepattern, converttrue, ignorecase=True),
+    Rule("false", falsepattern, convertfalse, ignorecase=True),
+]
+
+ruleset = RuleSet(rules, transformline_chain)
+
+
+def transformline(line: str) -> str:
+    return ruleset.transformline(line)
+
+
+def transformchunk(chunk: bytes, validate: bool = True) -> bytes:
+    return ruleset.transformchunk(chunk, validate)
+
+
+'''
+Timed variants for --rulestats, see transformmetrics.py. Every rule and step of the chain counts
+its own calls, changes and time, the chain run as fallback of the compiled rules counts as one.
+'''
+
+transformline_chain_timed = TimedChain([transformdates, transformbogusdates, transformemptystrings,
+                                        transformbooleans])
+
+timedruleset = RuleSet(timed_rules(rules), TimedRule("fallback", transformline_chain))
+
+
+def transformline_timed(line: str) -> str:
+    return timedruleset.transformline(line)
+
+
+def transformchunk_timed(chunk: bytes, validate: bool = True) -> bytes:
+    return timedruleset.transformchunk(chunk, validate)
+
+
+'''
+Column plan mode, see transformcolumns.py
+'''
+
+dateregex = re.compile(datepattern)
+
+
+def converttimestamp(text: str) -> str:
+    if dateregex.fullmatch(text):
+        return convertdate(text)
+
+    return convertisodate(text)
+
+
+columnconverters = {
+    "date": convertdate,
+    "bogusdate": convertisodate,
+    "timestamp": converttimestamp,
+    "boolean": convertboolean,
+}
+
+# Shared by all the plans of a process, so a worker keeps one capped cache per type
+cachedcolumnconverters = transformcolumns.cached_converters(columnconverters)
+timedcolumnconverters = transformcolumns.cached_converters(timed_converters(columnconverters))
+
+
+def columnplan(file: str, types: List[str] = None, samplerows: int = transformcolumns.defaultsamplerows,
+               validate: bool = True, timed: bool = False):
+    if timed:
+        plan = transformcolumns.plan_file(file, timedcolumnconverters, transformline_timed, "NULL", None,
+                                          samplerows, types)
+    else:
+        plan = transformcolumns.plan_file(file, cachedcolumnconverters, transformline, "NULL", None,
+                                          samplerows, types)
+
+    return functools.partial(plan.transformchunk, validate=validate)
+
+
+'''
+Plan of a file for columnplan, made once per file by transformengine.transformcsvfiles: the
+inferred column types, so the parts of a split file do not sample it again and get the same plan
+'''
+
+
+def columntypes(file: str, samplerows: int = transformcolumns.defaultsamplerows) -> Dict:
+    return {"types": transformcolumns.infer_file_types(file, samplerows)}
+
+
+'''
+PGCOPY binary output, see pgcopy.py. Timestamps get the same conversions as in the CSV output
+before they are encoded.
+'''
+
+cachedtimestamp = CachedConverter("timestamp", converttimestamp)
+
+pgcopyconverters = {
+    "timestamp": cachedtimestamp,
+    "date": cachedtimestamp,
+}
+
+
+def pgcopywriter(file: str, types: List[str] = None, samplerows: int = transformcolumns.defaultsamplerows,
+                 validate: bool = True) -> pgcopy.PgCopyWriter:
+    if types is None:
+        types = pgcopy.infer_pgtypes(file, samplerows)
+
+    return pgcopy.PgCopyWriter(types, pgcopyconverters, validate=validate)
+
+
+'''
+Plan of a file for pgcopywriter, made once per file by transformengine.transformcsvfiles: the
+inferred types, so the parts of a split file do not sample it again
+'''
+
+
+def pgcopyplan(file: str, samplerows: int = transformcolumns.defaultsamplerows) -> Dict:
+    return {"types": pgcopy.infer_pgtypes(file, samplerows)}
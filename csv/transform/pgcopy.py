@@ -0,0 +1,319 @@
+import re
+import csv
+import sys
+import struct
+import argparse
+import datetime
+from typing import Callable, Dict, List
+
+from transformcache import CachedConverter
+from transformcolumns import iterrecords, tokenize, infer_types, sample_records, defaultsamplerows
+
+'''
+Writes PostgreSQL's binary COPY format (PGCOPY), so the server does not have to parse the CSV
+again while loading. Load the output with
+
+    COPY table FROM '/path/file.pgcopy' WITH (FORMAT binary)
+
+The binary format carries no type information: the types of the columns have to be exactly the
+types of the columns of the table. They are given as a comma separated list of PostgreSQL types
+or inferred from the first rows of a file (see transformcolumns.infer_types).
+
+An empty field, quoted or not, is written as NULL like the CSV transformer turns "" into NULL.
+Timestamps are passed through the dialect's date conversions before they are encoded, so bogus
+dates are corrected the same way as in the CSV output.
+
+read_pgcopy reads the format back, to verify the output without a database.
+'''
+
+signature = b"PGCOPY\n\xff\r\n\x00"
+fileheader = signature + struct.pack("!ii", 0, 0)
+filetrailer = struct.pack("!h", -1)
+
+postgresepoch = datetime.datetime(2000, 1, 1)
+
+int16 = struct.Struct("!h")
+int32 = struct.Struct("!i")
+int64 = struct.Struct("!q")
+float64 = struct.Struct("!d")
+numericheader = struct.Struct("!hhhh")
+
+timestampregex = re.compile(r'(\d+)-(\d+)-(\d+)(?:[ T](\d+):(\d+):(\d+)(?:\.(\d{1,6}))?)?')
+numericregex = re.compile(r'([+-]?)(\d*)(?:\.(\d*))?')
+
+# Postgres type of every type transformcolumns can infer
+inferredtypes = {
+    "date": "timestamp",
+    "bogusdate": "timestamp",
+    "timestamp": "timestamp",
+    "boolean": "bool",
+    "integer": "int8",
+    "decimal": "numeric",
+    "text": "text"
+}
+
+truevalues = ("t", "true", "1", "y", "yes")
+falsevalues = ("f", "false", "0", "n", "no")
+
+
+def unquote(field: str) -> str:
+    if field.startswith('"'):
+        return field[1:-1].replace('""', '"')
+
+    return field
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    match = timestampregex.fullmatch(value)
+
+    if match is None:
+        raise ValueError("Not a timestamp: %r" % value)
+
+    (year, month, day, hour, minute, second, fraction) = match.groups()
+
+    return datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                             int((fraction or "0").ljust(6, "0")))
+
+
+def encode_timestamp(value: str) -> bytes:
+    return int64.pack((parse_timestamp(value) - postgresepoch) // datetime.timedelta(microseconds=1))
+
+
+def encode_date(value: str) -> bytes:
+    return int32.pack((parse_timestamp(value).date() - postgresepoch.date()).days)
+
+
+def encode_bool(value: str) -> bytes:
+    lowered = value.lower()
+
+    if lowered in truevalues:
+        return b"\x01"
+
+    if lowered in falsevalues:
+        return b"\x00"
+
+    raise ValueError("Not a boolean: %r" % value)
+
+
+def encode_int(packer: struct.Struct) -> Callable[[str], bytes]:
+    def encode(value: str) -> bytes:
+        try:
+            return packer.pack(int(value))
+        except struct.error:
+            raise ValueError("Integer out of range: %r" % value) from None
+
+    return encode
+
+
+'''
+numeric is sent as base 10000 digits: the number of digits, the weight of the first digit (its
+power of 10000), the sign and the number of decimals to display, followed by the digits
+'''
+
+
+def encode_numeric(value: str) -> bytes:
+    match = numericregex.fullmatch(value)
+
+    if match is None or not (match.group(2) or match.group(3)):
+        raise ValueError("Not a numeric: %r" % value)
+
+    (sign, integral, fraction) = (match.group(1), match.group(2), match.group(3) or "")
+    integral = integral.lstrip("0")
+    scale = len(fraction)
+
+    integral = integral.rjust((len(integral) + 3) // 4 * 4, "0")
+    fraction = fraction.ljust((len(fraction) + 3) // 4 * 4, "0")
+
+    digits = [int(integral[i:i + 4]) for i in range(0, len(integral), 4)] + \
+             [int(fraction[i:i + 4]) for i in range(0, len(fraction), 4)]
+    weight = len(integral) // 4 - 1
+
+    while digits and digits[0] == 0:
+        digits.pop(0)
+        weight -= 1
+
+    while digits and digits[-1] == 0:
+        digits.pop()
+
+    if not digits:
+        return numericheader.pack(0, 0, 0, scale)
+
+    return numericheader.pack(len(digits), weight, 0x4000 if sign == "-" else 0, scale) + \
+        struct.pack("!%dh" % len(digits), *digits)
+
+
+def encode_text(value: str) -> bytes:
+    return value.encode("UTF-8")
+
+
+encoders = {
+    "text": encode_text,
+    "varchar": encode_text,
+    "bool": encode_bool,
+    "int2": encode_int(int16),
+    "int4": encode_int(int32),
+    "int8": encode_int(int64),
+    "float8": lambda value: float64.pack(float(value)),
+    "numeric": encode_numeric,
+    # Parsing a timestamp is the slowest encoding, and the same ones come back over and over
+    "date": CachedConverter("encodedate", encode_date),
+    "timestamp": CachedConverter("encodetimestamp", encode_timestamp),
+}
+
+
+def parse_types(spec: str) -> List[str]:
+    types = [t.strip().lower() for t in spec.split(",")]
+
+    for t in types:
+        if t not in encoders:
+            raise ValueError("Unsupported type %s, expected one of %s" % (t, ", ".join(encoders)))
+
+    return types
+
+
+def infer_pgtypes(file: str, samplerows: int = defaultsamplerows) -> List[str]:
+    types = [inferredtypes[t] for t in infer_types(sample_records(file, samplerows))]
+    print("PGCOPY types for %s: %s" % (file, ",".join(types)))
+
+    return types
+
+
+class PgCopyWriter:
+    '''
+    Chunk transformer turning whole CSV records into PGCOPY tuples. types are the Postgres types of
+    the columns, converters optionally maps a type to a function run on the quoted field before it
+    is encoded. The header record of the CSV file is skipped when header is set.
+
+    Implements the framing of transformengine.transformcsv: begin and finish return the file header
+    and trailer, for the part at the start and at the end of a file only.
+    '''
+
+    def __init__(self, types: List[str], converters: Dict[str, Callable[[str], str]] = None,
+                 header: bool = True, validate: bool = True):
+        self.types = types
+        self.header = header
+        self.errors = "strict" if validate else "surrogateescape"
+        self.skip = False
+        self.columns = []
+
+        converters = converters or {}
+
+        for t in types:
+            self.columns.append((encoders[t], converters.get(t)))
+
+        self.count = int16.pack(len(types))
+
+    def begin(self, first: bool) -> bytes:
+        self.skip = first and self.header
+
+        return fileheader if first else b""
+
+    def finish(self, last: bool) -> bytes:
+        return filetrailer if last else b""
+
+    def encoderecord(self, record: str) -> bytes:
+        fields = tokenize(record)
+
+        if fields is None or len(fields) != len(self.columns):
+            raise ValueError("Record does not match the %d columns %s: %r" %
+                             (len(self.columns), ",".join(self.types), record[:200]))
+
+        result = [self.count]
+
+        for (column, (field, (encode, convert))) in enumerate(zip(fields, self.columns)):
+            if field == "" or field == '""':
+                result.append(b"\xff\xff\xff\xff")
+                continue
+
+            if convert is not None:
+                field = convert(field)
+
+            try:
+                data = encode(unquote(field))
+            except ValueError as e:
+                raise ValueError("Column %d (%s): %s" % (column + 1, self.types[column], e)) from None
+
+            result.append(int32.pack(len(data)))
+            result.append(data)
+
+        return b"".join(result)
+
+    def __call__(self, chunk: bytes) -> bytes:
+        text = chunk.decode("UTF-8", self.errors)
+        result = []
+
+        for record in iterrecords(text):
+            if self.skip:
+                self.skip = False
+                continue
+
+            if record.strip("\r\n"):
+                result.append(self.encoderecord(record))
+
+        return b"".join(result)
+
+
+'''
+Reads a PGCOPY file back into rows of Python values, NULL being None. Only needed to verify the
+output locally, the types have to be the ones the file was written with.
+'''
+
+decoders = {
+    "text": lambda data: data.decode("UTF-8", "surrogateescape"),
+    "varchar": lambda data: data.decode("UTF-8", "surrogateescape"),
+    "bool": lambda data: data != b"\x00",
+    "int2": lambda data: int16.unpack(data)[0],
+    "int4": lambda data: int32.unpack(data)[0],
+    "int8": lambda data: int64.unpack(data)[0],
+    "float8": lambda data: float64.unpack(data)[0],
+    "numeric": lambda data: decode_numeric(data),
+    "date": lambda data: postgresepoch.date() + datetime.timedelta(days=int32.unpack(data)[0]),
+    "timestamp": lambda data: postgresepoch + datetime.timedelta(microseconds=int64.unpack(data)[0]),
+}
+
+
+def decode_numeric(data: bytes) -> str:
+    (ndigits, weight, sign, scale) = numericheader.unpack_from(data)
+    digits = struct.unpack_from("!%dh" % ndigits, data, numericheader.size)
+
+    integral = "".join("%04d" % digits[i] if 0 <= i < ndigits else "0000" for i in range(weight + 1)).lstrip("0")
+    fraction = "".join("%04d" % digits[i] if 0 <= i < ndigits else "0000"
+                       for i in range(weight + 1, weight + 1 + (scale + 3) // 4))[:scale]
+
+    return ("-" if sign == 0x4000 else "") + (integral or "0") + ("." + fraction if scale else "")
+
+
+def read_pgcopy(inputfile, types: List[str]):
+    if inputfile.read(len(fileheader))[:len(signature)] != signature:
+        raise ValueError("Not a PGCOPY file")
+
+    while True:
+        (count,) = int16.unpack(inputfile.read(2))
+
+        if count == -1:
+            return
+
+        if count != len(types):
+            raise ValueError("Tuple of %d fields, expected %d" % (count, len(types)))
+
+        row = []
+
+        for t in types:
+            (length,) = int32.unpack(inputfile.read(4))
+            row.append(None if length == -1 else decoders[t](inputfile.read(length)))
+
+        yield row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints a PGCOPY file as CSV, NULL as an empty field")
+    parser.add_argument('file', help="PGCOPY file to read")
+    parser.add_argument('--types', required=True, help="Comma separated Postgres types of the columns")
+
+    args = parser.parse_args()
+
+    writer = csv.writer(sys.stdout)
+
+    with open(args.file, "rb") as inputfile:
+        for row in read_pgcopy(inputfile, parse_types(args.types)):
+            writer.writerow(["" if value is None else value for value in row])
@@ -0,0 +1,320 @@
+import os
+import time
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import transformengine
+import transformscheduler
+
+'''
+Splits a CSV file in parts of a number of rows or a number of bytes, replacing csv/splitcsv.sh.
+Parts are only cut at the end of a record, never at a newline in a quoted field, and every part
+starts with the header of the file. Parts are written next to the file (or to outputdir) as
+name.part0000.ext, like the parts of the transformers.
+
+The file is read once, in blocks. The writes of the blocks to the parts are done by a pool of
+threads with os.pwrite, so writing overlaps with reading and scanning the next blocks.
+
+With a transformer the parts are not written as they are: the record boundaries are found in one
+scan and every part is transformed from the original file by the worker processes of the
+transformer, straight into its part file in the output directory of the transformer (or outputdir).
+'''
+
+blocksize = 16 * 1024 * 1024
+
+
+class RecordScanner:
+    '''
+    Tracks whether the current position of a file read in blocks is inside a quoted field
+    '''
+
+    def __init__(self):
+        self.inquotes = False
+
+    def skip(self, block: bytes, start: int, end: int):
+        if block.count(b'"', start, end) % 2:
+            self.inquotes = not self.inquotes
+
+    '''
+    Looks for the ends of at most records records in block from start. Returns the offset right
+    after the last end found, or -1 when fewer were found, and the number of ends found.
+    '''
+
+    def find_records(self, block: bytes, start: int, records: int) -> Tuple[int, int]:
+        position = start
+        found = 0
+
+        # Fast path: no quotes in the rest of the block and too few lines to reach records
+        if not self.inquotes and block.find(b'"', start) == -1:
+            lines = block.count(b"\n", start)
+
+            if lines < records:
+                return -1, lines
+
+        while found < records:
+            newline = block.find(b"\n", position)
+
+            if newline == -1:
+                self.skip(block, position, len(block))
+                return -1, found
+
+            self.skip(block, position, newline)
+            position = newline + 1
+
+            if not self.inquotes:
+                found += 1
+
+        return position, found
+
+
+'''
+Returns the offsets at which file is cut in parts of rows records (not counting the header) or of
+at least size bytes. The first offset is the end of the header, the last the file size.
+'''
+
+
+def find_split_boundaries(file: str, rows: int = None, size: int = None) -> List[int]:
+    boundaries = []
+
+    for (part, offset, block, start, end, complete) in iter_parts(file, rows, size):
+        if complete:
+            boundaries.append(offset + end)
+
+    filesize = os.stat(file).st_size
+
+    if not boundaries:
+        return [filesize, filesize]
+
+    if len(boundaries) == 1 or boundaries[-1] != filesize:
+        boundaries.append(filesize)
+
+    return boundaries
+
+
+'''
+Reads file once and yields (part, offset, block, start, end, complete) for every piece of a part
+in the blocks read: block[start:end] belongs to part, offset being the offset of block in the
+file. complete tells whether the part ends at end. Part -1 is the header record.
+'''
+
+
+def iter_parts(file: str, rows: int = None, size: int = None):
+    scanner = RecordScanner()
+    offset = 0
+    part = -1
+    partsize = 0
+    partrows = 0
+
+    with open(file, "rb") as inputfile:
+        while True:
+            block = inputfile.read(blocksize)
+
+            if not block:
+                return
+
+            start = 0
+
+            while start < len(block):
+                if part == -1:
+                    (end, found) = scanner.find_records(block, start, 1)
+                elif rows is not None:
+                    (end, found) = scanner.find_records(block, start, rows - partrows)
+                    partrows += found
+                else:
+                    target = start + max(0, size - partsize)
+
+                    if target >= len(block):
+                        scanner.skip(block, start, len(block))
+                        end = -1
+                    else:
+                        scanner.skip(block, start, target)
+                        (end, found) = scanner.find_records(block, target, 1)
+
+                complete = end != -1
+
+                if not complete:
+                    end = len(block)
+
+                yield part, offset, block, start, end, complete
+
+                if not complete:
+                    partsize += end - start
+                    break
+
+                start = end
+                part += 1
+                partsize = 0
+                partrows = 0
+
+            offset += len(block)
+
+
+class PartWriter:
+    '''
+    Writes the parts of a split with os.pwrite calls run in a pool of threads. Every part is
+    opened when its first data arrives, and closed once all its writes are done.
+    '''
+
+    def __init__(self, file: str, outputdir: str, workers: int):
+        self.dstfile = outputdir + "/" + file.split("/")[-1]
+        # Written in front of every part but the first, which has the header of the file itself
+        self.header = b""
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.maxpending = 2 * workers
+        self.pending = []
+        self.parts = []
+        self.fd = None
+        self.position = 0
+
+    def write(self, data):
+        if not len(data):
+            return
+
+        if self.fd is None:
+            partfile = transformengine.part_filename(self.dstfile, len(self.parts))
+            self.parts.append(partfile)
+            self.fd = os.open(partfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            self.position = 0
+
+            if len(self.parts) > 1:
+                self.submit(self.header)
+
+        self.submit(data)
+
+    def submit(self, data):
+        # Bounds the memory held by writes that have not been done yet
+        while len(self.pending) >= self.maxpending:
+            self.pending.pop(0).result()
+
+        self.pending.append(self.pool.submit(pwrite_all, self.fd, data, self.position))
+        self.position += len(data)
+
+    def end_part(self):
+        if self.fd is None:
+            return
+
+        for future in self.pending:
+            future.result()
+
+        self.pending = []
+        os.close(self.fd)
+        self.fd = None
+
+    def close(self):
+        self.end_part()
+        self.pool.shutdown()
+
+
+def pwrite_all(fd: int, data, position: int):
+    view = memoryview(data)
+
+    while len(view):
+        written = os.pwrite(fd, view, position)
+        view = view[written:]
+        position += written
+
+
+def split_csv(file: str, outputdir: str = None, rows: int = None, size: int = None, workers: int = None) -> List[str]:
+    begin = time.time()
+
+    if outputdir is None:
+        outputdir = os.path.dirname(file) or "."
+
+    writer = PartWriter(file, outputdir, workers or transformengine.default_workers())
+
+    try:
+        for (part, offset, block, start, end, complete) in iter_parts(file, rows, size):
+            piece = memoryview(block)[start:end]
+
+            if part == -1:
+                writer.header += bytes(piece)
+
+            writer.write(piece)
+
+            if complete and part != -1:
+                writer.end_part()
+    finally:
+        writer.close()
+
+    print("Split %s in %d parts in %f seconds" % (file, len(writer.parts), time.time() - begin))
+
+    return writer.parts
+
+
+def _transformpart(args) -> Dict:
+    (file, outputdir, transformername, bytesmode, start, end, dstfile, header) = args
+    rules = importlib.import_module(transformengine.dialects[transformername][0])
+    transformchunk = rules.transformchunk if bytesmode else None
+
+    return transformengine.transformcsv(file, outputdir, rules.transformline, start, end, dstfile, transformchunk,
+                                        header=header)
+
+
+'''
+Splits file like split_csv, but transforms every part with the transformer instead of copying
+it. The parts are written to outputdir, by default the output directory of the transformer next
+to file.
+'''
+
+
+def split_transform(file: str, transformername: str, rows: int = None, size: int = None, workers: int = None,
+                    bytesmode: bool = False, outputdir: str = None) -> List[str]:
+    begin = time.time()
+    boundaries = find_split_boundaries(file, rows, size)
+
+    if outputdir is None:
+        outputdir = (os.path.dirname(file) or ".") + "/" + transformengine.dialects[transformername][1]
+
+    if not os.path.exists(outputdir):
+        os.mkdir(outputdir)
+
+    with open(file, "rb") as inputfile:
+        header = inputfile.read(boundaries[0])
+
+    dstfile = outputdir + "/" + file.split("/")[-1]
+    tasks = []
+
+    for part in range(len(boundaries) - 1):
+        # The first part reads the header from the file itself
+        (start, partheader) = (0, None) if part == 0 else (boundaries[part], header)
+        tasks.append((file, outputdir, transformername, bytesmode, start, boundaries[part + 1],
+                      transformengine.part_filename(dstfile, part), partheader))
+
+    scheduler = transformscheduler.Scheduler(_transformpart, workers or transformengine.default_workers())
+    results = scheduler.run(tasks, [task[5] - task[4] for task in tasks])
+
+    print("Split and transformed %s in %d parts in %f seconds" % (file, len(results), time.time() - begin))
+
+    # The part numbers are zero padded, so sorting the names puts the parts in order
+    return sorted(result["dstfile"] for result in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', help="CSV file to split, its first record is the header")
+    parser.add_argument('--rows', type=int, default=None, help="Number of rows per part, not counting the header")
+    parser.add_argument('--size', type=int, default=None, help="Size of a part in MB, cut at the next record")
+    parser.add_argument('--outputdir', default=None, help="Directory for the parts, defaults to the one of the file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of threads writing the parts, or of processes transforming them")
+    parser.add_argument('--transform', choices=sorted(transformengine.dialects.keys()), default=None,
+                        help="Transform the parts with this transformer instead of copying them, into --outputdir "
+                             "or by default its output directory next to the file")
+    parser.add_argument('--bytes', action='store_true', help="Transform in bytes mode, see the transformers")
+
+    args = parser.parse_args()
+
+    if (args.rows is None) == (args.size is None):
+        parser.error("Give either --rows or --size")
+
+    if (args.rows is not None and args.rows < 1) or (args.size is not None and args.size < 1):
+        parser.error("--rows and --size have to be at least 1")
+
+    size = args.size * 1024 * 1024 if args.size is not None else None
+
+    if args.transform is not None:
+        split_transform(args.file, args.transform, args.rows, size, args.workers, args.bytes, args.outputdir)
+    else:
+        split_csv(args.file, args.outputdir, args.rows, size, args.workers)
@@ -0,0 +1,29 @@
+import monetdbrules
+import transformcache
+
+
+def write_input(directory) -> str:
+    path = str(directory / "t.csv")
+
+    with open(path, "w") as inputfile:
+        inputfile.write('"id","created","active"\n')
+
+        for i in range(100):
+            inputfile.write('"%d","%d/12/2016 20:08:51","%s"\n' % (i, i % 28 + 1, "true" if i % 2 else "false"))
+
+    return path
+
+
+def test_plans_share_one_cache_per_type(tmp_path):
+    path = write_input(tmp_path)
+
+    with open(path, "rb") as inputfile:
+        data = inputfile.read()
+
+    for i in range(5):
+        output = monetdbrules.columnplan(path)(data)
+
+    cached = [converter.name for converter in transformcache.converters]
+
+    assert sorted(cached) == sorted(set(cached))
+    assert output.splitlines()[1] == b'0,2016-12-1 20:08:51,0'
@@ -0,0 +1,76 @@
+import os
+
+import transformengine
+import transformmanifest
+
+
+def upper(line: str) -> str:
+    return line.upper()
+
+
+def reverse(line: str) -> str:
+    return line.rstrip("\n")[::-1] + "\n"
+
+
+def write_input(directory) -> str:
+    path = os.path.join(str(directory), "t.csv")
+
+    with open(path, "w") as inputfile:
+        inputfile.write("abc,1\ndef,2\n")
+
+    return path
+
+
+def read_output(directory) -> str:
+    with open(os.path.join(str(directory), "output", "t.csv")) as outputfile:
+        return outputfile.read()
+
+
+def test_rerun_in_same_mode_skips_file(tmp_path, capsys):
+    write_input(tmp_path)
+
+    transformengine.transformcsvfiles(str(tmp_path), "output", upper, workers=1, mode={"rules": "upper"})
+    transformengine.transformcsvfiles(str(tmp_path), "output", upper, workers=1, mode={"rules": "upper"})
+
+    assert "Skipping" in capsys.readouterr().out
+    assert read_output(tmp_path) == "ABC,1\nDEF,2\n"
+
+
+def test_rerun_in_other_mode_transforms_again(tmp_path, capsys):
+    write_input(tmp_path)
+
+    transformengine.transformcsvfiles(str(tmp_path), "output", upper, workers=1, mode={"rules": "upper"})
+    transformengine.transformcsvfiles(str(tmp_path), "output", reverse, workers=1, mode={"rules": "reverse"})
+
+    assert "Skipping" not in capsys.readouterr().out
+    assert read_output(tmp_path) == "1,cba\n2,fed\n"
+
+    manifest = transformmanifest.load_manifest(os.path.join(str(tmp_path), "output"))
+    assert manifest["files"]["t.csv"]["mode"] == transformmanifest.mode_fingerprint({"rules": "reverse"})
+
+
+def test_interrupted_file_is_not_resumed_in_other_mode(tmp_path):
+    path = write_input(tmp_path)
+    stat = os.stat(path)
+    entry = transformmanifest.new_entry(stat, None, [0, stat.st_size], False, transformmanifest.mode_fingerprint({}))
+
+    assert transformmanifest.can_resume(entry, stat, None, False, transformmanifest.mode_fingerprint({}))
+    assert not transformmanifest.can_resume(entry, stat, None, False,
+                                            transformmanifest.mode_fingerprint({"columns": True}))
+
+
+def load_statements(filepath: str, dstfile: str):
+    return ([dstfile], ["LOAD %s;" % os.path.basename(filepath)])
+
+
+def test_skipped_file_prints_its_load_statements_again(tmp_path, capsys):
+    write_input(tmp_path)
+
+    transformengine.transformcsvfiles(str(tmp_path), "output", upper, workers=1, finalize=load_statements)
+    assert "LOAD t.csv;" in capsys.readouterr().out
+
+    transformengine.transformcsvfiles(str(tmp_path), "output", upper, workers=1, finalize=load_statements)
+    output = capsys.readouterr().out
+
+    assert "Skipping" in output
+    assert "LOAD t.csv;" in output
@@ -0,0 +1,46 @@
+import pytest
+
+import monetdbrules
+import mysqlpostgresrules
+
+lines = [
+    # Dates, with and without the time zone, and bogus years before and after the conversion
+    '"20/12/2016 20:08:51 +00:00","20/12/2016 20:08:51","1/1/1899 00:00:00","3/4/9476 01:02:03"\n',
+    '"1899-12-30 00:00:00","9476-01-01 10:11:12","1899-12-30 00:00","2016-12-20 20:08:51"\n',
+    # Quoted booleans in any case, and as part of a text
+    '"true","FALSE","True","false ","say true","true"\n',
+    # Quoted integers, and numbers that are not a field of their own
+    '"12","007","-5","1.5",42,"12 apples"\n',
+    # Octals, at the start and the end of a line
+    '\\001,"a\\012b",\\7\n',
+    'text\\123\n',
+    # Empty strings, in the middle and at the end
+    '"",1,"","",x,""\n',
+    '1,""\n',
+    # Rules matching inside a field with "" escapes, run through the fallback chain
+    '"say ""true"" now","""12""",""false"",3\n',
+    '"a ""20/12/2016 20:08:51"" b","x""1899-12-30 00:00:00"""\n',
+    '"""1899-12-30 00:00:00""","""","true"\n',
+    # Windows line endings and a last line without one
+    '"true","12","20/12/2016 20:08:51"\r\n',
+    '"false","","13"',
+    # Nothing to convert
+    'plain,line,without,quotes\n',
+    '\n',
+]
+
+
+@pytest.mark.parametrize("rules", [monetdbrules, mysqlpostgresrules])
+@pytest.mark.parametrize("line", lines)
+def test_compiled_rules_equal_chain(rules, line):
+    assert rules.transformline(line) == rules.transformline_chain(line)
+    assert rules.transformline_timed(line) == rules.transformline_chain(line)
+
+
+@pytest.mark.parametrize("rules", [monetdbrules, mysqlpostgresrules])
+def test_chunk_equals_chain_per_line(rules):
+    text = "".join(lines)
+    expected = "".join(rules.transformline_chain(line) for line in text.replace("\r\n", "\n").splitlines(True))
+
+    assert rules.transformchunk(text.encode("UTF-8")).decode("UTF-8") == expected
+    assert rules.transformchunk(("é" + text).encode("UTF-8")).decode("UTF-8") == "é" + expected
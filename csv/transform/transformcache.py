@@ -0,0 +1,83 @@
+import functools
+from typing import Callable, Dict, List
+
+defaultcachesize = 65536
+
+# The cached converters called in this process, their caches hold the hit and miss counts
+converters = []
+
+'''
+Memoization of field conversions. Date and boolean columns repeat the same values over and over,
+so a converter wrapped in CachedConverter only converts (and matches) a value the first time it
+sees it, a repeated value costs a dict lookup. Every cache is an LRU of at most maxsize values
+per process, which caps the memory it takes.
+
+The hits and misses are counted by the caches themselves. A worker hands the counts since the
+previous take_cachestats to the parent with the result of every task, like the rule stats of
+transformmetrics.
+'''
+
+
+class CachedConverter:
+    '''
+    Calls convert on a field through an LRU cache. With a pattern, a field not fully matching it is
+    returned as it is, and the match is cached as well. Picklable as long as convert is, the cache
+    itself is created in the process it is called in.
+    '''
+
+    def __init__(self, name: str, convert: Callable[[str], str], pattern=None, maxsize: int = defaultcachesize):
+        self.name = name
+        self.convert = convert
+        self.pattern = pattern
+        self.maxsize = maxsize
+        self.cached = None
+        # Hits and misses already taken by take_cachestats
+        self.taken = (0, 0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["cached"] = None
+        state["taken"] = (0, 0)
+
+        return state
+
+    def __call__(self, text: str) -> str:
+        if self.cached is None:
+            self.cached = functools.lru_cache(maxsize=self.maxsize)(self.convertvalue)
+            converters.append(self)
+
+        return self.cached(text)
+
+    def convertvalue(self, text: str) -> str:
+        if self.pattern is not None and not self.pattern.fullmatch(text):
+            return text
+
+        return self.convert(text)
+
+
+def take_cachestats() -> Dict[str, List]:
+    stats = {}
+
+    for converter in converters:
+        info = converter.cached.cache_info()
+        (hits, misses) = converter.taken
+        converter.taken = (info.hits, info.misses)
+
+        merged = stats.setdefault(converter.name, [0, 0, 0])
+        merged[0] += info.hits - hits
+        merged[1] += info.misses - misses
+        merged[2] = max(merged[2], info.currsize)
+
+    return stats
+
+
+def merge_cachestats(total: Dict[str, List], stats: Dict[str, List]):
+    for (name, (hits, misses, size)) in stats.items():
+        merged = total.setdefault(name, [0, 0, 0])
+        merged[0] += hits
+        merged[1] += misses
+        merged[2] = max(merged[2], size)
+
+
+def hitrate(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
@@ -0,0 +1,234 @@
+import re
+from typing import Callable, Dict, List
+
+from transformcache import CachedConverter
+from transformrules import datepattern, integerpattern
+from transformengine import iterchunks, splitlines
+
+defaultsamplerows = 1000
+
+'''
+Column plan mode. Instead of running every rule over every byte of every line, the first rows of
+a file are tokenized to infer the type of each column, and only the conversion of that type is
+applied to the fields of that column. Text columns are copied through untouched.
+
+A plan is compiled into one regex matching a complete record, with a group per column, so a
+record is tokenized in one match and only the typed fields are looked at from Python. Records
+that do not fit the plan (another number of columns, malformed quoting) are transformed with the
+dialect's transformline instead, per line.
+
+Unlike the line rules, a value is only converted when it is the complete field of a column of
+that type: a "true" or "123" inside a text column stays as it is.
+'''
+
+quotedfield = r'"[^"]*(?:""[^"]*)*"'
+unquotedfield = r'[^,"\r\n]*'
+fieldregex = re.compile(r'(%s|%s)(,|\n|$)' % (quotedfield, unquotedfield))
+
+# In order of preference: a column gets the first type all its sampled values match
+typepatterns = [
+    ("date", re.compile(datepattern)),
+    ("bogusdate", re.compile(r'"\d+-\d+-\d+ \d+:\d+:\d+"')),
+    # Exported and ISO dates mixed in one column
+    ("timestamp", re.compile(r'%s|"\d+-\d+-\d+ \d+:\d+:\d+"' % datepattern)),
+    ("boolean", re.compile(r'"(?i:true|false)"')),
+    ("integer", re.compile(integerpattern)),
+    ("decimal", re.compile(r'-?\d+(?:\.\d+)?')),
+]
+
+emptyvalues = ('', '""')
+
+# Types of low cardinality columns, their values are matched and converted once through a cache
+cachedtypes = ("date", "bogusdate", "timestamp", "boolean")
+
+
+'''
+Wraps the converters of cachedtypes in a CachedConverter, which matches the pattern of the type as
+well. A dialect does this once at module level, like its other cached converters, so all the plans
+of a process share one cache per type instead of every plan adding caches of its own.
+'''
+
+
+def cached_converters(converters: Dict[str, Callable[[str], str]]) -> Dict[str, Callable[[str], str]]:
+    patterns = dict(typepatterns)
+
+    return {columntype: CachedConverter(columntype, convert, patterns.get(columntype))
+            if columntype in cachedtypes else convert for (columntype, convert) in converters.items()}
+
+
+def tokenize(record: str) -> List[str]:
+    fields = []
+    position = 0
+
+    while True:
+        match = fieldregex.match(record, position)
+
+        if match is None:
+            return None
+
+        fields.append(match.group(1))
+
+        if match.group(2) != ",":
+            return fields
+
+        position = match.end()
+
+
+def iterrecords(text: str):
+    record = []
+    quotes = 0
+
+    for line in splitlines(text):
+        record.append(line)
+        quotes += line.count('"')
+
+        if quotes % 2 == 0:
+            yield "".join(record)
+            record = []
+            quotes = 0
+
+    if record:
+        yield "".join(record)
+
+
+def infer_types(records: List[List[str]]) -> List[str]:
+    columns = max(len(fields) for fields in records) if records else 0
+    types = []
+
+    for column in range(columns):
+        values = [fields[column] for fields in records if column < len(fields) and fields[column] not in emptyvalues]
+        columntype = "text"
+
+        if values:
+            for (name, pattern) in typepatterns:
+                if all(pattern.fullmatch(value) for value in values):
+                    columntype = name
+                    break
+
+        types.append(columntype)
+
+    return types
+
+
+def sample_records(file: str, samplerows: int, header: bool = True) -> List[List[str]]:
+    records = []
+
+    with open(file, "rb") as inputfile:
+        for (offset, chunk) in iterchunks(inputfile, records=True):
+            for record in iterrecords(chunk.decode("UTF-8", "replace")):
+                if header:
+                    header = False
+                    continue
+
+                fields = tokenize(record)
+
+                if fields is not None:
+                    records.append(fields)
+
+                if len(records) >= samplerows:
+                    return records
+
+    return records
+
+
+class ColumnPlan:
+    '''
+    converters maps a column type to the function converting a field of that type, types without
+    a converter are copied through. A field that does not match the type of its column is copied
+    through as well. Empty fields ("") become nullvalue when given, and escape is run over the
+    result of a record containing a backslash. A converter that is a CachedConverter, see
+    cached_converters, does the match as well.
+    '''
+
+    def __init__(self, types: List[str], converters: Dict[str, Callable[[str], str]],
+                 fallback: Callable[[str], str], nullvalue: str = None, escape: Callable[[str], str] = None):
+        self.types = types
+        self.fallback = fallback
+        self.nullvalue = nullvalue
+        self.escape = escape
+
+        self.typedcolumns = []
+        self.allcolumns = []
+
+        for (column, columntype) in enumerate(types):
+            convert = converters.get(columntype)
+            pattern = None if isinstance(convert, CachedConverter) else dict(typepatterns).get(columntype)
+
+            self.allcolumns.append((column + 1, convert, pattern))
+
+            if convert is not None:
+                self.typedcolumns.append((column + 1, convert, pattern))
+
+        field = "(%s|%s)" % (quotedfield, unquotedfield)
+        self.regex = re.compile(",".join([field] * len(types)) + r"\n?")
+
+    def describe(self) -> str:
+        return ", ".join(self.types)
+
+    def transformrecord(self, record: str) -> str:
+        match = self.regex.fullmatch(record)
+
+        if match is None:
+            return "".join([self.fallback(line) for line in splitlines(record)])
+
+        if self.nullvalue is not None and '""' in record:
+            columns = self.allcolumns
+        else:
+            columns = self.typedcolumns
+
+        result = []
+        position = 0
+
+        for (column, convert, pattern) in columns:
+            value = match.group(column)
+
+            # Like the emptystrings rule, which needs the comma in front of the field, the first
+            # column is never made NULL
+            if value == '""' and self.nullvalue is not None and column > 1:
+                replacement = self.nullvalue
+            elif convert is not None and (pattern is None or pattern.fullmatch(value)):
+                replacement = convert(value)
+            else:
+                continue
+
+            (start, end) = match.span(column)
+            result.append(record[position:start])
+            result.append(replacement)
+            position = end
+
+        if position:
+            result.append(record[position:])
+            record = "".join(result)
+
+        if self.escape is not None and "\\" in record:
+            record = self.escape(record)
+
+        return record
+
+    def transformchunk(self, chunk: bytes, validate: bool = True) -> bytes:
+        errors = "strict" if validate else "surrogateescape"
+        text = chunk.decode("UTF-8", errors)
+
+        return "".join([self.transformrecord(record) for record in iterrecords(text)]).encode("UTF-8", errors)
+
+
+def infer_file_types(file: str, samplerows: int = defaultsamplerows) -> List[str]:
+    types = infer_types(sample_records(file, samplerows))
+    print("Column plan for %s: %s" % (file, ", ".join(types)))
+
+    return types
+
+
+'''
+Returns the plan of a file. The types are inferred from the file when not given, a split file
+gets them from transformengine.transformcsvfiles instead, inferred once for all its parts.
+'''
+
+
+def plan_file(file: str, converters: Dict[str, Callable[[str], str]], fallback: Callable[[str], str],
+              nullvalue: str = None, escape: Callable[[str], str] = None,
+              samplerows: int = defaultsamplerows, types: List[str] = None) -> ColumnPlan:
+    if types is None:
+        types = infer_file_types(file, samplerows)
+
+    return ColumnPlan(types, converters, fallback, nullvalue, escape)
@@ -1,192 +1,141 @@
-import sys
 import os
-import re
-import threading
-import time
-import itertools
-
-outputbuffersize_lines = 1000
-inputchunck = 1000
-maxthreads = 8
-globaltotallines = 0
-globalrunningtime = 0.0
-lock = threading.Condition()
-
-onlyfiles = []
-
-'''
-Changes occurrences of the format "20/12/2016 20:08:51 +00:00" or "20/12/2016 20:08:51" to
-"2016-12-20 20:08:51"
-'''
-
-
-def transformdates(line: str):
-    return re.sub(r'"(?P<day>\d+)/(?P<month>\d+)/(?P<year>\d+) (?P<time>\d+:\d+:\d+)( \+\d+:\d+)?"',
-                  "\g<year>-\g<month>-\g<day> \g<time>", line)
-
-
-def transformbogusdates(line: str):
-    result = line
-    result = re.sub(r'"1899-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"1970-\g<rest>"', result)
-    result = re.sub(r'"9476-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"2018-\g<rest>"', result)
-    return result
-
-
-def transformemptystrings(line: str) -> str:
-    return re.sub(r',(""(?=,)|""$)', ",NULL", line)
-
-
-def transformbooleans(line: str) -> str:
-    line = re.sub(r'"true"', "1", line, flags=re.I)
-    return re.sub(r'"false"', "0", line, flags=re.I)
+import argparse
+import functools
 
+import transformengine
+import transformcolumns
+from monetdbrules import *
 
-def transformintegers(line: str) -> str:
-    result = line
-    result = re.sub(r'"(?P<int>\d+)"', "\g<int>", result)
-    return result
-
-
-def escapeoctals(line: str) -> str:
-    result = line
-    result = re.sub(r'\\(?P<digit>\d+)', r'\\\\\g<digit>', result)
-    return result
-
-
-def transformline(line: str) -> str:
-    result = line
-
-    result = transformdates(result)
-    result = transformbogusdates(result)
-    result = transformbooleans(result)
-    result = transformintegers(result)
-    result = escapeoctals(result)
-
-    return result
+onlyfiles = []
 
 
 def transformcsv(file: str, outputdir: str) -> int:
-    global globaltotallines
-    global globalrunningtime
-
-    start = time.time()
-    filename = file.split("/")[-1]
-    dstfile = outputdir + "/" + filename
-
-    if os.path.exists(dstfile):
-        os.remove(dstfile)
-
-    totallines = 0
-
-    ## Per line
-    with open(file, "r", encoding="UTF-8") as inputfile:
-        with open(dstfile, "w", encoding="UTF-8") as outputfile:
-            outputbuffer = []
-            for inputline in inputfile:
-                outputbuffer.append(transformline(inputline))
-
-                if len(outputbuffer) > outputbuffersize_lines:
-                    outputfile.writelines(outputbuffer)
-                    totallines += len(outputbuffer)
-                    outputbuffer = []
-
-            outputfile.writelines(outputbuffer)
-            totallines += len(outputbuffer)
-
-    ## Test with islice. Not faster
-    ##
-    ## Islice, Chunks n = 1000
-    ## We're done. Took 2864.780461 seconds in total for 32454885 lines. Avg 11328.925703 lines/sec.
-    ## Total thread running time: 7140.146623134613 sec. Avg: 4545.408759 lines/sec
-    ##
-    ## With reading per line:
-    ## We're done. Took 1595.845968 seconds in total for 32454885 lines. Avg 20337.103740 lines/sec.
-    ## Total thread running time: 4849.047528266907 sec. Avg: 6693.043285 lines/sec
-
-    # with open(file, "r") as inputfile:
-    #     with open(dstfile, "a") as outputfile:
-    #         outputbuffer = []
-    #
-    #         while True:
-    #             inputlines = list(itertools.islice(inputfile, inputchunck))
-    #             totallines += len(inputlines)
-    #
-    #             if not inputlines:
-    #                 break
-    #
-    #
-    #             for inputline in inputlines:
-    #                 outputbuffer.append(transformline(inputline))
-    #
-    #                 if len(outputbuffer) > outputbuffersize_lines:
-    #                     outputfile.writelines(outputbuffer)
-    #                     outputbuffer = []
-    #
-    #         outputfile.writelines(outputbuffer)
-
-    end = time.time()
-
-    passed = end - start
-    print("Done %s (%d lines) in %f seconds. %f lines/sec" % (file, totallines, passed, (float(totallines) / passed)))
-
-    lock.acquire()
-    globaltotallines += totallines
-    globalrunningtime += passed
-    lock.release()
-
-    return totallines
-
-
-def transformcsvfiles(directory: str):
-    global globaltotallines
-    global globalrunningtime
-
-    start = time.time()
-    if directory[-1] == "/":
-        directory = directory[0:-1]
-
-    outputdir = directory + "/output_monetdb"
-
-    if not os.path.exists(outputdir):
-        os.mkdir(outputdir)
-
-    files = [f for f in os.listdir(directory) if os.path.isfile(directory + "/" + f) and f.endswith(".csv") and (len(onlyfiles) == 0 or f in onlyfiles)]
-
-    files_w_length = []
-
-    for f in files:
-        fpath = directory + "/" + f
-        st_size = os.stat(fpath).st_size
-
-        files_w_length.append({
-            "filepath": fpath,
-            "size": st_size
-        })
-
-    sorted_files = sorted(files_w_length, key=lambda k: k['size'])
-
-    while True:
-
-        while threading.active_count() < maxthreads and len(sorted_files) > 0:
-            t = threading.Thread(target=transformcsv, args=[sorted_files.pop()['filepath'], outputdir])
-            t.start()
-
-        if threading.active_count() == 1 and len(sorted_files) == 0:
-            break
-
-    end = time.time()
-    passed = end - start
-
-    print("We're done. Took %f seconds in total for %d lines. Avg %f lines/sec. Total thread running time: "
-          "%s sec. Avg: %f lines/sec" %
-          (passed, globaltotallines, float(globaltotallines) / passed, globalrunningtime,
-           float(globaltotallines) / globalrunningtime))
+    return transformengine.transformcsv(file, outputdir, transformline)["lines"]
+
+
+def transformcsvfiles(directory: str, workers: int = None, rangesize: int = transformengine.defaultrangesize,
+                      keepparts: bool = False, chain: bool = False, bytesmode: bool = False, validate: bool = True,
+                      resume: bool = True, columns: bool = False,
+                      samplerows: int = transformcolumns.defaultsamplerows, rulestats: bool = False,
+                      progressinterval: float = None, metricsfile: str = None, binary: bool = False,
+                      monetdbtypes: List[str] = None, pipelined: bool = True):
+    if rulestats:
+        linetransform = transformline_chain_timed if chain else transformline_timed
+    else:
+        linetransform = transformline_chain if chain else transformline
+
+    chunktransform = functools.partial(transformchunk_timed if rulestats else transformchunk,
+                                       validate=validate) if bytesmode else None
+    chunkfactory = functools.partial(columnplan, samplerows=samplerows, validate=validate,
+                                     timed=rulestats) if columns else None
+    # The column types are inferred once per file, not in every part
+    fileplanner = functools.partial(columntypes, samplerows=samplerows) if columns else None
+
+    # A file transformed in another mode is transformed again instead of skipped or resumed
+    mode = {"dialect": "monetdb", "chain": chain, "bytes": bytesmode, "validate": validate, "columns": columns,
+            "rulestats": rulestats, "binary": binary, "monetdbtypes": monetdbtypes,
+            "samplerows": samplerows if columns or binary else None}
+
+    if binary:
+        # Needs numpy, which plain CSV runs do without
+        import monetdbbinary
+
+        chunkfactory = functools.partial(binarywriter, types=monetdbtypes, samplerows=samplerows, validate=validate)
+        # Types not given are inferred once per file, not in every part
+        fileplanner = functools.partial(binaryplan, samplerows=samplerows) if monetdbtypes is None else None
+
+        return transformengine.transformcsvfiles(directory, "output_monetdb_binary", linetransform, workers,
+                                                 onlyfiles, rangesize, False, None, resume, chunkfactory,
+                                                 progressinterval, metricsfile, ".monetdb",
+                                                 functools.partial(monetdbbinary.finalize, types=monetdbtypes),
+                                                 pipelined=pipelined, mode=mode, fileplanner=fileplanner)
+
+    return transformengine.transformcsvfiles(directory, "output_monetdb", linetransform, workers, onlyfiles,
+                                             rangesize, keepparts, chunktransform, resume, chunkfactory,
+                                             progressinterval, metricsfile, pipelined=pipelined, mode=mode,
+                                             fileplanner=fileplanner)
+
+
+def transformstream(inputpath: str, outputpath: str = "-", validate: bool = True, compresslevel: int = None,
+                    pipelined: bool = True):
+    return transformengine.transformstream(inputpath, outputpath,
+                                           functools.partial(transformchunk, validate=validate), compresslevel,
+                                           pipelined)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Call program with directory as parameter:")
-        print("{} directory".format(sys.argv[0]))
-        exit(1)
-
-    transformcsvfiles(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help="Directory with the CSV files to transform. A single (.gz/.xz) file or - "
+                                          "for stdin is transformed as a stream to --output")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes. Defaults to the number of cores")
+    parser.add_argument('--rangesize', type=int, default=transformengine.defaultrangesize // (1024 * 1024),
+                        help="Files larger than this many MB are cut in ranges that are transformed in parallel. "
+                             "0 disables splitting")
+    parser.add_argument('--keepparts', action='store_true',
+                        help="Keep the numbered part files of split files instead of stitching them together")
+    parser.add_argument('--chain', action='store_true',
+                        help="Use the chain of re.sub calls instead of the compiled rules, for comparison")
+    parser.add_argument('--bytes', action='store_true',
+                        help="Memory map the input and transform it as bytes in large chunks instead of per line")
+    parser.add_argument('--novalidate', action='store_true',
+                        help="With --bytes or a stream, pass invalid UTF-8 through instead of failing on it")
+    parser.add_argument('--columns', action='store_true',
+                        help="Infer the type of every column from the first rows and only convert typed columns, "
+                             "text columns are copied through untouched")
+    parser.add_argument('--samplerows', type=int, default=transformcolumns.defaultsamplerows,
+                        help="Number of rows sampled per file to infer the column types with --columns")
+    parser.add_argument('--restart', action='store_true',
+                        help="Transform all files from scratch instead of skipping unchanged files and resuming "
+                             "interrupted ones from the manifest in the output directory")
+    parser.add_argument('--rulestats', action='store_true',
+                        help="Count the calls and changes of every rule and time them, reported at the end")
+    parser.add_argument('--progress', type=float, default=10,
+                        help="Report the progress and ETA of the files in progress every this many seconds. "
+                             "0 disables")
+    parser.add_argument('--metrics', default=None,
+                        help="Write a metrics report of the run to this file, as CSV when it ends with .csv and "
+                             "as JSON otherwise")
+    parser.add_argument('--binary', action='store_true',
+                        help="Write one little-endian binary file per column to output_monetdb_binary/ instead of "
+                             "CSV, load them with the printed COPY LITTLE ENDIAN BINARY INTO statements")
+    parser.add_argument('--monetdbtypes', default=None,
+                        help="Comma separated MonetDB types of the columns for --binary, for example "
+                             "bigint,varchar,timestamp,boolean,decimal(18,2). Inferred per file when not given")
+    parser.add_argument('--sync', action='store_true',
+                        help="Read, transform and write one after the other instead of in a pipeline of threads, "
+                             "for comparison")
+    parser.add_argument('--output', default="-",
+                        help="Output of a stream: - for stdout (default) or a file, compressed when it ends with "
+                             ".gz or .xz")
+    parser.add_argument('--compresslevel', type=int, default=None, help="Compression level of a compressed --output")
+
+    args = parser.parse_args()
+
+    if args.monetdbtypes and not args.binary:
+        parser.error("--monetdbtypes requires --binary")
+
+    monetdbtypes = None
+
+    if args.monetdbtypes:
+        import monetdbbinary
+
+        monetdbtypes = monetdbbinary.parse_types(args.monetdbtypes)
+
+    if args.binary and args.keepparts:
+        parser.error("--binary can not be combined with --keepparts")
+
+    if args.directory == "-" or os.path.isfile(args.directory):
+        for (option, given) in (("--columns", args.columns), ("--chain", args.chain), ("--rulestats", args.rulestats)):
+            if given:
+                parser.error("%s can not be used for a stream" % option)
+
+        if args.binary:
+            parser.error("--binary needs a directory, it writes a file per column")
+
+        transformstream(args.directory, args.output, not args.novalidate, args.compresslevel, not args.sync)
+    else:
+        transformcsvfiles(args.directory, args.workers, args.rangesize * 1024 * 1024, args.keepparts, args.chain,
+                          args.bytes, not args.novalidate, not args.restart, args.columns, args.samplerows,
+                          args.rulestats, args.progress, args.metrics, args.binary, monetdbtypes,
+                          not args.sync)
@@ -1,181 +1,138 @@
-import sys
 import os
-import re
-import threading
-import time
-import itertools
-
-outputbuffersize_lines = 1000
-inputchunck = 1000
-maxthreads = 8
-globaltotallines = 0
-globalrunningtime = 0.0
-lock = threading.Condition()
+import argparse
+import functools
 
-onlyfiles = []
-
-'''
-Changes occurrences of the format "20/12/2016 20:08:51 +00:00" or "20/12/2016 20:08:51" to
-"2016-12-20 20:08:51"
-'''
-
-
-def transformdates(line: str):
-    return re.sub(r'"(?P<day>\d+)/(?P<month>\d+)/(?P<year>\d+) (?P<time>\d+:\d+:\d+)( \+\d+:\d+)?"',
-                  "\"\g<year>-\g<month>-\g<day> \g<time>\"", line)
-
-def transformbogusdates(line: str):
-    result = line
-    result = re.sub(r'"1899-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"1970-\g<rest>"', result)
-    result = re.sub(r'"9476-(?P<rest>\d+-\d+ \d+:\d+:\d+)"', '"2018-\g<rest>"', result)
-    return result
-
-
-def transformemptystrings(line: str) -> str:
-    return re.sub(r',(""(?=,)|""$)', ",NULL", line)
-
-
-def transformbooleans(line: str) -> str:
-    line = re.sub(r'"true"', "1", line, flags=re.I)
-    return re.sub(r'"false"', "0", line, flags=re.I)
-
-def transformline(line: str) -> str:
-    result = line
-
-    result = transformdates(result)
-    result = transformbogusdates(result)
-    result = transformemptystrings(result)
-    result = transformbooleans(result)
+import pgcopy
+import transformengine
+import transformcolumns
+from mysqlpostgresrules import *
 
-    return result
+onlyfiles = []
 
 
 def transformcsv(file: str, outputdir: str) -> int:
-    global globaltotallines
-    global globalrunningtime
-
-    start = time.time()
-    filename = file.split("/")[-1]
-    dstfile = outputdir + "/" + filename
-
-    if os.path.exists(dstfile):
-        os.remove(dstfile)
-
-    totallines = 0
-
-    ## Per line
-    with open(file, "r", encoding="UTF-8") as inputfile:
-        with open(dstfile, "a", encoding="UTF-8") as outputfile:
-            outputbuffer = []
-            for inputline in inputfile:
-                outputbuffer.append(transformline(inputline))
-
-                if len(outputbuffer) > outputbuffersize_lines:
-                    outputfile.writelines(outputbuffer)
-                    totallines += len(outputbuffer)
-                    outputbuffer = []
-
-            outputfile.writelines(outputbuffer)
-            totallines += len(outputbuffer)
-
-    ## Test with islice. Not faster
-    ##
-    ## Islice, Chunks n = 1000
-    ## We're done. Took 2864.780461 seconds in total for 32454885 lines. Avg 11328.925703 lines/sec.
-    ## Total thread running time: 7140.146623134613 sec. Avg: 4545.408759 lines/sec
-    ##
-    ## With reading per line:
-    ## We're done. Took 1595.845968 seconds in total for 32454885 lines. Avg 20337.103740 lines/sec.
-    ## Total thread running time: 4849.047528266907 sec. Avg: 6693.043285 lines/sec
-
-
-    # with open(file, "r") as inputfile:
-    #     with open(dstfile, "a") as outputfile:
-    #         outputbuffer = []
-    #
-    #         while True:
-    #             inputlines = list(itertools.islice(inputfile, inputchunck))
-    #             totallines += len(inputlines)
-    #
-    #             if not inputlines:
-    #                 break
-    #
-    #
-    #             for inputline in inputlines:
-    #                 outputbuffer.append(transformline(inputline))
-    #
-    #                 if len(outputbuffer) > outputbuffersize_lines:
-    #                     outputfile.writelines(outputbuffer)
-    #                     outputbuffer = []
-    #
-    #         outputfile.writelines(outputbuffer)
-
-    end = time.time()
-
-    passed = end - start
-    print("Done %s (%d lines) in %f seconds. %f lines/sec" % (file, totallines, passed, (float(totallines) / passed)))
-
-    lock.acquire()
-    globaltotallines += totallines
-    globalrunningtime += passed
-    lock.release()
-
-    return totallines
-
-
-def transformcsvfiles(directory: str):
-    global globaltotallines
-    global globalrunningtime
-
-    start = time.time()
-    if directory[-1] == "/":
-        directory = directory[0:-1]
-
-    outputdir = directory + "/output_mysql_postgres"
-
-    if not os.path.exists(outputdir):
-        os.mkdir(outputdir)
-
-    files = [ f for f in os.listdir(directory) if os.path.isfile(directory + "/" + f) and f.endswith(".csv") and (len(onlyfiles) == 0 or f in onlyfiles)]
-
-    files_w_length = []
-
-    for f in files:
-        fpath = directory + "/" + f
-        st_size = os.stat(fpath).st_size
-
-        files_w_length.append({
-            "filepath": fpath,
-            "size": st_size
-        })
-
-    sorted_files = sorted(files_w_length, key=lambda k: k['size'])
-
-
-    while True:
-
-        while threading.active_count() < maxthreads and len(sorted_files) > 0:
-            t = threading.Thread(target=transformcsv, args=[sorted_files.pop()['filepath'], outputdir])
-            t.start()
-
-        if threading.active_count() == 1 and len(sorted_files) == 0:
-            break
-
-    end = time.time()
-    passed = end - start
-
-    print("We're done. Took %f seconds in total for %d lines. Avg %f lines/sec. Total thread running time: "
-          "%s sec. Avg: %f lines/sec" %
-          (passed, globaltotallines, float(globaltotallines) / passed, globalrunningtime,
-           float(globaltotallines) / globalrunningtime))
-
-
+    return transformengine.transformcsv(file, outputdir, transformline)["lines"]
+
+
+def transformcsvfiles(directory: str, workers: int = None, rangesize: int = transformengine.defaultrangesize,
+                      keepparts: bool = False, chain: bool = False, bytesmode: bool = False, validate: bool = True,
+                      resume: bool = True, columns: bool = False,
+                      samplerows: int = transformcolumns.defaultsamplerows, rulestats: bool = False,
+                      progressinterval: float = None, metricsfile: str = None, pgcopyoutput: bool = False,
+                      pgtypes: List[str] = None, pipelined: bool = True):
+    if rulestats:
+        linetransform = transformline_chain_timed if chain else transformline_timed
+    else:
+        linetransform = transformline_chain if chain else transformline
+
+    chunktransform = functools.partial(transformchunk_timed if rulestats else transformchunk,
+                                       validate=validate) if bytesmode else None
+    chunkfactory = functools.partial(columnplan, samplerows=samplerows, validate=validate,
+                                     timed=rulestats) if columns else None
+    # The column types are inferred once per file, not in every part
+    fileplanner = functools.partial(columntypes, samplerows=samplerows) if columns else None
+
+    # A file transformed in another mode is transformed again instead of skipped or resumed
+    mode = {"dialect": "mysql_postgres", "chain": chain, "bytes": bytesmode, "validate": validate,
+            "columns": columns, "rulestats": rulestats, "pgcopy": pgcopyoutput, "pgtypes": pgtypes,
+            "samplerows": samplerows if columns or pgcopyoutput else None}
+
+    if pgcopyoutput:
+        chunkfactory = functools.partial(pgcopywriter, types=pgtypes, samplerows=samplerows, validate=validate)
+        # Types not given are inferred once per file, not in every part
+        fileplanner = functools.partial(pgcopyplan, samplerows=samplerows) if pgtypes is None else None
+
+        return transformengine.transformcsvfiles(directory, "output_pgcopy", linetransform, workers, onlyfiles,
+                                                 rangesize, False, None, resume, chunkfactory,
+                                                 progressinterval, metricsfile, ".pgcopy", pipelined=pipelined,
+                                                 mode=mode, fileplanner=fileplanner)
+
+    return transformengine.transformcsvfiles(directory, "output_mysql_postgres", linetransform, workers, onlyfiles,
+                                             rangesize, keepparts, chunktransform, resume, chunkfactory,
+                                             progressinterval, metricsfile, pipelined=pipelined, mode=mode,
+                                             fileplanner=fileplanner)
+
+
+def transformstream(inputpath: str, outputpath: str = "-", validate: bool = True, compresslevel: int = None,
+                    pgtypes: List[str] = None, pipelined: bool = True):
+    if pgtypes is not None:
+        chunktransform = pgcopywriter(inputpath, pgtypes, validate=validate)
+    else:
+        chunktransform = functools.partial(transformchunk, validate=validate)
+
+    return transformengine.transformstream(inputpath, outputpath, chunktransform, compresslevel, pipelined)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Call program with directory as parameter:")
-        print("{} directory".format(sys.argv[0]))
-        exit(1)
-
-    transformcsvfiles(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help="Directory with the CSV files to transform. A single (.gz/.xz) file or - "
+                                          "for stdin is transformed as a stream to --output")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes. Defaults to the number of cores")
+    parser.add_argument('--rangesize', type=int, default=transformengine.defaultrangesize // (1024 * 1024),
+                        help="Files larger than this many MB are cut in ranges that are transformed in parallel. "
+                             "0 disables splitting")
+    parser.add_argument('--keepparts', action='store_true',
+                        help="Keep the numbered part files of split files instead of stitching them together")
+    parser.add_argument('--chain', action='store_true',
+                        help="Use the chain of re.sub calls instead of the compiled rules, for comparison")
+    parser.add_argument('--bytes', action='store_true',
+                        help="Memory map the input and transform it as bytes in large chunks instead of per line")
+    parser.add_argument('--novalidate', action='store_true',
+                        help="With --bytes or a stream, pass invalid UTF-8 through instead of failing on it")
+    parser.add_argument('--columns', action='store_true',
+                        help="Infer the type of every column from the first rows and only convert typed columns, "
+                             "text columns are copied through untouched")
+    parser.add_argument('--samplerows', type=int, default=transformcolumns.defaultsamplerows,
+                        help="Number of rows sampled per file to infer the column types with --columns")
+    parser.add_argument('--restart', action='store_true',
+                        help="Transform all files from scratch instead of skipping unchanged files and resuming "
+                             "interrupted ones from the manifest in the output directory")
+    parser.add_argument('--rulestats', action='store_true',
+                        help="Count the calls and changes of every rule and time them, reported at the end")
+    parser.add_argument('--progress', type=float, default=10,
+                        help="Report the progress and ETA of the files in progress every this many seconds. "
+                             "0 disables")
+    parser.add_argument('--metrics', default=None,
+                        help="Write a metrics report of the run to this file, as CSV when it ends with .csv and "
+                             "as JSON otherwise")
+    parser.add_argument('--pgcopy', action='store_true',
+                        help="Write PostgreSQL binary COPY files to output_pgcopy/ instead of CSV, load them with "
+                             "COPY ... WITH (FORMAT binary)")
+    parser.add_argument('--pgtypes', default=None,
+                        help="Comma separated Postgres types of the columns for --pgcopy, for example "
+                             "int8,text,timestamp,bool. Inferred per file when not given, required for a stream")
+    parser.add_argument('--sync', action='store_true',
+                        help="Read, transform and write one after the other instead of in a pipeline of threads, "
+                             "for comparison")
+    parser.add_argument('--output', default="-",
+                        help="Output of a stream: - for stdout (default) or a file, compressed when it ends with "
+                             ".gz or .xz")
+    parser.add_argument('--compresslevel', type=int, default=None, help="Compression level of a compressed --output")
+
+    args = parser.parse_args()
+
+    pgtypes = pgcopy.parse_types(args.pgtypes) if args.pgtypes else None
+
+    # Every part would get its own PGCOPY header and trailer, the parts together are no valid COPY input
+    if args.pgcopy and args.keepparts:
+        parser.error("--pgcopy can not be combined with --keepparts")
+
+    if args.pgtypes and not args.pgcopy:
+        parser.error("--pgtypes requires --pgcopy")
+
+    if args.directory == "-" or os.path.isfile(args.directory):
+        for (option, given) in (("--columns", args.columns), ("--chain", args.chain), ("--rulestats", args.rulestats)):
+            if given:
+                parser.error("%s can not be used for a stream" % option)
+
+        if args.pgcopy and pgtypes is None:
+            parser.error("--pgcopy of a stream requires --pgtypes")
+
+        transformstream(args.directory, args.output, not args.novalidate, args.compresslevel,
+                        pgtypes, not args.sync)
+    else:
+        transformcsvfiles(args.directory, args.workers, args.rangesize * 1024 * 1024, args.keepparts, args.chain,
+                          args.bytes, not args.novalidate, not args.restart, args.columns, args.samplerows,
+                          args.rulestats, args.progress, args.metrics, args.pgcopy, pgtypes,
+                          not args.sync)
@@ -0,0 +1,889 @@
+import os
+import sys
+import gzip
+import lzma
+import mmap
+import time
+import queue
+import threading
+import contextlib
+import shutil
+import multiprocessing
+from typing import Callable, Dict, List, Tuple
+
+import transformcache
+import transformmanifest
+import transformmetrics
+import transformscheduler
+
+scanblocksize = 4 * 1024 * 1024
+copybuffersize = 16 * 1024 * 1024
+defaultrangesize = 256 * 1024 * 1024
+byteschunksize = 8 * 1024 * 1024
+writebuffersize = 32 * 1024 * 1024
+maxrecordsize = 256 * 1024 * 1024
+# Number of chunks the pipeline reads ahead and outputs it queues for writing
+pipelinedepth = 4
+
+# Rules module and output directory of every dialect, for the tools that run a dialect by name
+dialects = {
+    "monetdb": ("monetdbrules", "output_monetdb"),
+    "mysql-postgres": ("mysqlpostgresrules", "output_mysql_postgres"),
+}
+
+'''
+Shared execution engine for the transformcsv-* scripts. The scripts only provide the dialect
+specific transformline function, this module takes care of reading, writing and running the
+files in a pool of worker processes (see transformscheduler.py). Processes instead of threads, as
+transformline is pure Python regex work that is serialized by the GIL when run in threads.
+
+transformcsvfiles can be called as a library function as well. Setting the cancelled event given
+to it stops the run after the running tasks, the next run resumes it.
+'''
+
+
+def list_csv_files(directory: str, onlyfiles: List[str] = None, extension: str = ".csv") -> List[Dict]:
+    files = [f for f in os.listdir(directory) if os.path.isfile(directory + "/" + f) and f.endswith(extension) and
+             (not onlyfiles or f in onlyfiles)]
+
+    files_w_length = []
+
+    for f in files:
+        fpath = directory + "/" + f
+        st_size = os.stat(fpath).st_size
+
+        files_w_length.append({
+            "filepath": fpath,
+            "size": st_size
+        })
+
+    # Largest first, so the biggest file does not end up being started last
+    return sorted(files_w_length, key=lambda k: k['size'], reverse=True)
+
+
+'''
+Returns the offsets at which file can be cut into ranges of roughly rangesize bytes. Every offset
+is the start of a record: it directly follows a newline and has an even number of quotes before
+it, so newlines inside quoted fields are never used as a cut. The first offset is 0, the last is
+the file size.
+'''
+
+
+def find_record_boundaries(file: str, rangesize: int) -> List[int]:
+    size = os.stat(file).st_size
+    boundaries = [0]
+    quotes = 0
+    blockpos = 0
+    target = rangesize
+
+    with open(file, "rb") as inputfile:
+        while target < size:
+            block = inputfile.read(scanblocksize)
+
+            if not block:
+                break
+
+            blockend = blockpos + len(block)
+            offset = 0
+
+            # Look for the first record boundary after target in this block. When the block runs
+            # out while searching, target is moved to the start of the next block to continue there
+            while target < blockend:
+                quotes += block.count(b'"', offset, target - blockpos)
+                offset = target - blockpos
+                boundary = None
+
+                while boundary is None:
+                    newline = block.find(b'\n', offset)
+
+                    if newline == -1:
+                        break
+
+                    quotes += block.count(b'"', offset, newline)
+                    offset = newline + 1
+
+                    if quotes % 2 == 0:
+                        boundary = blockpos + offset
+
+                if boundary is None:
+                    target = blockend
+                    break
+
+                if boundary < size:
+                    boundaries.append(boundary)
+
+                target = boundary + rangesize
+
+            quotes += block.count(b'"', offset)
+            blockpos = blockend
+
+    boundaries.append(size)
+
+    return boundaries
+
+
+def output_filename(outputdir: str, filepath: str, extension: str = None) -> str:
+    filename = filepath.split("/")[-1]
+
+    if extension is not None:
+        filename = os.path.splitext(filename)[0] + extension
+
+    return outputdir + "/" + filename
+
+
+def part_filename(dstfile: str, part: int) -> str:
+    (base, ext) = os.path.splitext(dstfile)
+
+    return "%s.part%04d%s" % (base, part, ext)
+
+
+'''
+Yields (offset, chunk) for the bytes [start, end) of inputfile (a file object or mmap) in chunks
+of whole lines, offset being the position right after the chunk. With end None it reads until
+the end of the input. Only the last chunk can end without a newline. With records, chunks are
+only cut at newlines outside quoted fields, start has to be the start of a record then.
+'''
+
+
+def iterchunks(inputfile, start: int = 0, end: int = None, records: bool = False):
+    if start:
+        inputfile.seek(start)
+
+    position = start
+    remainder = b""
+
+    while end is None or position < end:
+        block = inputfile.read(byteschunksize if end is None else min(byteschunksize, end - position))
+
+        if not block:
+            break
+
+        position += len(block)
+        block = remainder + block
+        newline = block.rfind(b"\n")
+
+        if records and newline != -1:
+            quotes = block.count(b'"', 0, newline)
+
+            # Move back to the last newline with an even number of quotes before it
+            while newline != -1 and quotes % 2:
+                previous = block.rfind(b"\n", 0, newline)
+                quotes -= block.count(b'"', previous + 1, newline)
+                newline = previous
+
+        if newline == -1:
+            if len(block) > maxrecordsize:
+                raise ValueError("No end of record found in %d bytes, unbalanced quotes?" % len(block))
+
+            remainder = block
+            continue
+
+        remainder = block[newline + 1:]
+
+        yield position - len(remainder), block[:newline + 1]
+
+    if remainder:
+        yield position, remainder
+
+
+'''
+Splits a decoded chunk in lines the way a text mode file object does: \r\n and \r are line
+endings as well, and every line but the last one ends with \n
+'''
+
+
+def splitlines(text: str) -> List[str]:
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    lines = text.split("\n")
+    result = [line + "\n" for line in lines[:-1]]
+
+    if lines[-1]:
+        result.append(lines[-1])
+
+    return result
+
+
+class WriteBuffer:
+    '''
+    Collects output in one preallocated buffer and writes it to the unbuffered file when full
+    '''
+
+    def __init__(self, file, size: int = writebuffersize):
+        self.file = file
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.position = 0
+
+    def write(self, data: bytes):
+        if self.position + len(data) > len(self.buffer):
+            self.flush()
+
+            if len(data) >= len(self.buffer):
+                self.file.write(data)
+                return
+
+        self.view[self.position:self.position + len(data)] = data
+        self.position += len(data)
+
+    def flush(self):
+        if self.position:
+            self.file.write(self.view[:self.position])
+            self.position = 0
+
+
+'''
+The read, transform and write stages of a range run in a pipeline: a thread reads the next chunks
+while the current one is transformed, and another thread writes the output of the previous ones.
+Reading a file object and writing release the GIL while they wait for the disk, so those overlap
+with the transform. Reading from the mmap of bytes mode does not: a chunk is copied out of the
+mapping with the GIL held, page faults included, and only the kernel's read-ahead of the mapping
+(MADV_SEQUENTIAL) runs alongside. There the pipeline mainly overlaps the writes. The transform
+itself stays in the worker process, the parallelism over cores comes from the worker pool.
+Bounded queues between the stages cap the memory a range takes to about 2 * pipelinedepth chunks.
+'''
+
+
+class PipelinedReader(threading.Thread):
+    '''
+    Iterates over chunks, an iterchunks generator, in a thread, at most depth chunks ahead of the
+    consumer. Errors of the reader are raised in the consumer.
+    '''
+
+    def __init__(self, chunks, depth: int = pipelinedepth):
+        super().__init__(daemon=True)
+        self.chunks = chunks
+        self.queue = queue.Queue(depth)
+        self.stopping = threading.Event()
+
+    def run(self):
+        try:
+            for item in self.chunks:
+                if not self.put(item):
+                    return
+
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item) -> bool:
+        # Gives up when the consumer stopped early, instead of blocking on the full queue forever
+        while not self.stopping.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def __iter__(self):
+        self.start()
+
+        while True:
+            item = self.queue.get()
+
+            if item is None:
+                return
+
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
+
+    def close(self):
+        self.stopping.set()
+
+        if self.is_alive():
+            self.join()
+
+
+class PipelinedWriter(threading.Thread):
+    '''
+    WriteBuffer run in a thread: write queues the data, at most depth writes ahead of the thread
+    writing them. flush returns once everything written before has been written to the file, so
+    the file position is that of the output so far. Errors of the writer are raised on the next
+    write or flush.
+    '''
+
+    flushmarker = object()
+    stopmarker = object()
+
+    def __init__(self, file, depth: int = pipelinedepth):
+        super().__init__(daemon=True)
+        self.buffer = WriteBuffer(file)
+        self.queue = queue.Queue(depth)
+        self.error = None
+        self.start()
+
+    def run(self):
+        while True:
+            data = self.queue.get()
+
+            try:
+                if data is self.stopmarker:
+                    return
+
+                if self.error is None:
+                    if data is self.flushmarker:
+                        self.buffer.flush()
+                    else:
+                        self.buffer.write(data)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, data: bytes):
+        self.check()
+
+        if len(data):
+            self.queue.put(data)
+
+    def flush(self):
+        self.queue.put(self.flushmarker)
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        if self.is_alive():
+            self.queue.put(self.stopmarker)
+            self.join()
+
+
+'''
+Transforms the bytes [start, end) of file into dstfile. By default per line with transformline.
+With transformchunk the input is memory mapped and transformed per chunk of whole lines (see
+RuleSet.transformchunk), so no str object is created per line and ASCII chunks are never decoded
+or encoded.
+
+With records the chunks passed to transformchunk consist of whole records instead of whole lines.
+
+A chunk transformer can frame its output (see pgcopy.PgCopyWriter): when it has begin and finish
+methods, begin(first) is written before the first chunk and finish(last) after the last one,
+first and last telling whether the range starts at the start and ends at the end of the file.
+Lines are counted in the input then, as the output does not consist of lines.
+
+With header, the header record of the file, it is transformed and written in front of the range
+(see splitcsv.split_transform), unless a previous run is resumed.
+
+With a checkpoint the progress is committed to the manifest every checkpointinterval bytes of
+input, and resume=(inputoffset, outputoffset) continues a previous run from such a checkpoint.
+
+With pipelined the chunks are read and written in threads next to the transform, see
+PipelinedReader. Without it the stages run one after the other, for comparison.
+'''
+
+
+def transformcsv(file: str, outputdir: str, transformline: Callable[[str], str], start: int = 0, end: int = None,
+                 dstfile: str = None, transformchunk: Callable[[bytes], bytes] = None,
+                 checkpoint: transformmanifest.Checkpoint = None, resume: Tuple[int, int] = None,
+                 records: bool = False, header: bytes = None, pipelined: bool = True) -> Dict:
+    begin = time.time()
+    framed = transformchunk is not None and hasattr(transformchunk, "begin")
+    filename = file.split("/")[-1]
+
+    if dstfile is None:
+        dstfile = outputdir + "/" + filename
+
+    position = start
+    hasher = None
+
+    if checkpoint is not None:
+        if resume is not None:
+            position = resume[0]
+            print("Resuming %s at byte %d" % (dstfile, position))
+
+        # The hash of the part covers the whole range, including what was done before the resume
+        hasher = transformmanifest.hash_range(file, start, position)
+
+    if resume is None and os.path.exists(dstfile):
+        os.remove(dstfile)
+
+    totallines = 0
+    first = position
+
+    with open(file, "rb") as inputfile:
+        with open(dstfile, "r+b" if resume is not None else "wb", buffering=0) as outputfile:
+            if resume is not None:
+                outputfile.truncate(resume[1])
+                outputfile.seek(resume[1])
+
+            output = PipelinedWriter(outputfile) if pipelined else WriteBuffer(outputfile)
+
+            try:
+                size = os.fstat(inputfile.fileno()).st_size
+
+                if end is None:
+                    end = size
+
+                # A file of zero bytes can not be mapped
+                if transformchunk is not None and size > 0:
+                    source = mmap.mmap(inputfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+                    if hasattr(source, "madvise"):
+                        source.madvise(mmap.MADV_SEQUENTIAL)
+                else:
+                    source = contextlib.nullcontext(inputfile)
+
+                with source as reader:
+                    committed = position
+
+                    if framed:
+                        output.write(transformchunk.begin(position == 0))
+
+                    if header is not None and resume is None:
+                        if transformchunk is not None:
+                            output.write(transformchunk(header))
+                        else:
+                            output.write("".join([transformline(line)
+                                                  for line in splitlines(header.decode("UTF-8"))]).encode("UTF-8"))
+
+                    chunks = iterchunks(reader, position, end, records)
+
+                    if pipelined:
+                        chunks = PipelinedReader(chunks)
+
+                    # The reader is stopped before the input is unmapped, also when the transform fails
+                    with contextlib.closing(chunks):
+                        for (offset, chunk) in chunks:
+                            if hasher is not None:
+                                hasher.update(chunk)
+
+                            try:
+                                if transformchunk is not None:
+                                    result = transformchunk(chunk)
+                                    counted = chunk if framed else result
+                                    chunklines = counted.count(b"\n")
+
+                                    if offset == end and counted and not counted.endswith(b"\n"):
+                                        chunklines += 1
+                                else:
+                                    lines = splitlines(chunk.decode("UTF-8"))
+                                    result = "".join([transformline(line) for line in lines]).encode("UTF-8")
+                                    chunklines = len(lines)
+                            except UnicodeDecodeError as e:
+                                raise ValueError("Invalid UTF-8 in %s at byte %d" %
+                                                 (file, offset - len(chunk) + e.start)) from None
+
+                            output.write(result)
+                            totallines += chunklines
+                            transformmetrics.report_progress(file, len(chunk), chunklines)
+
+                            if checkpoint is not None and offset - committed >= transformmanifest.checkpointinterval:
+                                output.flush()
+                                os.fsync(outputfile.fileno())
+                                checkpoint.commit(offset, outputfile.tell())
+                                committed = offset
+
+                    if framed:
+                        output.write(transformchunk.finish(end == size))
+
+                output.flush()
+
+                if checkpoint is not None:
+                    os.fsync(outputfile.fileno())
+                    checkpoint.commit(end, outputfile.tell(), hasher.hexdigest(), True)
+            finally:
+                if pipelined:
+                    output.close()
+
+    ## Test with islice. Not faster
+    ##
+    ## Islice, Chunks n = 1000
+    ## We're done. Took 2864.780461 seconds in total for 32454885 lines. Avg 11328.925703 lines/sec.
+    ## Total thread running time: 7140.146623134613 sec. Avg: 4545.408759 lines/sec
+    ##
+    ## With reading per line:
+    ## We're done. Took 1595.845968 seconds in total for 32454885 lines. Avg 20337.103740 lines/sec.
+    ## Total thread running time: 4849.047528266907 sec. Avg: 6693.043285 lines/sec
+
+    passed = time.time() - begin
+    print("Done %s (%d lines) in %f seconds. %f lines/sec" % (dstfile, totallines, passed,
+                                                               (float(totallines) / passed) if passed else 0.0))
+
+    return {
+        "filepath": file,
+        "dstfile": dstfile,
+        "start": start,
+        "end": end,
+        "bytes": end - first,
+        "lines": totallines,
+        "seconds": passed,
+        "worker": multiprocessing.current_process().name
+    }
+
+
+def _init_worker(lock, progressqueue):
+    transformmanifest.setlock(lock)
+    transformmetrics.setqueue(progressqueue)
+
+
+def _transformcsv_task(args) -> Dict:
+    (task, outputdir, transformline, transformchunk, chunkfactory, pipelined) = args
+    checkpoint = transformmanifest.Checkpoint(outputdir, task["filepath"].split("/")[-1], task["part"])
+
+    if chunkfactory is not None:
+        transformchunk = chunkfactory(task["filepath"], **task.get("plan", {}))
+
+    result = transformcsv(task["filepath"], outputdir, transformline, task["start"], task["end"], task["dstfile"],
+                          transformchunk, checkpoint, task["resume"], chunkfactory is not None, pipelined=pipelined)
+    result["part"] = task["part"]
+    result["parts"] = task["parts"]
+    result["rules"] = transformmetrics.take_rulestats()
+    result["caches"] = transformcache.take_cachestats()
+
+    return result
+
+
+'''
+Cuts every file larger than rangesize in record aligned byte ranges. Each range becomes its own
+task writing a numbered part file next to the final output file. Files that fit in one range
+are written directly.
+
+With a manifest, files that are unchanged since the run that wrote it are skipped, and the parts
+of an interrupted run of an unchanged file continue from their last checkpoint. Both only hold
+when the run was in the same mode, the fingerprint of the mode and options (see
+transformmanifest.mode_fingerprint). Returns the tasks and the files of which all parts are
+already done.
+'''
+
+
+def plan_tasks(files: List[Dict], outputdir: str, rangesize: int = None, manifest: Dict = None,
+               keepparts: bool = False, extension: str = None, mode: str = None) -> Tuple[List[Dict], List[Dict]]:
+    tasks = []
+    done = []
+
+    for f in files:
+        filename = f["filepath"].split("/")[-1]
+        dstfile = output_filename(outputdir, f["filepath"], extension)
+
+        if not rangesize or f["size"] <= rangesize:
+            boundaries = [0, f["size"]]
+        else:
+            boundaries = None
+
+        if manifest is not None:
+            stat = os.stat(f["filepath"])
+            entry = manifest["files"].get(filename)
+            parts = len(entry["boundaries"]) - 1 if entry is not None else 1
+            outputs = [part_filename(dstfile, p) for p in range(parts)] if keepparts and parts > 1 else [dstfile]
+
+            # Files written by a finalize function in place of the output file
+            if entry is not None and entry.get("outputs"):
+                outputs = entry["outputs"]
+
+            if transformmanifest.is_unchanged(entry, f["filepath"], stat, outputs, keepparts, mode):
+                print("Skipping %s, unchanged since the last run" % f["filepath"])
+
+                # The load statements of the skipped file still belong in the printed script
+                for statement in entry.get("statements") or []:
+                    print(statement)
+
+                continue
+
+            if not transformmanifest.can_resume(entry, stat, rangesize, keepparts, mode):
+                if boundaries is None:
+                    boundaries = find_record_boundaries(f["filepath"], rangesize)
+
+                entry = transformmanifest.new_entry(stat, rangesize, boundaries, keepparts, mode)
+                manifest["files"][filename] = entry
+
+            boundaries = entry["boundaries"]
+            partentries = entry["parts"]
+        else:
+            if boundaries is None:
+                boundaries = find_record_boundaries(f["filepath"], rangesize)
+
+            partentries = None
+
+        parts = len(boundaries) - 1
+        pending = 0
+
+        for part in range(parts):
+            task = {"filepath": f["filepath"], "dstfile": dstfile if parts == 1 else part_filename(dstfile, part),
+                    "part": part, "parts": parts, "start": boundaries[part], "end": boundaries[part + 1],
+                    "size": boundaries[part + 1] - boundaries[part], "resume": None}
+
+            if partentries is not None:
+                partentry = partentries[part]
+                written = os.path.getsize(task["dstfile"]) if os.path.exists(task["dstfile"]) else -1
+
+                if partentry["complete"] and written == partentry["outputoffset"]:
+                    continue
+
+                if not partentry["complete"] and partentry["inputoffset"] > task["start"] and \
+                        written >= partentry["outputoffset"]:
+                    task["resume"] = (partentry["inputoffset"], partentry["outputoffset"])
+                    task["size"] = task["end"] - partentry["inputoffset"]
+
+            tasks.append(task)
+            pending += 1
+
+        if pending == 0:
+            done.append({"filepath": f["filepath"], "parts": parts})
+
+    # Longest processing time first
+    return sorted(tasks, key=lambda t: t["size"], reverse=True), done
+
+
+def stitch_parts(dstfile: str, parts: int):
+    os.replace(part_filename(dstfile, 0), dstfile)
+
+    with open(dstfile, "ab") as outputfile:
+        for part in range(1, parts):
+            partfile = part_filename(dstfile, part)
+
+            with open(partfile, "rb") as inputfile:
+                shutil.copyfileobj(inputfile, outputfile, copybuffersize)
+
+            os.remove(partfile)
+
+
+'''
+Stitches the parts of a file once all of them are done. finalize(filepath, dstfile) can turn the
+output file into the files that are actually loaded, it returns those files and the statements
+loading them. The statements are printed and kept in the manifest, to print them again when a
+rerun skips the file.
+'''
+
+
+def finish_file(outputdir: str, filepath: str, parts: int, keepparts: bool, extension: str = None,
+                finalize: Callable[[str, str], Tuple[List[str], List[str]]] = None):
+    filename = filepath.split("/")[-1]
+    dstfile = output_filename(outputdir, filepath, extension)
+    (outputs, statements) = (None, None)
+
+    if parts > 1 and not keepparts:
+        stitch_parts(dstfile, parts)
+
+    if finalize is not None:
+        (outputs, statements) = finalize(filepath, dstfile)
+
+        for statement in statements:
+            print(statement)
+
+    transformmanifest.complete_file(outputdir, filename, outputs, statements)
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def print_worker_report(results: List[Dict]):
+    workers = {}
+
+    for result in results:
+        worker = workers.setdefault(result["worker"], {"tasks": 0, "lines": 0, "seconds": 0.0})
+        worker["tasks"] += 1
+        worker["lines"] += result["lines"]
+        worker["seconds"] += result["seconds"]
+
+    for name in sorted(workers.keys()):
+        worker = workers[name]
+        print("Worker %s: %d tasks, %d lines in %f seconds. %f lines/sec" %
+              (name, worker["tasks"], worker["lines"], worker["seconds"],
+               (float(worker["lines"]) / worker["seconds"]) if worker["seconds"] else 0.0))
+
+
+def transformcsvfiles(directory: str, outputdirname: str, transformline: Callable[[str], str],
+                      workers: int = None, onlyfiles: List[str] = None, rangesize: int = defaultrangesize,
+                      keepparts: bool = False, transformchunk: Callable[[bytes], bytes] = None,
+                      resume: bool = True, chunkfactory: Callable[[str], Callable[[bytes], bytes]] = None,
+                      progressinterval: float = None, metricsfile: str = None,
+                      extension: str = None,
+                      finalize: Callable[[str, str], Tuple[List[str], List[str]]] = None,
+                      inputextension: str = ".csv", pipelined: bool = True,
+                      cancelled: threading.Event = None, mode: Dict = None,
+                      fileplanner: Callable[[str], Dict] = None) -> List[Dict]:
+    start = time.time()
+    if directory[-1] == "/":
+        directory = directory[0:-1]
+
+    outputdir = directory + "/" + outputdirname
+
+    if not os.path.exists(outputdir):
+        os.mkdir(outputdir)
+
+    if workers is None:
+        workers = default_workers()
+
+    # Splitting a file only pays off when there is more than one worker to run the parts
+    if workers == 1:
+        rangesize = None
+
+    # Without resume the manifest is started from scratch, it is still written for the next run
+    manifest = transformmanifest.load_manifest(outputdir) if resume else {"files": {}}
+    (tasks, done) = plan_tasks(list_csv_files(directory, onlyfiles, inputextension), outputdir, rangesize, manifest,
+                               keepparts, extension, transformmanifest.mode_fingerprint(mode))
+    transformmanifest.save_manifest(outputdir, manifest)
+
+    for f in done:
+        finish_file(outputdir, f["filepath"], f["parts"], keepparts, extension, finalize)
+
+    pendingtasks = {}
+    plans = {}
+
+    for task in tasks:
+        pendingtasks[task["filepath"]] = pendingtasks.get(task["filepath"], 0) + 1
+
+        # Planned once per file, before its parts are handed out, and passed to chunkfactory in every part
+        if fileplanner is not None:
+            if task["filepath"] not in plans:
+                plans[task["filepath"]] = fileplanner(task["filepath"])
+
+            task["plan"] = plans[task["filepath"]]
+
+    lock = multiprocessing.Lock()
+    transformmanifest.setlock(lock)
+    taskargs = [(t, outputdir, transformline, transformchunk, chunkfactory, pipelined) for t in tasks]
+
+    progressqueue = multiprocessing.Queue() if progressinterval else None
+    totals = {}
+
+    for task in tasks:
+        totals[task["filepath"]] = totals.get(task["filepath"], 0) + task["size"]
+
+    if progressqueue is not None:
+        reporter = transformmetrics.ProgressReporter(progressqueue, totals, progressinterval)
+        reporter.start()
+
+    def taskdone(result: Dict):
+        pendingtasks[result["filepath"]] -= 1
+
+        # Stitch as soon as the last part of a file is done, while the workers continue
+        if pendingtasks[result["filepath"]] == 0:
+            finish_file(outputdir, result["filepath"], result["parts"], keepparts, extension, finalize)
+
+    scheduler = transformscheduler.Scheduler(_transformcsv_task, workers, _init_worker, (lock, progressqueue),
+                                             cancelled)
+
+    try:
+        results = scheduler.run(taskargs, [t["size"] for t in tasks], taskdone)
+    finally:
+        transformmanifest.setlock(None)
+
+        if progressqueue is not None:
+            reporter.stop()
+
+    if scheduler.notrun:
+        print("Cancelled, %d tasks not run. Run again to transform the remaining files" % len(scheduler.notrun))
+
+    end = time.time()
+    passed = end - start
+
+    totallines = sum(r["lines"] for r in results)
+    runningtime = sum(r["seconds"] for r in results)
+
+    print_worker_report(results)
+    print("We're done. Took %f seconds in total for %d lines. Avg %f lines/sec. Total worker running time: "
+          "%s sec. Avg: %f lines/sec" %
+          (passed, totallines, float(totallines) / passed if passed else 0.0, runningtime,
+           float(totallines) / runningtime if runningtime else 0.0))
+
+    report = transformmetrics.build_report(results, passed, workers)
+    transformmetrics.print_rule_report(report)
+    transformmetrics.print_cache_report(report)
+
+    if metricsfile is not None:
+        transformmetrics.write_report(metricsfile, report)
+        print("Wrote metrics to %s" % metricsfile)
+
+    return results
+
+
+'''
+Streaming mode: one input read from stdin or a (.gz/.xz compressed) file and written to stdout or
+a (.gz/.xz compressed) file, so the transformer can run in a pipe in front of the bulk loader
+without a full uncompressed copy of the data on disk. Reports go to stderr, stdout may be data.
+'''
+
+
+def open_input(path: str):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin.buffer)
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+
+    return open(path, "rb")
+
+
+def open_output(path: str, compresslevel: int = None):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdout.buffer)
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "wb", compresslevel=6 if compresslevel is None else compresslevel)
+
+    if path.endswith(".xz"):
+        return lzma.open(path, "wb", preset=compresslevel)
+
+    return open(path, "wb")
+
+
+def transformstream(inputpath: str, outputpath: str, transformchunk: Callable[[bytes], bytes],
+                    compresslevel: int = None, pipelined: bool = True) -> Dict:
+    begin = time.time()
+    totallines = 0
+    framed = hasattr(transformchunk, "begin")
+
+    with open_input(inputpath) as inputfile:
+        with open_output(outputpath, compresslevel) as outputfile:
+            # Reading and decompressing the input, and compressing and writing the output, release the GIL
+            # in the file objects of io, gzip and lzma, so they overlap with the transform
+            output = PipelinedWriter(outputfile) if pipelined else outputfile
+            chunks = iterchunks(inputfile, records=framed)
+
+            if pipelined:
+                chunks = PipelinedReader(chunks)
+
+            try:
+                if framed:
+                    output.write(transformchunk.begin(True))
+
+                with contextlib.closing(chunks):
+                    for (offset, chunk) in chunks:
+                        try:
+                            result = transformchunk(chunk)
+                        except UnicodeDecodeError as e:
+                            raise ValueError("Invalid UTF-8 in %s at byte %d" %
+                                             (inputpath, offset - len(chunk) + e.start)) from None
+
+                        counted = chunk if framed else result
+                        totallines += counted.count(b"\n")
+
+                        if counted and not counted.endswith(b"\n"):
+                            totallines += 1
+
+                        output.write(result)
+
+                if framed:
+                    output.write(transformchunk.finish(True))
+
+                output.flush()
+            finally:
+                if pipelined:
+                    output.close()
+
+            outputfile.flush()
+
+    passed = time.time() - begin
+    print("Done %s (%d lines) in %f seconds. %f lines/sec" % (outputpath, totallines, passed,
+                                                               (float(totallines) / passed) if passed else 0.0),
+          file=sys.stderr)
+
+    return {
+        "filepath": inputpath,
+        "dstfile": outputpath,
+        "lines": totallines,
+        "seconds": passed
+    }
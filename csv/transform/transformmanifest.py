@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import contextlib
+from typing import Callable, Dict, List
+
+manifestname = "manifest.json"
+checkpointinterval = 64 * 1024 * 1024
+hashblocksize = 16 * 1024 * 1024
+
+# Lock shared by the parent and the worker processes around every read-modify-write of the manifest
+lock = None
+
+'''
+Checkpoint manifest of a directory transform, kept in the output directory. Per input file it
+records the size, mtime and hash of the input, the fingerprint of the mode and options it was
+transformed with and, per part (see transformengine.plan_tasks), the last committed input and
+output offset. A rerun uses it to skip unchanged inputs and to resume partially written outputs
+from their last checkpoint, as long as the mode is the same.
+
+The hash of a file is the hash of the hashes of its parts, so the workers can hash their own
+range while they transform it.
+'''
+
+
+def setlock(sharedlock):
+    global lock
+    lock = sharedlock
+
+
+def load_manifest(outputdir: str) -> Dict:
+    path = outputdir + "/" + manifestname
+
+    if not os.path.exists(path):
+        return {"files": {}}
+
+    with open(path, "r") as manifestfile:
+        return json.load(manifestfile)
+
+
+def save_manifest(outputdir: str, manifest: Dict):
+    path = outputdir + "/" + manifestname
+
+    with open(path + ".tmp", "w") as manifestfile:
+        json.dump(manifest, manifestfile, indent=1, sort_keys=True)
+        manifestfile.flush()
+        os.fsync(manifestfile.fileno())
+
+    os.replace(path + ".tmp", path)
+
+
+def update_manifest(outputdir: str, update: Callable[[Dict], None]):
+    with lock if lock is not None else contextlib.nullcontext():
+        manifest = load_manifest(outputdir)
+        update(manifest)
+        save_manifest(outputdir, manifest)
+
+
+def hash_range(file: str, start: int, end: int, hasher=None):
+    if hasher is None:
+        hasher = hashlib.blake2b(digest_size=20)
+
+    with open(file, "rb") as inputfile:
+        inputfile.seek(start)
+        remaining = end - start
+
+        while remaining > 0:
+            block = inputfile.read(min(hashblocksize, remaining))
+
+            if not block:
+                break
+
+            hasher.update(block)
+            remaining -= len(block)
+
+    return hasher
+
+
+def combine_hashes(parthashes: List[str]) -> str:
+    return hashlib.blake2b("".join(parthashes).encode("ascii"), digest_size=20).hexdigest()
+
+
+def file_hash(file: str, boundaries: List[int]) -> str:
+    return combine_hashes([hash_range(file, boundaries[i], boundaries[i + 1]).hexdigest()
+                           for i in range(len(boundaries) - 1)])
+
+
+'''
+Fingerprint of the mode and options of a transform (the rules, --columns, --bytes, the output
+format, ...), given as a dict of JSON values
+'''
+
+
+def mode_fingerprint(mode: Dict = None) -> str:
+    return hashlib.blake2b(json.dumps(mode or {}, sort_keys=True).encode("utf-8"), digest_size=20).hexdigest()
+
+
+def new_entry(stat: os.stat_result, rangesize: int, boundaries: List[int], keepparts: bool,
+              mode: str = None) -> Dict:
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "rangesize": rangesize,
+        "keepparts": keepparts,
+        "mode": mode,
+        "boundaries": boundaries,
+        "hash": None,
+        "complete": False,
+        "parts": [{"inputoffset": boundaries[i], "outputoffset": 0, "hash": None, "complete": False}
+                  for i in range(len(boundaries) - 1)]
+    }
+
+
+'''
+True when entry describes a complete transform of file as it is now, in mode. When only the mtime
+changed, the file is hashed to find out whether the contents changed, and the entry gets the new
+mtime.
+'''
+
+
+def is_unchanged(entry: Dict, file: str, stat: os.stat_result, outputs: List[str], keepparts: bool,
+                 mode: str = None) -> bool:
+    if entry is None or not entry["complete"] or entry["keepparts"] != keepparts or entry["size"] != stat.st_size:
+        return False
+
+    if entry.get("mode") != mode:
+        return False
+
+    if not all(os.path.exists(output) for output in outputs):
+        return False
+
+    if entry["mtime"] != stat.st_mtime:
+        if file_hash(file, entry["boundaries"]) != entry["hash"]:
+            return False
+
+        entry["mtime"] = stat.st_mtime
+
+    return True
+
+
+def can_resume(entry: Dict, stat: os.stat_result, rangesize: int, keepparts: bool, mode: str = None) -> bool:
+    return entry is not None and not entry["complete"] and entry["size"] == stat.st_size and \
+        entry["mtime"] == stat.st_mtime and entry["rangesize"] == rangesize and entry["keepparts"] == keepparts and \
+        entry.get("mode") == mode
+
+
+class Checkpoint:
+    '''
+    Used by a worker to commit the progress of one part of a file to the manifest
+    '''
+
+    def __init__(self, outputdir: str, filename: str, part: int):
+        self.outputdir = outputdir
+        self.filename = filename
+        self.part = part
+
+    def commit(self, inputoffset: int, outputoffset: int, parthash: str = None, complete: bool = False):
+        def update(manifest: Dict):
+            entry = manifest["files"][self.filename]["parts"][self.part]
+            entry["inputoffset"] = inputoffset
+            entry["outputoffset"] = outputoffset
+            entry["hash"] = parthash
+            entry["complete"] = complete
+
+        update_manifest(self.outputdir, update)
+
+
+def complete_file(outputdir: str, filename: str, outputs: List[str] = None, statements: List[str] = None):
+    def update(manifest: Dict):
+        entry = manifest["files"][filename]
+        entry["hash"] = combine_hashes([part["hash"] for part in entry["parts"]])
+        entry["complete"] = True
+        entry["outputs"] = outputs
+        entry["statements"] = statements
+
+    update_manifest(outputdir, update)
@@ -0,0 +1,285 @@
+import sys
+import csv
+import copy
+import json
+import time
+import queue
+import threading
+from typing import Callable, Dict, List
+
+from transformcache import merge_cachestats, hitrate
+
+# Queue the workers put their progress on, set by the pool initializer like transformmanifest.lock
+progressqueue = None
+
+# Per rule [calls, changes, seconds] of the timed rules run in this process since the last take_rulestats
+rulestats = {}
+
+'''
+Metrics of a directory transform: live progress of the workers, optional timing and hit counts
+per rule, and a final report as JSON or CSV.
+
+The workers report the bytes and lines of every chunk they have transformed on a queue. The parent
+drains it in a thread and prints the progress, throughput and ETA of every file in progress and
+of the whole run every interval seconds.
+
+Rules are timed by wrapping their functions in TimedRule. The dialects build timed variants of
+their transform functions from those (see transformline_timed in monetdbrules.py), so a run
+without rule stats has no overhead. A TimedRule counts into the module level rulestats of the
+process it is called in, a worker hands them to the parent with the result of every task.
+'''
+
+
+def setqueue(sharedqueue):
+    global progressqueue
+    progressqueue = sharedqueue
+
+
+def report_progress(filepath: str, size: int, lines: int):
+    if progressqueue is not None:
+        progressqueue.put((filepath, size, lines))
+
+
+class TimedRule:
+    '''
+    Calls function and adds the call, whether it changed its input and the time it took to the stats
+    of name. Picklable as long as function is, so it can be passed to the workers.
+    '''
+
+    def __init__(self, name: str, function: Callable[[str], str]):
+        self.name = name
+        self.function = function
+
+    def __call__(self, text: str) -> str:
+        begin = time.perf_counter()
+        result = self.function(text)
+        passed = time.perf_counter() - begin
+
+        stats = rulestats.get(self.name)
+
+        if stats is None:
+            stats = rulestats[self.name] = [0, 0, 0.0]
+
+        stats[0] += 1
+        if result != text:
+            stats[1] += 1
+        stats[2] += passed
+
+        return result
+
+
+class TimedChain:
+    '''
+    Runs the functions of a transformline chain one after the other, each as a TimedRule
+    '''
+
+    def __init__(self, functions: List[Callable[[str], str]]):
+        self.rules = [TimedRule(function.__name__, function) for function in functions]
+
+    def __call__(self, line: str) -> str:
+        for rule in self.rules:
+            line = rule(line)
+
+        return line
+
+
+def timed_rules(rules: List) -> List:
+    timed = []
+
+    for rule in rules:
+        rule = copy.copy(rule)
+        rule.convert = TimedRule(rule.name, rule.convert)
+        timed.append(rule)
+
+    return timed
+
+
+def timed_converters(converters: Dict[str, Callable[[str], str]]) -> Dict[str, Callable[[str], str]]:
+    return {name: TimedRule(name, convert) for (name, convert) in converters.items()}
+
+
+def take_rulestats() -> Dict[str, List]:
+    global rulestats
+    (stats, rulestats) = (rulestats, {})
+
+    return stats
+
+
+def merge_rulestats(total: Dict[str, List], stats: Dict[str, List]):
+    for (name, (calls, changes, seconds)) in stats.items():
+        merged = total.setdefault(name, [0, 0, 0.0])
+        merged[0] += calls
+        merged[1] += changes
+        merged[2] += seconds
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class ProgressReporter(threading.Thread):
+    '''
+    Collects the progress the workers put on sharedqueue. totals maps every file to the number of
+    bytes that has to be transformed for it in this run. Prints a report every interval seconds,
+    never when interval is None or 0.
+    '''
+
+    def __init__(self, sharedqueue, totals: Dict[str, int], interval: float = None):
+        super().__init__(daemon=True)
+        self.queue = sharedqueue
+        self.interval = interval
+        self.files = {f: {"total": total, "bytes": 0, "lines": 0, "started": None} for (f, total) in totals.items()}
+        self.begin = time.time()
+
+    def run(self):
+        lastreport = time.time()
+
+        while True:
+            # Wake up for the next report, or only for progress and the stop sentinel without reports
+            timeout = max(0.0, lastreport + self.interval - time.time()) if self.interval else None
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+
+            # Put by stop, after all progress of the workers
+            if item is None:
+                break
+
+            if item:
+                (filepath, size, lines) = item
+                f = self.files[filepath]
+
+                if f["started"] is None:
+                    f["started"] = time.time()
+
+                f["bytes"] += size
+                f["lines"] += lines
+
+            if self.interval and time.time() - lastreport >= self.interval:
+                self.print_report()
+                lastreport = time.time()
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def print_report(self):
+        now = time.time()
+
+        for (filepath, f) in self.files.items():
+            if f["started"] is not None and f["bytes"] < f["total"]:
+                print("Progress %s: %s" % (filepath, progress_line(f["bytes"], f["total"], f["lines"],
+                                                                   now - f["started"])))
+
+        done = sum(f["bytes"] for f in self.files.values())
+        total = sum(f["total"] for f in self.files.values())
+        lines = sum(f["lines"] for f in self.files.values())
+
+        print("Progress overall: %s" % progress_line(done, total, lines, now - self.begin))
+        sys.stdout.flush()
+
+
+def progress_line(done: int, total: int, lines: int, seconds: float) -> str:
+    rate = done / seconds if seconds else 0.0
+    eta = format_duration((total - done) / rate) if rate else "unknown"
+
+    return "%.1f/%.1f MB (%d%%), %d lines, %f lines/sec, %f MB/s, ETA %s" % \
+           (done / (1024 * 1024), total / (1024 * 1024), 100 * done // total if total else 100, lines,
+            lines / seconds if seconds else 0.0, rate / (1024 * 1024), eta)
+
+
+'''
+Summary of a run from the results of its tasks: per file and in total the bytes and lines
+transformed, the worker time spent on them and the throughput, plus the merged rule and cache
+stats.
+'''
+
+
+def build_report(results: List[Dict], seconds: float, workers: int) -> Dict:
+    files = {}
+    rules = {}
+    caches = {}
+
+    for result in results:
+        f = files.setdefault(result["filepath"], {"filepath": result["filepath"], "parts": result["parts"],
+                                                  "bytes": 0, "lines": 0, "seconds": 0.0})
+        f["bytes"] += result["bytes"]
+        f["lines"] += result["lines"]
+        f["seconds"] += result["seconds"]
+
+        merge_rulestats(rules, result.get("rules", {}))
+        merge_cachestats(caches, result.get("caches", {}))
+
+    for f in files.values():
+        add_throughput(f)
+
+    total = {
+        "bytes": sum(f["bytes"] for f in files.values()),
+        "lines": sum(f["lines"] for f in files.values()),
+        "seconds": seconds,
+        "workerseconds": sum(f["seconds"] for f in files.values()),
+        "workers": workers
+    }
+    add_throughput(total)
+
+    return {
+        "total": total,
+        "files": sorted(files.values(), key=lambda f: f["filepath"]),
+        "rules": [{"rule": name, "calls": calls, "changes": changes, "seconds": ruleseconds,
+                   "microsecondspercall": 1000000 * ruleseconds / calls if calls else 0.0}
+                  for (name, (calls, changes, ruleseconds)) in sorted(rules.items(), key=lambda r: -r[1][2])],
+        "caches": [{"cache": name, "hits": hits, "misses": misses, "hitrate": hitrate(hits, misses), "size": size}
+                   for (name, (hits, misses, size)) in sorted(caches.items())]
+    }
+
+
+def add_throughput(metrics: Dict):
+    seconds = metrics["seconds"]
+    metrics["linespersecond"] = metrics["lines"] / seconds if seconds else 0.0
+    metrics["mbpersecond"] = metrics["bytes"] / (1024 * 1024) / seconds if seconds else 0.0
+
+
+def print_rule_report(report: Dict):
+    for rule in report["rules"]:
+        print("Rule %s: %d calls, %d changes, %f seconds. %f microseconds/call" %
+              (rule["rule"], rule["calls"], rule["changes"], rule["seconds"], rule["microsecondspercall"]))
+
+
+def print_cache_report(report: Dict):
+    for cache in report["caches"]:
+        print("Cache %s: %d hits, %d misses, hit rate %.1f%%, %d values cached" %
+              (cache["cache"], cache["hits"], cache["misses"], 100 * cache["hitrate"], cache["size"]))
+
+
+'''
+Writes report as JSON, or as CSV when path ends with .csv: one row for the total, one per file
+one per rule and one per cache, with a kind column telling them apart
+'''
+
+csvcolumns = ["kind", "name", "bytes", "lines", "seconds", "linespersecond", "mbpersecond", "calls", "changes",
+              "microsecondspercall", "hits", "misses", "hitrate"]
+
+
+def write_report(path: str, report: Dict):
+    if not path.endswith(".csv"):
+        with open(path, "w") as outputfile:
+            json.dump(report, outputfile, indent=1)
+        return
+
+    with open(path, "w", newline="") as outputfile:
+        writer = csv.DictWriter(outputfile, csvcolumns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerow(dict(report["total"], kind="total", name=""))
+
+        for f in report["files"]:
+            writer.writerow(dict(f, kind="file", name=f["filepath"]))
+
+        for rule in report["rules"]:
+            writer.writerow(dict(rule, kind="rule", name=rule["rule"]))
+
+        for cache in report["caches"]:
+            writer.writerow(dict(cache, kind="cache", name=cache["cache"]))
@@ -0,0 +1,209 @@
+import re
+from typing import Callable, List
+
+'''
+Compiles a declarative list of rules into one combined regex, so a line is scanned once instead
+of once per re.sub in the transformline chains.
+
+Every rule has a pattern without capturing groups and a convert function that gets the matched
+text and returns its replacement. The rules are tried in the order of the chain they replace.
+
+A single scan is only equivalent to the chain when the matches of the rules do not touch each
+other. The quoted value rules are therefore marked as field rules: their match has to be a
+complete CSV field, i.e. be preceded by a comma or the start of the line and followed by a
+comma or the line ending. When a field rule matches anywhere else (for example in a quoted
+string containing "" escapes) the line is handed to the fallback chain, so the output always
+stays identical to the chain.
+
+The gain is smaller than the number of re.sub calls saved suggests: every match still calls its
+converter in Python, which is most of the remaining cost. On data made by generatecsv.py one core
+does 1.2 to 1.8 times the lines per second of the chain, depending on the dialect and the column
+mix (see benchmark.py).
+
+The same rules are also compiled for bytes, to transform whole chunks of a file read in bytes
+mode (see transformengine.transformcsv_mmap). Chunks are handled with the same semantics as the
+text mode file object: line endings are normalized to \n and chunks that are not pure ASCII are
+decoded, as \d and case insensitive matching are Unicode aware for str.
+'''
+
+
+class Rule:
+    def __init__(self, name: str, pattern: str, convert: Callable[[str], str], ignorecase: bool = False,
+                 field: bool = True, starts: str = '"', requires: str = '"'):
+        self.name = name
+        self.pattern = pattern
+        self.convert = convert
+        self.ignorecase = ignorecase
+        self.field = field
+        # Characters a match can start with
+        self.starts = starts
+        # Characters of which at least one has to be in a line for the rule to be able to match
+        self.requires = requires
+
+
+class FallbackToChain(Exception):
+    pass
+
+
+class RuleSet:
+    def __init__(self, rules: List[Rule], fallback: Callable[[str], str]):
+        self.rules = rules
+        self.fallback = fallback
+        self.converters = {}
+        self.fieldrules = set()
+        self.requires = set()
+        self.requiresbytes = []
+
+        patterns = []
+        starts = set()
+
+        for i, rule in enumerate(rules):
+            group = "r%d" % i
+            pattern = "(?i:%s)" % rule.pattern if rule.ignorecase else rule.pattern
+            patterns.append("(?P<%s>%s)" % (group, pattern))
+
+            self.converters[group] = rule.convert
+            if rule.field:
+                self.fieldrules.add(group)
+            self.requires.update(rule.requires)
+            starts.update(rule.starts)
+
+        # The lookahead lets the scanner skip positions where no rule can start without trying
+        # every alternative
+        pattern = "(?=[%s])(?:%s)" % (re.escape("".join(sorted(starts))), "|".join(patterns))
+
+        self.regex = re.compile(pattern)
+        # Chunks contain many lines, $ has to match at the end of each of them
+        self.chunkregex = re.compile(pattern, re.M)
+        self.bytesregex = re.compile(pattern.encode("ascii"), re.M)
+        self.requiresbytes = [char.encode("ascii") for char in self.requires]
+
+    def _replace(self, match) -> str:
+        group = match.lastgroup
+
+        if group in self.fieldrules:
+            (start, end) = match.span()
+            line = match.string
+
+            if (start and line[start - 1] not in ",\n") or (end < len(line) and line[end] not in ",\r\n"):
+                raise FallbackToChain()
+
+        return self.converters[group](match.group())
+
+    def _replacebytes(self, match) -> bytes:
+        group = match.lastgroup
+
+        if group in self.fieldrules:
+            (start, end) = match.span()
+            chunk = match.string
+
+            if (start and chunk[start - 1] not in b",\n") or (end < len(chunk) and chunk[end] not in b",\r\n"):
+                raise FallbackToChain()
+
+        return self.converters[group](match.group().decode("latin-1")).encode("latin-1")
+
+    def transformline(self, line: str) -> str:
+        # Fast path: no rule can match a line without any of the characters they require
+        for char in self.requires:
+            if char in line:
+                break
+        else:
+            return line
+
+        try:
+            return self.regex.sub(self._replace, line)
+        except FallbackToChain:
+            return self.fallback(line)
+
+    def transformlines(self, text: str) -> str:
+        lines = text.split("\n")
+        result = [self.transformline(line + "\n") for line in lines[:-1]]
+
+        if lines[-1]:
+            result.append(self.transformline(lines[-1]))
+
+        return "".join(result)
+
+    '''
+    Transforms a chunk of whole lines read in bytes mode. The output is the same as transformline
+    applied to every line of the chunk read in text mode. With validate, a chunk that is not
+    valid UTF-8 raises a UnicodeDecodeError, without it invalid bytes are passed through as is.
+    '''
+
+    def transformchunk(self, chunk: bytes, validate: bool = True) -> bytes:
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        if chunk.isascii():
+            for char in self.requiresbytes:
+                if char in chunk:
+                    break
+            else:
+                return chunk
+
+            try:
+                return self.bytesregex.sub(self._replacebytes, chunk)
+            except FallbackToChain:
+                return self.transformlines(chunk.decode("ascii")).encode("ascii")
+
+        errors = "strict" if validate else "surrogateescape"
+        text = chunk.decode("UTF-8", errors)
+
+        try:
+            text = self.chunkregex.sub(self._replace, text)
+        except FallbackToChain:
+            text = self.transformlines(text)
+
+        return text.encode("UTF-8", errors)
+
+
+'''
+Converters shared by the dialects
+'''
+
+
+def convertbogusdate(text: str) -> str:
+    if text.startswith('"1899-'):
+        return '"1970-' + text[6:]
+
+    return '"2018-' + text[6:]
+
+
+def convertisodate(text: str) -> str:
+    if text.startswith('"1899-') or text.startswith('"9476-'):
+        return convertbogusdate(text)
+
+    return text
+
+
+def convertboolean(text: str) -> str:
+    return "1" if text[1] in "tT" else "0"
+
+
+def converttrue(text: str) -> str:
+    return "1"
+
+
+def convertfalse(text: str) -> str:
+    return "0"
+
+
+def convertinteger(text: str) -> str:
+    return text[1:-1]
+
+
+def convertemptystring(text: str) -> str:
+    return ",NULL"
+
+
+def convertoctal(text: str) -> str:
+    return "\\" + text
+
+
+datepattern = r'"\d+/\d+/\d+ \d+:\d+:\d+(?: \+\d+:\d+)?"'
+bogusdatepattern = r'"(?:1899|9476)-\d+-\d+ \d+:\d+:\d+"'
+truepattern = r'"true"'
+falsepattern = r'"false"'
+integerpattern = r'"\d+"'
+emptystringpattern = r',(?:""(?=,)|""$)'
+octalpattern = r'\\\d+'
@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List
+
+'''
+Scheduler of the transform tasks (whole files and ranges of files) over a pool of worker
+processes. Tasks are started longest first (longest processing time first, the size of a task
+being its cost), and a task is only handed to a worker once a worker is free, so the order holds
+exactly: the largest tasks never end up queued behind small ones.
+
+The scheduler blocks on the completion of the running tasks instead of polling, and only counts
+its own tasks, so it can run in any process, next to other threads. It returns the result of
+every task. cancel, from any thread, stops starting new tasks: the running ones are finished,
+the others are returned as not run. Interrupted files are resumed from the manifest on the next
+run, see transformmanifest.py.
+
+A worker process that dies (killed by the OOM killer, for example) breaks the pool. The scheduler
+then raises a RuntimeError instead of waiting for it forever.
+'''
+
+
+class Scheduler:
+    '''
+    Runs function(task) for tasks in at most workers processes, initializer(*initargs) being run
+    in every worker process when it starts. cancelled optionally is an event of the caller that
+    cancels the run when set, like cancel does.
+    '''
+
+    def __init__(self, function: Callable, workers: int, initializer: Callable = None, initargs: tuple = (),
+                 cancelled: threading.Event = None):
+        self.function = function
+        self.workers = max(1, workers)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.cancelled = cancelled if cancelled is not None else threading.Event()
+        self.notrun = []
+
+    def cancel(self):
+        self.cancelled.set()
+
+    '''
+    Runs tasks, costs giving the cost of every task. ondone is called in the calling thread with
+    the result of every task as soon as it is done, results are returned in the order they were
+    done. Tasks not started because of a cancel are kept in notrun. The first task raising an error
+    cancels the remaining tasks, the error is raised once the running ones are done.
+    '''
+
+    def run(self, tasks: List, costs: List[float] = None, ondone: Callable[[Dict], None] = None) -> List[Dict]:
+        if costs is None:
+            costs = [0] * len(tasks)
+
+        # Largest last, as tasks are taken from the end. Equal costs keep the order they were given in
+        order = sorted(range(len(tasks)), key=lambda i: -costs[i])
+        pending = [tasks[i] for i in reversed(order)]
+
+        results = []
+        running = set()
+        error = None
+
+        if not pending:
+            return results
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), initializer=self.initializer,
+                                 initargs=self.initargs) as executor:
+            while running or (pending and error is None and not self.cancelled.is_set()):
+                while pending and len(running) < self.workers and error is None and not self.cancelled.is_set():
+                    running.add(executor.submit(self.function, pending.pop()))
+
+                (done, running) = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        raise RuntimeError("A worker process died, rerun to resume the unfinished files") from None
+                    except Exception as e:
+                        error = error or e
+                        continue
+
+                    results.append(result)
+
+                    if ondone is not None:
+                        ondone(result)
+
+        pending.reverse()
+        self.notrun = pending
+
+        if error is not None:
+            raise error
+
+        return results
@@ -0,0 +1,127 @@
+import os
+import argparse
+import functools
+import importlib
+from typing import Callable, List
+
+import transformengine
+import transformmanifest
+
+'''
+Reads TPC-H .tbl files (| separated, every line ending with a |) directly, replacing
+csv/removetrailingpipes.sh and the separate pass over its output. In one pass per chunk the
+trailing delimiter is stripped, the fields are optionally put in another delimiter and the rules
+of a dialect are applied. All .tbl files of a directory are transformed by the worker processes
+of the engine, large ones cut in ranges like CSV files.
+
+.tbl files have no quoting, so with , as the new delimiter fields containing a , or a " are
+quoted the CSV way. Other delimiters are put in as they are. The rules of the dialects expect CSV,
+so with a dialect the delimiter becomes , unless another one is given.
+'''
+
+
+class TblTransformer:
+    '''
+    Chunk transformer for .tbl files, see transformengine.transformcsv. transformchunk is the
+    chunk transform of the dialect run on the result, when given.
+    '''
+
+    def __init__(self, delimiter: str = "|", redelimit: str = None,
+                 transformchunk: Callable[[bytes], bytes] = None):
+        self.delimiter = delimiter.encode("UTF-8")
+        self.redelimit = redelimit.encode("UTF-8") if redelimit is not None else None
+        self.transformchunk = transformchunk
+
+    def __call__(self, chunk: bytes) -> bytes:
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        chunk = chunk.replace(self.delimiter + b"\n", b"\n")
+
+        if chunk.endswith(self.delimiter):
+            chunk = chunk[:-len(self.delimiter)]
+
+        if self.redelimit is not None:
+            chunk = self.redelimitchunk(chunk)
+
+        if self.transformchunk is not None:
+            chunk = self.transformchunk(chunk)
+
+        return chunk
+
+    def redelimitchunk(self, chunk: bytes) -> bytes:
+        if self.redelimit != b"," or (b"," not in chunk and b'"' not in chunk):
+            return chunk.replace(self.delimiter, self.redelimit)
+
+        return b"\n".join([self.redelimitline(line) for line in chunk.split(b"\n")])
+
+    def redelimitline(self, line: bytes) -> bytes:
+        if b"," not in line and b'"' not in line:
+            return line.replace(self.delimiter, b",")
+
+        return b",".join([b'"' + field.replace(b'"', b'""') + b'"' if b"," in field or b'"' in field else field
+                          for field in line.split(self.delimiter)])
+
+
+def tbltransformer(dialect: str = None, redelimit: str = None, validate: bool = True) -> TblTransformer:
+    transformchunk = None
+
+    if dialect is not None:
+        rules = importlib.import_module(transformengine.dialects[dialect][0])
+        transformchunk = functools.partial(rules.transformchunk, validate=validate)
+
+    return TblTransformer("|", redelimit, transformchunk)
+
+
+def transformtblfiles(directory: str, dialect: str = None, redelimit: str = None, workers: int = None,
+                      rangesize: int = transformengine.defaultrangesize, resume: bool = True,
+                      validate: bool = True, onlyfiles: List[str] = None, keepmanifest: bool = True) -> List[dict]:
+    outputdirname = transformengine.dialects[dialect][1] if dialect is not None else "output"
+
+    if dialect is not None and redelimit is None:
+        redelimit = ","
+
+    extension = ".csv" if redelimit == "," else None
+
+    results = transformengine.transformcsvfiles(directory, outputdirname, None, workers, onlyfiles, rangesize,
+                                                transformchunk=tbltransformer(dialect, redelimit, validate),
+                                                resume=resume, extension=extension, inputextension=".tbl",
+                                                mode={"tbl": True, "dialect": dialect, "redelimit": redelimit,
+                                                      "validate": validate})
+
+    # Without it the output directory only holds the data files, as the sed loop it replaces left it
+    if not keepmanifest:
+        os.remove(directory.rstrip("/") + "/" + outputdirname + "/" + transformmanifest.manifestname)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help="Directory with the .tbl files to transform")
+    parser.add_argument('--transform', choices=sorted(transformengine.dialects.keys()), default=None,
+                        help="Apply the rules of this dialect and write to its output directory. Without it the "
+                             "files are only stripped (and redelimited) into output/")
+    parser.add_argument('--redelimit', default=None,
+                        help="Delimiter to replace | with. With , the output is CSV and is named .csv")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes. Defaults to the number of cores")
+    parser.add_argument('--rangesize', type=int, default=transformengine.defaultrangesize // (1024 * 1024),
+                        help="Files larger than this many MB are cut in ranges that are transformed in parallel. "
+                             "0 disables splitting")
+    parser.add_argument('--novalidate', action='store_true',
+                        help="Pass invalid UTF-8 through instead of failing on it")
+    parser.add_argument('--restart', action='store_true',
+                        help="Transform all files from scratch instead of skipping unchanged files and resuming "
+                             "interrupted ones")
+    parser.add_argument('--nomanifest', action='store_true',
+                        help="Remove the manifest from the output directory once done, a rerun then transforms "
+                             "all files again")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error("%s is not a directory" % args.directory)
+
+    transformtblfiles(args.directory, args.transform, args.redelimit, args.workers, args.rangesize * 1024 * 1024,
+                      not args.restart, not args.novalidate, keepmanifest=not args.nomanifest)
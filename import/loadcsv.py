@@ -0,0 +1,311 @@
+import os
+import re
+import csv
+import sys
+import time
+import sqlite3
+import argparse
+import multiprocessing
+from typing import Dict, List
+
+'''
+Loads a directory of (transformed) CSV files with a header line into a database, replacing
+import/importmongo.sh. Every file becomes a table or collection named after the file in lower
+case. Files are read in batches of rows that are inserted at once, several files are loaded at the
+same time by a pool of worker processes, largest first, and every load reports its rows/sec.
+
+Where the rows go is up to a sink: MongoSink inserts every batch with insert_many, SQLiteSink into
+a local SQLite database, to try a load without a server. A sink only holds its settings until
+open is called in the worker, so it can be handed to the worker processes. Indexes are created
+after all rows of a table are loaded, which is faster than maintaining them during the load.
+
+Like mongoimport, integers and decimals are loaded as numbers and everything else as strings.
+'''
+
+defaultbatchsize = 10000
+
+integerregex = re.compile(r'-?\d+')
+decimalregex = re.compile(r'-?\d*\.\d+|-?\d+\.\d*')
+
+# Integers outside of this range do not fit the 64 bit integers of the databases and stay strings
+int64min = -2 ** 63
+int64max = 2 ** 63 - 1
+
+
+def convertvalue(value: str):
+    if integerregex.fullmatch(value):
+        number = int(value)
+
+        if int64min <= number <= int64max:
+            return number
+    elif decimalregex.fullmatch(value):
+        return float(value)
+
+    return value
+
+
+def table_name(filepath: str) -> str:
+    return os.path.splitext(filepath.split("/")[-1])[0].lower()
+
+
+class MongoSink:
+    '''
+    Inserts the rows as documents into the collections of database. Empty fields are kept as empty
+    strings like mongoimport does, with ignoreblanks they are left out of the documents, like
+    mongoimport --ignoreBlanks does.
+    '''
+
+    def __init__(self, database: str, uri: str = "mongodb://localhost:27017", drop: bool = False,
+                 ignoreblanks: bool = False):
+        self.database = database
+        self.uri = uri
+        self.drop = drop
+        self.ignoreblanks = ignoreblanks
+        self.client = None
+        self.collection = None
+        self.columns = None
+
+    def open(self, table: str, columns: List[str]):
+        try:
+            import pymongo
+        except ImportError:
+            raise RuntimeError("The MongoDB sink needs pymongo, install it with pip install pymongo") from None
+
+        self.client = pymongo.MongoClient(self.uri)
+        self.collection = self.client[self.database][table]
+        self.columns = columns
+
+        if self.drop:
+            self.collection.drop()
+
+    def insert(self, rows: List[List]):
+        if self.ignoreblanks:
+            documents = [{column: value for (column, value) in zip(self.columns, row) if value != ""}
+                         for row in rows]
+        else:
+            documents = [dict(zip(self.columns, row)) for row in rows]
+
+        self.collection.insert_many(documents, ordered=False)
+
+    def create_index(self, columns: List[str]):
+        self.collection.create_index([(column, 1) for column in columns])
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+class SQLiteSink:
+    '''
+    Inserts the rows into the tables of the SQLite database in path, creating tables without
+    types for new files. Empty fields become NULL. SQLite allows one writer at a time, so the
+    workers take turns inserting their batches.
+    '''
+
+    def __init__(self, path: str, drop: bool = False):
+        self.path = path
+        self.drop = drop
+        self.connection = None
+        self.table = None
+        self.insertstatement = None
+
+    def open(self, table: str, columns: List[str]):
+        self.connection = sqlite3.connect(self.path, timeout=600)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.table = table
+
+        with self.connection:
+            if self.drop:
+                self.connection.execute("DROP TABLE IF EXISTS %s" % quote_identifier(table))
+
+            self.connection.execute("CREATE TABLE IF NOT EXISTS %s (%s)" %
+                                    (quote_identifier(table), ", ".join(quote_identifier(c) for c in columns)))
+
+        self.insertstatement = "INSERT INTO %s (%s) VALUES (%s)" % \
+                               (quote_identifier(table), ", ".join(quote_identifier(c) for c in columns),
+                                ", ".join("?" for _ in columns))
+
+    def insert(self, rows: List[List]):
+        with self.connection:
+            self.connection.executemany(self.insertstatement,
+                                        [[None if value == "" else value for value in row] for row in rows])
+
+    def create_index(self, columns: List[str]):
+        name = "%s_%s" % (self.table, "_".join(columns))
+
+        with self.connection:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" %
+                                    (quote_identifier(name), quote_identifier(self.table),
+                                     ", ".join(quote_identifier(c) for c in columns)))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def quote_identifier(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+'''
+Reads file in batches of batchsize rows, the header line giving the column names
+'''
+
+
+def iterbatches(file: str, batchsize: int = defaultbatchsize):
+    # Dumps can have fields over the default limit of the csv module. Set here, in the process reading
+    csv.field_size_limit(sys.maxsize)
+
+    with open(file, newline="", encoding="UTF-8") as inputfile:
+        reader = csv.reader(inputfile)
+        columns = next(reader, None)
+
+        if columns is None:
+            return
+
+        yield columns
+
+        batch = []
+
+        for row in reader:
+            batch.append([convertvalue(value) for value in row])
+
+            if len(batch) >= batchsize:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+
+def loadcsv(file: str, sink, batchsize: int = defaultbatchsize, indexes: List[List[str]] = None) -> Dict:
+    begin = time.time()
+    table = table_name(file)
+    rows = 0
+    batches = iterbatches(file, batchsize)
+    columns = next(batches, None)
+
+    if columns is None:
+        print("Skipped %s, it has no header" % file)
+        return {"filepath": file, "table": table, "rows": 0, "seconds": 0.0, "indexseconds": 0.0}
+
+    # Checked before loading, so a typo does not show up only after the whole table is loaded
+    for index in indexes or []:
+        for column in index:
+            if column not in columns:
+                raise ValueError("Index on %s: %s has no column %s" % (",".join(index), file, column))
+
+    sink.open(table, columns)
+
+    try:
+        for batch in batches:
+            sink.insert(batch)
+            rows += len(batch)
+
+        loaded = time.time()
+
+        for index in indexes or []:
+            sink.create_index(index)
+    finally:
+        sink.close()
+
+    end = time.time()
+    passed = loaded - begin
+
+    print("Loaded %s into %s (%d rows) in %f seconds. %f rows/sec" %
+          (file, table, rows, passed, float(rows) / passed if passed else 0.0))
+
+    if indexes:
+        print("Indexed %s (%d indexes) in %f seconds" % (table, len(indexes), end - loaded))
+
+    sys.stdout.flush()
+
+    return {"filepath": file, "table": table, "rows": rows, "seconds": passed, "indexseconds": end - loaded}
+
+
+def _loadcsv_task(args) -> Dict:
+    (file, sink, batchsize, indexes) = args
+
+    return loadcsv(file, sink, batchsize, indexes)
+
+
+'''
+Parses index specifications of the form table:column[,column...] into the columns of the
+indexes per table. More columns make a compound index.
+'''
+
+
+def parse_indexes(specs: List[str]) -> Dict[str, List[List[str]]]:
+    indexes = {}
+
+    for spec in specs or []:
+        (table, sep, columns) = spec.partition(":")
+
+        if not sep or not table or not columns:
+            raise ValueError("Index %s is not of the form table:column[,column...]" % spec)
+
+        indexes.setdefault(table.lower(), []).append([c.strip() for c in columns.split(",")])
+
+    return indexes
+
+
+def loadcsvfiles(directory: str, sink, workers: int = None, batchsize: int = defaultbatchsize,
+                 indexes: Dict[str, List[List[str]]] = None) -> List[Dict]:
+    start = time.time()
+    files = [directory + "/" + f for f in os.listdir(directory)
+             if f.endswith(".csv") and os.path.isfile(directory + "/" + f)]
+
+    # Largest first, so a big table is not started last while the other workers are idle
+    files.sort(key=lambda f: os.stat(f).st_size, reverse=True)
+
+    indexes = indexes or {}
+    tasks = [(f, sink, batchsize, indexes.get(table_name(f))) for f in files]
+    results = []
+
+    with multiprocessing.Pool(processes=max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))) as pool:
+        for result in pool.imap_unordered(_loadcsv_task, tasks, chunksize=1):
+            results.append(result)
+
+    passed = time.time() - start
+    rows = sum(r["rows"] for r in results)
+
+    print("Loaded %d files, %d rows in %f seconds. Avg %f rows/sec" %
+          (len(results), rows, passed, float(rows) / passed if passed else 0.0))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help="Directory with the CSV files to load, each with a header line")
+    sinks = parser.add_mutually_exclusive_group(required=True)
+    sinks.add_argument('--mongo', metavar="DATABASE", help="Load into this MongoDB database")
+    sinks.add_argument('--sqlite', metavar="PATH", help="Load into this SQLite database file")
+    parser.add_argument('--uri', default="mongodb://localhost:27017", help="MongoDB connection string")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of files loaded at the same time. Defaults to the number of cores")
+    parser.add_argument('--batchsize', type=int, default=defaultbatchsize, help="Number of rows inserted at once")
+    parser.add_argument('--index', action='append', default=[],
+                        help="Index created after the load, as table:column[,column...]. Can be given more than once")
+    parser.add_argument('--drop', action='store_true', help="Drop every table or collection before loading it")
+    parser.add_argument('--ignoreblanks', action='store_true',
+                        help="Leave empty fields out of the MongoDB documents instead of loading empty strings")
+
+    args = parser.parse_args()
+
+    if args.batchsize < 1:
+        parser.error("--batchsize has to be at least 1")
+
+    try:
+        indexspecs = parse_indexes(args.index)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.mongo is not None:
+        sink = MongoSink(args.mongo, args.uri, args.drop, args.ignoreblanks)
+    else:
+        sink = SQLiteSink(args.sqlite, args.drop)
+
+    loadcsvfiles(args.directory.rstrip("/") or "/", sink, args.workers, args.batchsize, indexspecs)
@@ -0,0 +1,58 @@
+import io
+
+from tsqldeferred import defer_batch, defer_schema_file
+
+schema = '''CREATE TABLE [dbo].[Orders](
+	[Key] [int] NOT NULL,
+	[Date] [datetime] NULL,
+	[Value] [money] NULL,
+ CONSTRAINT [PK_Orders] PRIMARY KEY CLUSTERED
+(
+	[Key] ASC
+)WITH (PAD_INDEX = OFF, STATISTICS_NORECOMPUTE = OFF) ON [PRIMARY]
+) ON [PRIMARY]
+GO
+CREATE NONCLUSTERED INDEX [IX_Orders_Date] ON [dbo].[Orders]
+(
+	[Date] ASC
+)
+INCLUDE ( 	[Value]) WITH (PAD_INDEX = OFF) ON [PRIMARY]
+GO
+ALTER TABLE [dbo].[Orders] ADD  DEFAULT (getdate()) FOR [Date]
+GO
+ALTER TABLE [dbo].[Orders] ADD  CONSTRAINT [DF_Orders_Value] DEFAULT (CAST(0 AS money)) FOR [Value]
+GO
+ALTER TABLE [dbo].[Orders]  WITH CHECK ADD  CONSTRAINT [FK_Orders_Keys] FOREIGN KEY([Key])
+REFERENCES [dbo].[Keys] ([Key])
+GO
+ALTER TABLE [dbo].[Orders] CHECK CONSTRAINT [FK_Orders_Keys]
+GO
+'''
+
+
+def test_keyword_columns_are_quoted_as_in_the_table():
+    results = defer_batch(schema)
+
+    assert results[0] == ("table", 'CREATE TABLE dbo.Orders(\n\t"Key" int NOT NULL,\n\t"Date" datetime NULL,\n'
+                                   '\t"Value" money NULL\n)')
+    assert results[1:] == [
+        ("postload", 'ALTER TABLE dbo.Orders ADD CONSTRAINT PK_Orders PRIMARY KEY ("Key")'),
+        ("postload", 'CREATE INDEX IX_Orders_Date ON dbo.Orders ("Date")'),
+        ("postload", 'ALTER TABLE dbo.Orders ALTER COLUMN "Date" SET DEFAULT (CURRENT_TIMESTAMP)'),
+        ("postload", 'ALTER TABLE dbo.Orders ALTER COLUMN "Value" SET DEFAULT (CAST(0 AS money))'),
+        ("foreignkey", 'ALTER TABLE dbo.Orders ADD CONSTRAINT FK_Orders_Keys FOREIGN KEY("Key") '
+                       'REFERENCES dbo.Keys ("Key")')]
+
+
+def test_foreign_keys_come_last(tmp_path):
+    filename = tmp_path / "schema.sql"
+    filename.write_text(schema)
+    (output, postload) = (io.StringIO(), io.StringIO())
+
+    defer_schema_file(str(filename), output, postload)
+
+    statements = [line for line in postload.getvalue().splitlines() if line and not line.startswith("--")]
+
+    assert len(statements) == 5
+    assert statements[-1].startswith("ALTER TABLE dbo.Orders ADD CONSTRAINT FK_Orders_Keys FOREIGN KEY")
+    assert "PRIMARY KEY" not in output.getvalue()
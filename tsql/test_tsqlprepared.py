@@ -0,0 +1,75 @@
+import csv
+import os
+
+from tsqlprepared import prepare_batch, placeholders, export_prepared
+
+
+def prepare(query, dialect="postgres"):
+    (template, parameters) = prepare_batch(query)
+
+    return (placeholders(template, dialect), parameters)
+
+
+def test_value_literals_are_parameters():
+    assert prepare("select a from t where b = 5 and c = N'x, y'") == \
+        ("select a from t where b = $1 and c = $2", ["5", "'x, y'"])
+
+
+def test_string_parameters_stay_strings():
+    assert prepare("select a from t where b = '5' and c = 5 and d = 'it''s'") == \
+        ("select a from t where b = $1 and c = $2 and d = $3", ["'5'", "5", "'it''s'"])
+
+
+def test_in_list_literals_are_parameters_of_their_own():
+    assert prepare("select a from t where b in (1, 2, 3)") == \
+        ("select a from t where b in ($1, $2, $3)", ["1", "2", "3"])
+
+
+def test_type_lengths_stay_in_template():
+    assert prepare("select CAST(b AS varchar(20)) from t where c = 1") == \
+        ("select CAST(b AS varchar(20)) from t where c = $1", ["1"])
+
+
+def test_type_precision_and_scale_stay_in_template():
+    assert prepare("select CAST(b AS decimal(18, 2)), CONVERT(nvarchar(10), c) from t where d = 2.5") == \
+        ("select CAST(b AS decimal(18, 2)), CONVERT(nvarchar(10), c) from t where d = $1", ["2.5"])
+
+
+def test_order_by_column_numbers_stay_in_template():
+    assert prepare("select a, b from t where c = 3 order by 2 desc, 1") == \
+        ("select a, b from t where c = $1 order by 2 desc, 1", ["3"])
+
+
+def test_group_by_column_numbers_stay_in_template():
+    assert prepare("select a, count(*) from t where c = 3 group by 1 having count(*) > 4") == \
+        ("select a, count(*) from t where c = $1 group by 1 having count(*) > $2", ["3", "4"])
+
+
+def test_top_stays_in_template():
+    assert prepare("select top 10 a from t where b = 1") == ("select top 10 a from t where b = $1", ["1"])
+    assert prepare("select top (5) a from t where b = 1") == ("select top (5) a from t where b = $1", ["1"])
+
+
+def test_question_mark_placeholders():
+    assert prepare("select top 10 a from t where b = 1 order by 1", "mysql") == \
+        ("select top 10 a from t where b = ? order by 1", ["1"])
+
+
+def test_export_keys_parameters_by_template(tmp_path):
+    trace = tmp_path / "trace.sql"
+    trace.write_text("exec sp_executesql N'SELECT a FROM t WHERE b = @P1 ORDER BY 1',N'@P1 int',@P1=7\n"
+                     "go\n"
+                     "select a from t where b = 8 order by 1\n"
+                     "go\n")
+
+    assert export_prepared(str(trace), str(tmp_path / "out"), "postgres") == (2, 2)
+
+    with open(os.path.join(str(tmp_path / "out"), "templates.csv")) as file:
+        templates = list(csv.reader(file))
+
+    with open(os.path.join(str(tmp_path / "out"), "parameters.csv")) as file:
+        parameters = list(csv.reader(file))
+
+    assert templates == [["id", "count", "template"], ["1", "1", "SELECT a FROM t WHERE b = $1 ORDER BY 1"],
+                         ["2", "1", "select a from t where b = $1 order by 1"]]
+    assert parameters == [["1", "7"], ["2", "8"]]
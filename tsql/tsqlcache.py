@@ -0,0 +1,132 @@
+import hashlib
+import inspect
+import pickle
+import sqlite3
+import time
+
+'''
+Persistent cache of converted GO batches, so that converting a script or trace again only
+converts the batches that changed. Results are kept in an SQLite database, keyed by the hash of
+the text of the batch and of the version of the converter, the version being a hash of the
+source of the converter modules: changing a converter makes its old results unreachable, and
+they are evicted like any other unused result.
+
+The cache is only used from the process that reads the input, workers never touch it. Once the
+database grows over maxsize bytes of results, the least recently used results are evicted when
+the cache is closed.
+'''
+
+
+'''
+Version of the converter made of modules, the hash of their source
+'''
+
+
+def source_version(*modules):
+    digest = hashlib.sha256()
+
+    for module in modules:
+        with open(inspect.getsourcefile(module), "rb") as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+# Results put, or read, between writes to the database
+commitevery = 1000
+
+
+class BatchCache:
+    '''
+    Cache of the results of one converter, version, in the database at path.
+    '''
+
+    def __init__(self, path, version, maxsize=256 << 20):
+        self.path = path
+        self.version = version
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.used = []
+        self.puts = 0
+        self.connection = sqlite3.connect(path, timeout=600)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, size INTEGER, "
+                                "used REAL, value BLOB)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def key(self, text):
+        return hashlib.sha256(("%s\0%s" % (self.version, text)).encode("utf-8")).hexdigest()
+
+    '''
+    Returns whether the result of key is cached, and the result
+    '''
+
+    def get(self, key):
+        row = self.connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return (False, None)
+
+        self.hits += 1
+        self.used.append(key)
+
+        if len(self.used) >= commitevery:
+            self.record_used()
+
+        return (True, pickle.loads(row[0]))
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                (key, len(data), time.time(), data))
+        self.puts += 1
+
+        # Commit now and then, so an interrupted conversion keeps most of its results
+        if self.puts % commitevery == 0:
+            self.connection.commit()
+
+    '''
+    Records the use of the results read, evicts the least recently used results over maxsize and
+    closes the database
+    '''
+
+    def close(self):
+        with self.connection:
+            self.record_used()
+            self.evict()
+
+        self.connection.close()
+
+    def record_used(self):
+        now = time.time()
+        self.connection.executemany("UPDATE results SET used = ? WHERE key = ?", ((now, key) for key in self.used))
+        self.used = []
+
+    def evict(self):
+        (total,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+
+        if total <= self.maxsize:
+            return
+
+        evicted = []
+
+        for (key, size) in self.connection.execute("SELECT key, size FROM results ORDER BY used"):
+            if total <= self.maxsize:
+                break
+
+            evicted.append((key,))
+            total -= size
+
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def hitrate(self):
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
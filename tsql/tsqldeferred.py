@@ -0,0 +1,288 @@
+from tsqllexer import tokenize, iter_batches, iter_statements, is_significant, significant_words, render, whitespace
+from tsqlparallel import ordered_map
+from tsqlschemaconverter import statement_tokens, convert_tokens, join_statements, quotedkeywords
+
+'''
+Schema conversion for bulk loads. Instead of one script, the schema is converted in two:
+
+- the tables, with their columns only, to create before loading the data
+- the post-load script, with everything that slows a load down or that the data has to satisfy:
+  the primary keys and unique constraints of the tables, the indexes, and the ALTER TABLE
+  statements (defaults, checks and foreign keys) that the plain conversion leaves out
+
+Every post-load statement is on a line of its own and stands on its own, so the statements can be
+run concurrently once the data is loaded. Foreign keys need the primary keys and unique
+constraints they reference, so they come last, in a part of their own, to run once the first
+part is done.
+
+The ALTER TABLE statements are converted to statements MySQL, PostgreSQL and MonetDB understand:
+WITH CHECK and WITH NOCHECK are removed, ADD DEFAULT ... FOR column becomes ALTER COLUMN column
+SET DEFAULT ..., and CHECK CONSTRAINT and NOCHECK CONSTRAINT, which only enable or disable a
+constraint, are left out. Of the default expressions, only getdate() and sysdatetime() are
+translated, to CURRENT_TIMESTAMP. Other T-SQL functions in a default or a check are copied as they
+are.
+
+The column names that are keywords are quoted in every post-load statement, as they are in the
+tables, also in column lists such as FOREIGN KEY(Key) where the plain conversion leaves them.
+'''
+
+header = "-- Post-load statements, to run once the data is loaded. The statements of a part are independent\n" \
+         "-- and can run concurrently.\n\n"
+
+foreignkeysheader = "\n-- Foreign keys, to run once the statements above are done\n\n"
+
+# T-SQL functions of default expressions and what they become
+defaultfunctions = {"GETDATE": "CURRENT_TIMESTAMP", "SYSDATETIME": "CURRENT_TIMESTAMP"}
+
+
+'''
+Returns the text of tokens on one line, whitespace and comments becoming a single space, except
+after an opening and before a closing parenthesis
+'''
+
+
+def compact(tokens):
+    result = []
+    space = False
+
+    for token in tokens:
+        if not is_significant(token):
+            space = True
+            continue
+
+        if space and result and result[-1] != "(" and token[1] not in (")", ","):
+            result.append(" ")
+
+        result.append(token[1])
+        space = False
+
+    return "".join(result)
+
+
+'''
+Splits the tokens of the parentheses starting at position start at their commas. Returns the
+items and the position of the closing parenthesis.
+'''
+
+
+def split_items(tokens, start):
+    items = [[]]
+    depth = 0
+
+    for i in range(start + 1, len(tokens)):
+        token = tokens[i]
+
+        if token == ("punct", "(") or (token == ("punct", ")") and depth > 0):
+            depth += 1 if token[1] == "(" else -1
+        elif token == ("punct", ")"):
+            return (items, i)
+        elif token == ("punct", ",") and depth == 0:
+            items.append([])
+            continue
+
+        items[-1].append(token)
+
+    return (items, None)
+
+
+'''
+Quotes the column names that are keywords inside the parentheses of tokens, where the column
+lists are
+'''
+
+
+def quote_columns(tokens):
+    result = []
+    depth = 0
+
+    for token in tokens:
+        if token in (("punct", "("), ("punct", ")")):
+            depth += 1 if token[1] == "(" else -1
+        elif depth > 0 and token[0] == "word" and token[1] in quotedkeywords:
+            token = ("quoted", '"%s"' % token[1])
+
+        result.append(token)
+
+    return result
+
+
+'''
+Translates the calls of the functions in defaultfunctions in the tokens of a default expression
+'''
+
+
+def translate_default(tokens):
+    positions = [i for (i, token) in enumerate(tokens) if is_significant(token)]
+    result = list(tokens)
+
+    for (k, i) in reversed(list(enumerate(positions[:-2]))):
+        if tokens[i][0] == "word" and tokens[i][1].upper() in defaultfunctions and \
+                [tokens[j] for j in positions[k + 1:k + 3]] == [("punct", "("), ("punct", ")")]:
+            result[i:positions[k + 2] + 1] = [("word", defaultfunctions[tokens[i][1].upper()])]
+
+    return result
+
+
+def is_key_constraint(item):
+    words = significant_words(item, 4)
+
+    if words[:1] == ["CONSTRAINT"]:
+        words = significant_words([token for token in item if is_significant(token)][2:], 2)
+
+    return words[:2] == ["PRIMARY", "KEY"] or words[:1] == ["UNIQUE"]
+
+
+'''
+Moves the primary keys and unique constraints out of a converted CREATE TABLE statement. Returns
+the statement without them and the ALTER TABLE statements adding them.
+'''
+
+
+def defer_table_constraints(text):
+    tokens = tokenize(text)
+    start = tokens.index(("punct", "("))
+    (items, end) = split_items(tokens, start)
+
+    if end is None:
+        return (text, [])
+
+    name = compact(tokens[:start]).split(None, 2)[2]
+    kept = [item for item in items if not is_key_constraint(item)]
+    deferred = ["ALTER TABLE %s ADD %s" % (name, compact(quote_columns(item))) for item in items
+                if is_key_constraint(item)]
+
+    if not deferred or not kept:
+        return (text, [])
+
+    # The whitespace before the closing parenthesis stays
+    trailing = []
+
+    while items[-1] and items[-1][-1][0] in whitespace:
+        trailing.insert(0, items[-1].pop())
+
+    while kept[-1] and kept[-1][-1][0] in whitespace:
+        kept[-1].pop()
+
+    columns = ",".join(render(item) for item in kept)
+
+    return (render(tokens[:start + 1]) + columns + render(trailing) + render(tokens[end:]), deferred)
+
+
+'''
+Converts a converted ALTER TABLE statement for the post-load script. Returns its kind, "postload"
+or "foreignkey", and the statement, or None when it is left out.
+'''
+
+
+def defer_alter_table(text):
+    tokens = tokenize(text)
+    positions = [i for (i, token) in enumerate(tokens) if is_significant(token)]
+    words = [tokens[i][1].upper() for i in positions]
+    # ALTER TABLE, then the name of the table, then j the position of the word after it
+    j = 3
+
+    while j + 1 < len(words) and words[j] == ".":
+        j += 2
+
+    name = compact(tokens[positions[2]:positions[j - 1] + 1])
+    tokens = tokens[:positions[j - 1] + 1] + quote_columns(tokens[positions[j - 1] + 1:])
+
+    if words[j:j + 2] in (["WITH", "CHECK"], ["WITH", "NOCHECK"]):
+        j += 2
+
+    if j >= len(words) or words[j:j + 2] in (["CHECK", "CONSTRAINT"], ["NOCHECK", "CONSTRAINT"]):
+        return None
+
+    if words[j] != "ADD":
+        return ("postload", "ALTER TABLE %s %s" % (name, compact(tokens[positions[j]:])))
+
+    added = j + 1
+    constraint = added + 2 if words[added:added + 1] == ["CONSTRAINT"] else added
+    kind = words[constraint] if constraint < len(words) else None
+
+    if kind == "DEFAULT" and "FOR" in words[constraint:]:
+        column = len(words) - words[::-1].index("FOR")
+        default = compact(translate_default(tokens[positions[constraint + 1]:positions[column - 1]]))
+        # The column after FOR is outside the parentheses quote_columns looks in
+        columnname = compact(quote_columns([("punct", "(")] + tokens[positions[column]:])[1:])
+
+        return ("postload", "ALTER TABLE %s ALTER COLUMN %s SET DEFAULT %s" % (name, columnname, default))
+
+    statement = "ALTER TABLE %s ADD %s" % (name, compact(tokens[positions[added]:]))
+
+    return ("foreignkey" if kind == "FOREIGN" else "postload", statement)
+
+
+'''
+Converts one statement for a bulk load. Returns a list of (kind, statement), kind being "table"
+for the statements creating the tables and "postload" or "foreignkey" for the post-load ones.
+'''
+
+
+def defer_statement(statement):
+    tokens = statement_tokens(statement)
+    words = significant_words(tokens, 4)
+
+    if not words or words[0] in ("USE", "SET"):
+        return []
+
+    text = convert_tokens(tokens, words)
+
+    if text is None:
+        return []
+
+    if words[:2] == ["ALTER", "TABLE"]:
+        deferred = defer_alter_table(text)
+
+        return [] if deferred is None else [deferred]
+
+    if words[:2] == ["CREATE", "TABLE"]:
+        (table, constraints) = defer_table_constraints(text)
+
+        return [("table", table)] + [("postload", constraint) for constraint in constraints]
+
+    if words[0] == "CREATE" and "INDEX" in words[1:]:
+        tokens = tokenize(text)
+        start = tokens.index(("punct", "("))
+
+        return [("postload", compact(tokens[:start] + quote_columns(tokens[start:])))]
+
+    return [("table", text)]
+
+
+def defer_batch(batch):
+    return [result for statement in iter_statements(batch) for result in defer_statement(statement)]
+
+
+'''
+Converts the script at filename for a bulk load, writing the tables to output and the post-load
+script to postload as it goes, the foreign keys once the whole script is read. The batches are
+converted in workers processes, or taken from cache when given.
+'''
+
+
+def defer_schema_file(filename, output, postload, workers=1, cache=None):
+    foreignkeys = []
+    postload.write(header)
+
+    def tables(results):
+        for (kind, text) in results:
+            if kind == "table":
+                yield (text, False)
+            elif kind == "foreignkey":
+                foreignkeys.append(text)
+            else:
+                postload.write(text + ";\n")
+
+    with open(filename, "r") as file:
+        results = (result for deferred in ordered_map(defer_batch, iter_batches(file), workers, cache)
+                   for result in deferred)
+
+        for piece in join_statements(tables(results)):
+            output.write(piece)
+
+    if foreignkeys:
+        postload.write(foreignkeysheader)
+
+        for text in foreignkeys:
+            postload.write(text + ";\n")
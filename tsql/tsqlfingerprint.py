@@ -0,0 +1,304 @@
+from tsqllexer import tokenize, whitespace
+from tsqlparallel import ordered_map
+from tsqlworkloadtosql import iter_batches, transform_batch
+
+import argparse
+import json
+import os
+import random
+import re
+
+'''
+Fingerprints the queries of a converted workload: the literals of a query are replaced by ?, a
+list of literals after IN by a single ?, and whitespace and comments by a single space. Queries
+with the same template only differ in their literal values, the parameters of the template.
+
+Only literals in the place of a value are parameters. The length, precision and scale of types
+(varchar(20), decimal(18, 2)), the column numbers of ORDER BY and GROUP BY and the number of rows
+of TOP stay in the template: they are no values, a database can not prepare a statement with a
+placeholder there, and ORDER BY ? would sort by a constant instead of by a column.
+
+The distinct templates are written with the number of queries they stand for and a few sample
+parameter sets, picked at random over all their queries. A replay can then run a subset of the
+workload in which every template has its share of the queries, instead of the whole workload.
+'''
+
+numberregex = re.compile(r'^(0x[0-9a-f]*|\d+(e\d+)?)$', re.I)
+
+# Types with a length, precision or scale in parentheses, which are no values
+typenames = ("CHAR", "VARCHAR", "NCHAR", "NVARCHAR", "BINARY", "VARBINARY", "DECIMAL", "NUMERIC", "FLOAT",
+             "DATETIME2", "DATETIMEOFFSET", "TIME")
+
+# Words that end the column list of an ORDER BY or GROUP BY
+clausewords = ("SELECT", "FROM", "WHERE", "HAVING", "UNION", "EXCEPT", "INTERSECT", "OPTION", "FOR", "OFFSET",
+               "FETCH", "LIMIT")
+
+# Sample parameter sets kept per template
+samplecount = 5
+
+
+def is_literal(token):
+    return token[0] == "string" or (token[0] == "word" and numberregex.match(token[1]) is not None)
+
+
+'''
+Returns the position after the literal starting at position i of tokens, a decimal number being
+the tokens of its integral part, the point and its fractional part, or None when there is none
+'''
+
+
+def match_literal(tokens, i):
+    if not is_literal(tokens[i]):
+        return None
+
+    if i + 2 < len(tokens) and tokens[i][0] == "word" and tokens[i + 1] == ("punct", ".") and \
+            tokens[i + 2][0] == "word" and numberregex.match(tokens[i + 2][1]) is not None:
+        return i + 3
+
+    return i + 1
+
+
+'''
+Returns the position after the list of literals, with its parentheses, starting at position i of
+tokens, or None when there is none
+'''
+
+
+def match_literal_list(tokens, i):
+    if tokens[i] != ("punct", "("):
+        return None
+
+    i = skip_whitespace(tokens, i + 1)
+
+    while i < len(tokens):
+        end = match_literal(tokens, i)
+
+        if end is None:
+            return None
+
+        i = skip_whitespace(tokens, end)
+
+        if i < len(tokens) and tokens[i] == ("punct", ")"):
+            return i + 1
+
+        if i >= len(tokens) or tokens[i] != ("punct", ","):
+            return None
+
+        i = skip_whitespace(tokens, i + 1)
+
+    return None
+
+
+'''
+Returns the positions of the literals of tokens that are no values, see above
+'''
+
+
+def fixed_literals(tokens):
+    significant = [i for (i, token) in enumerate(tokens)
+                   if token[0] not in whitespace and token[0] not in ("comment", "linecomment")]
+    fixed = set()
+    # Per open parenthesis, whether it holds the length, precision or scale of a type
+    parentheses = []
+    # Depths of the parentheses with an ORDER BY or GROUP BY column list
+    orderby = set()
+
+    for (n, i) in enumerate(significant):
+        token = tokens[i]
+        word = token[1].upper() if token[0] == "word" else None
+        previous = tokens[significant[n - 1]] if n > 0 else ("", "")
+        following = tokens[significant[n + 1]] if n + 1 < len(significant) else ("punct", ";")
+
+        if token == ("punct", "("):
+            parentheses.append(previous[0] == "word" and previous[1].upper() in typenames)
+        elif token == ("punct", ")"):
+            orderby.discard(len(parentheses))
+
+            if parentheses:
+                parentheses.pop()
+        elif token == ("punct", ";"):
+            orderby.clear()
+        elif word == "BY" and previous[0] == "word" and previous[1].upper() in ("ORDER", "GROUP"):
+            orderby.add(len(parentheses))
+        elif word in clausewords:
+            orderby.discard(len(parentheses))
+
+        if not is_literal(token):
+            continue
+
+        if parentheses and parentheses[-1]:
+            fixed.add(i)
+        elif previous[0] == "word" and previous[1].upper() == "TOP":
+            fixed.add(i)
+        elif previous == ("punct", "(") and n > 1 and tokens[significant[n - 2]][0] == "word" and \
+                tokens[significant[n - 2]][1].upper() == "TOP":
+            fixed.add(i)
+        elif len(parentheses) in orderby and (previous == ("punct", ",") or previous[1].upper() == "BY") and \
+                (following[0] == "word" or following[1] in (",", ")", ";")):
+            # A column number: a whole item of the list, not part of an expression
+            fixed.add(i)
+
+    return fixed
+
+
+def skip_whitespace(tokens, i):
+    while i < len(tokens) and (tokens[i][0] in whitespace or tokens[i][0] in ("comment", "linecomment")):
+        i += 1
+
+    return i
+
+
+'''
+Returns the template of query and its parameters, the literal texts in the order of the ? of the
+template. The parameter of an IN list is the text of the literals, without the parentheses. With
+inlists False, the literals of IN lists are parameters of their own.
+'''
+
+
+def fingerprint(query, inlists=True):
+    tokens = tokenize(query)
+    fixed = fixed_literals(tokens)
+    template = []
+    parameters = []
+    previous = None
+    i = 0
+
+    while i < len(tokens):
+        token = tokens[i]
+
+        if token[0] in whitespace or token[0] in ("comment", "linecomment"):
+            i = skip_whitespace(tokens, i)
+
+            if template and i < len(tokens):
+                template.append(" ")
+
+            continue
+
+        end = None
+
+        if inlists and previous is not None and previous[0] == "word" and previous[1].upper() == "IN":
+            end = match_literal_list(tokens, i)
+
+            if end is not None:
+                parameters.append("".join(text for (kind, text) in tokens[i + 1:end - 1]).strip())
+                template.append("(?)")
+
+        if end is None and i not in fixed:
+            end = match_literal(tokens, i)
+
+            if end is not None:
+                parameters.append("".join(text for (kind, text) in tokens[i:end]))
+                template.append("?")
+
+        if end is None:
+            template.append(token[1])
+            end = i + 1
+
+        previous = token
+        i = end
+
+    return ("".join(template), parameters)
+
+
+'''
+Transforms and fingerprints one batch of a trace, see transform_batch
+'''
+
+
+def fingerprint_batch(batch):
+    query = transform_batch(batch)
+
+    return None if query is None else fingerprint(query)
+
+
+'''
+Fills the templates of a workload from its fingerprints. Every template keeps its number of
+queries and up to samplecount parameter sets, sampled uniformly over its queries (reservoir
+sampling), random being seeded so the samples are the same on every run.
+'''
+
+
+def collect_templates(fingerprints, seed=0):
+    generator = random.Random(seed)
+    templates = {}
+
+    for (template, parameters) in fingerprints:
+        entry = templates.get(template)
+
+        if entry is None:
+            entry = templates[template] = {"template": template, "count": 0, "samples": []}
+
+        entry["count"] += 1
+
+        if len(entry["samples"]) < samplecount:
+            entry["samples"].append(parameters)
+        else:
+            j = generator.randrange(entry["count"])
+
+            if j < samplecount:
+                entry["samples"][j] = parameters
+
+    return sorted(templates.values(), key=lambda entry: -entry["count"])
+
+
+def iter_fingerprints(filename, workers=1):
+    with open(filename, "r") as file:
+        for result in ordered_map(fingerprint_batch, iter_batches(file), workers):
+            if result is not None:
+                yield result
+
+
+def bind_template(template, parameters):
+    parameters = iter(parameters)
+
+    return "".join(next(parameters) if text == "?" else text for (kind, text) in tokenize(template))
+
+
+'''
+Picks size queries over the templates, every template getting its share of size by its count
+(largest remainder, so the sizes add up), and binding the samples of a template in turn
+'''
+
+
+def weighted_subset(templates, size):
+    total = sum(entry["count"] for entry in templates)
+
+    if total == 0:
+        return []
+
+    shares = [(size * entry["count"] / total, entry) for entry in templates]
+    counts = [int(share) for (share, entry) in shares]
+    remainders = sorted(range(len(shares)), key=lambda i: -(shares[i][0] - counts[i]))
+
+    for i in remainders[:size - sum(counts)]:
+        counts[i] += 1
+
+    queries = []
+
+    for (count, (share, entry)) in zip(counts, shares):
+        for j in range(count):
+            queries.append(bind_template(entry["template"], entry["samples"][j % len(entry["samples"])]))
+
+    return queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', help="SQL Profiler trace to transform and fingerprint")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes transforming queries")
+    parser.add_argument('--subset', type=int,
+                        help="Print a weighted subset of this many queries instead of the templates")
+
+    args = parser.parse_args()
+
+    templates = collect_templates(iter_fingerprints(args.filename, args.workers))
+
+    if args.subset is not None:
+        for query in weighted_subset(templates, args.subset):
+            print(query)
+    else:
+        total = sum(entry["count"] for entry in templates)
+
+        for entry in templates:
+            entry["weight"] = entry["count"] / total
+            print(json.dumps(entry))
@@ -0,0 +1,159 @@
+import re
+
+'''
+Tokenizer for T-SQL scripts. One regex matches every kind of token, so a script is scanned once
+from start to end: comments, strings and bracketed identifiers are recognized as a whole and
+their contents can never be mistaken for keywords, brackets or statement ends.
+
+Tokens are (kind, text) pairs, the kinds being the group names of tokenregex. Joining the texts
+of all tokens gives back the original text.
+'''
+
+tokenregex = re.compile(r"""
+    (?P<comment>/\*.*?\*/)
+  | (?P<linecomment>--[^\n]*)
+  | (?P<string>[Nn]?'[^']*(?:''[^']*)*')
+  | (?P<bracket>\[[^\]\n]*(?:\]\][^\]\n]*)*\])
+  | (?P<quoted>"[^"\n]*(?:""[^"\n]*)*")
+  | (?P<word>[\w@#$]+)
+  | (?P<newline>\n)
+  | (?P<space>[^\S\n]+)
+  | (?P<punct>.)
+""", re.S | re.X)
+
+whitespace = ("space", "newline")
+
+# Words at the start of a line that start a new statement
+statementwords = ("CREATE", "ALTER", "USE", "SET")
+
+# Statements that only last until the end of their line
+linestatements = ("USE", "SET")
+
+goregex = re.compile(r'GO[^\S\n]*$', re.I)
+
+
+def tokenize(text):
+    return [(match.lastgroup, match.group()) for match in tokenregex.finditer(text)]
+
+
+'''
+Splits a script in statements, without tokenizing more than needed to find their ends. A
+statement ends at a ; outside of parentheses, at a GO line (the GO is left out) and before a
+CREATE, ALTER, USE or SET at the start of a line. USE and SET statements end with their line.
+'''
+
+
+def iter_statements(text):
+    start = 0
+    depth = 0
+    linestart = True
+    endofline = False
+
+    for match in tokenregex.finditer(text):
+        kind = match.lastgroup
+
+        if kind == "newline":
+            if endofline:
+                yield text[start:match.end()]
+                start = match.end()
+                endofline = False
+
+            linestart = True
+            continue
+
+        if kind == "word" and linestart:
+            word = match.group().upper()
+
+            if word == "GO":
+                yield text[start:match.start()]
+                start = match.end()
+                depth = 0
+            elif word in statementwords and depth == 0:
+                yield text[start:match.start()]
+                start = match.start()
+                endofline = word in linestatements
+        elif kind == "punct":
+            char = match.group()
+
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth = max(0, depth - 1)
+            elif char == ";" and depth == 0:
+                yield text[start:match.end()]
+                start = match.end()
+                endofline = False
+
+        linestart = False
+
+    if start < len(text):
+        yield text[start:]
+
+
+'''
+Splits the lines of a script in batches at the GO lines, so a script can be converted without
+reading it as a whole. A batch is only ended when no comment or string is left open in it, as
+iter_statements does, so iter_statements gives the same statements for the batches as for the
+whole script.
+'''
+
+
+def iter_batches(lines):
+    batch = []
+
+    for line in lines:
+        batch.append(line)
+
+        if goregex.match(line):
+            text = "".join(batch)
+
+            if not is_open(text):
+                yield text
+                batch = []
+
+    if batch:
+        yield "".join(batch)
+
+
+'''
+Whether a comment or a string is still open at the end of text
+'''
+
+
+def is_open(text):
+    if "'" not in text and "/*" not in text:
+        return False
+
+    tokens = tokenize(text)
+
+    for (i, token) in enumerate(tokens):
+        if token == ("punct", "'"):
+            return True
+
+        if token == ("punct", "/") and i + 1 < len(tokens) and tokens[i + 1] == ("punct", "*"):
+            return True
+
+    return False
+
+
+def is_significant(token):
+    return token[0] not in whitespace and token[0] not in ("comment", "linecomment")
+
+
+def significant_words(tokens, count):
+    words = []
+
+    for token in tokens:
+        if token[0] == "word":
+            words.append(token[1].upper())
+
+            if len(words) == count:
+                break
+        elif is_significant(token):
+            break
+
+    return words
+
+
+def render(tokens):
+    return "".join(text for (kind, text) in tokens)
@@ -0,0 +1,108 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+'''
+Ordered, lazy map over a pool of worker processes, for the scripts and traces that are too large
+to hold in memory. Items are sent to the workers in chunks, and only a few chunks per worker are
+read ahead of the results taken, so the memory used is bounded by the chunks in flight, not by
+the input.
+'''
+
+# Characters of items sent to a worker at once
+chunksize = 1 << 16
+
+# Chunks sent ahead per worker
+readahead = 4
+
+
+def apply_chunk(function, items):
+    return [function(item) for item in items]
+
+
+def iter_chunks(items):
+    chunk = []
+    size = 0
+
+    for item in items:
+        chunk.append(item)
+        size += len(item)
+
+        if size >= chunksize:
+            yield chunk
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield chunk
+
+
+'''
+Looks the items of chunk up in cache. Returns their keys, the (hit, result) of every item and the
+items that were not found.
+'''
+
+
+def lookup_chunk(chunk, cache):
+    if cache is None:
+        return (None, [(False, None)] * len(chunk), chunk)
+
+    keys = [cache.key(item) for item in chunk]
+    found = [cache.get(key) for key in keys]
+
+    return (keys, found, [item for (item, (hit, result)) in zip(chunk, found) if not hit])
+
+
+'''
+Yields the results of a chunk, the ones found in the cache and the computed ones of the others,
+which are put in the cache
+'''
+
+
+def merge_chunk(keys, found, computed, cache):
+    computed = iter(computed)
+
+    for (i, (hit, result)) in enumerate(found):
+        if not hit:
+            result = next(computed)
+
+            if cache is not None:
+                cache.put(keys[i], result)
+
+        yield result
+
+
+'''
+Yields function(item) for the (text) items, in the order of the items, the items being processed
+in workers processes. function has to be a module level function, to be sent to the workers. With
+a cache (see tsqlcache.py), only the items it has no result for are processed.
+'''
+
+
+def ordered_map(function, items, workers, cache=None):
+    if workers <= 1:
+        for chunk in iter_chunks(items):
+            (keys, found, missing) = lookup_chunk(chunk, cache)
+            yield from merge_chunk(keys, found, apply_chunk(function, missing), cache)
+
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        for chunk in iter_chunks(items):
+            (keys, found, missing) = lookup_chunk(chunk, cache)
+            future = executor.submit(partial(apply_chunk, function), missing) if missing else None
+            pending.append((keys, found, future))
+
+            if len(pending) >= workers * readahead:
+                yield from merge_pending(pending.popleft(), cache)
+
+        while pending:
+            yield from merge_pending(pending.popleft(), cache)
+
+
+def merge_pending(entry, cache):
+    (keys, found, future) = entry
+
+    return merge_chunk(keys, found, [] if future is None else future.result(), cache)
@@ -0,0 +1,115 @@
+from tsqllexer import tokenize, is_significant, render
+
+'''
+Binds the parameters of sp_executesql calls, as found in traces of SQL Server workloads:
+
+    exec sp_executesql N'SELECT ... WHERE a = @P1 AND b = @P10',N'@P1 int,@P10 nvarchar(20)',@P1=5,@P10=N'x, y'
+
+The call is tokenized once. The values are read from the tokens of the parameter list, so a
+string value containing commas or quotes stays whole, and the statement is then unquoted and
+tokenized once more to replace every parameter by its value in the same pass. As @P10 is a token
+of its own it is never mistaken for @P1 followed by a 0, and parameters in strings are left alone.
+'''
+
+
+'''
+Returns the statement of the sp_executesql call in query, with its parameters replaced by their
+values, or None when query is no sp_executesql call. Text before the call is kept, text after it
+is left out.
+'''
+
+
+def bind_parameters(query):
+    tokens = tokenize(query)
+    call = find_executesql(tokens)
+
+    if call is None:
+        return None
+
+    (begin, end) = call
+    arguments = split_arguments(tokens, end)
+
+    if not arguments or len(arguments[0]) != 1 or arguments[0][0][0] != "string":
+        return None
+
+    statement = unquote(arguments[0][0][1])
+    values = {}
+
+    # arguments[1] holds the declarations of the parameters, the values come after it
+    for argument in arguments[2:]:
+        if len(argument) > 2 and argument[0][0] == "word" and argument[0][1].startswith("@") and \
+                argument[1] == ("punct", "="):
+            values[argument[0][1].upper()] = value_text(argument[2:])
+
+    bound = [(kind, values.get(text.upper(), text)) if kind == "word" else (kind, text)
+             for (kind, text) in tokenize(statement)]
+
+    return render(tokens[:begin]) + render(bound)
+
+
+'''
+Returns the positions of the exec and of the token after sp_executesql of the first exec
+sp_executesql call in tokens
+'''
+
+
+def find_executesql(tokens):
+    previous = None
+
+    for (i, token) in enumerate(tokens):
+        if not is_significant(token):
+            continue
+
+        if token[0] == "word" and token[1].lower() == "sp_executesql" and previous is not None and \
+                tokens[previous][0] == "word" and tokens[previous][1].lower() in ("exec", "execute"):
+            return (previous, i + 1)
+
+        previous = i
+
+    return None
+
+
+'''
+Splits the tokens from start on at the commas outside of parentheses, without the whitespace
+and comments around the arguments
+'''
+
+
+def split_arguments(tokens, start):
+    arguments = []
+    argument = []
+    depth = 0
+
+    for token in tokens[start:]:
+        if token == ("punct", ";") and depth == 0:
+            break
+
+        if token == ("punct", ",") and depth == 0:
+            arguments.append(argument)
+            argument = []
+            continue
+
+        if token == ("punct", "("):
+            depth += 1
+        elif token == ("punct", ")"):
+            depth -= 1
+
+        if is_significant(token):
+            argument.append(token)
+
+    if argument:
+        arguments.append(argument)
+
+    return arguments
+
+
+def unquote(string):
+    return string[string.index("'") + 1:-1].replace("''", "'")
+
+
+def value_text(tokens):
+    # A unicode string value becomes a plain string, as the N prefix means nothing to other databases
+    if len(tokens) == 1 and tokens[0][0] == "string":
+        return tokens[0][1][tokens[0][1].index("'"):]
+
+    return render(tokens)
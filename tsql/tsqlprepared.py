@@ -0,0 +1,104 @@
+from tsqllexer import tokenize
+from tsqlfingerprint import fingerprint
+from tsqlparallel import ordered_map
+from tsqlworkloadtosql import iter_batches, transform_batch
+
+import csv
+import os
+
+'''
+Prepared statement export of a workload. Instead of queries with their values inlined, which a
+database has to parse and plan one by one, the workload is written as:
+
+- templates.csv: id, count and text of every distinct statement, its literals replaced by
+  placeholders (? for MySQL and MonetDB, $1, $2, ... for PostgreSQL)
+- parameters.csv: one row per query of the workload, in order, the id of its template followed by
+  its parameter values
+
+so a replay can prepare every template once and execute it with the values of its queries. The
+literals of IN lists are parameters of their own, the statements with lists of another length
+being other templates. String values are written as the SQL string literals they are, quoted and
+without the N prefix, so a replay can tell the string '5' from the number 5.
+'''
+
+dialects = ("mysql", "postgres", "monetdb")
+
+
+def placeholders(template, dialect):
+    if dialect != "postgres":
+        return template
+
+    result = []
+    count = 0
+
+    for (kind, text) in tokenize(template):
+        if text == "?":
+            count += 1
+            text = "$%d" % count
+
+        result.append(text)
+
+    return "".join(result)
+
+
+def parameter_value(text):
+    if text.endswith("'"):
+        return text[text.index("'"):]
+
+    return text
+
+
+'''
+Transforms one batch of a trace into its template, without the final ;, and parameter values
+'''
+
+
+def prepare_batch(batch):
+    query = transform_batch(batch)
+
+    if query is None:
+        return None
+
+    (template, parameters) = fingerprint(query.rstrip(";").rstrip(), inlists=False)
+
+    return (template, [parameter_value(parameter) for parameter in parameters])
+
+
+'''
+Writes the prepared statement export of the trace at filename to outputdir. The parameters are
+written as the batches are transformed, the templates once the whole trace is read. The batches
+are prepared in workers processes, or taken from cache when given. Returns the number of queries
+and of templates.
+'''
+
+
+def export_prepared(filename, outputdir, dialect, workers=1, cache=None):
+    os.makedirs(outputdir, exist_ok=True)
+    ids = {}
+    counts = []
+
+    with open(filename, "r") as file, open(os.path.join(outputdir, "parameters.csv"), "w", newline="") as output:
+        writer = csv.writer(output)
+
+        for result in ordered_map(prepare_batch, iter_batches(file), workers, cache):
+            if result is None:
+                continue
+
+            (template, parameters) = result
+            id = ids.get(template)
+
+            if id is None:
+                id = ids[template] = len(ids) + 1
+                counts.append(0)
+
+            counts[id - 1] += 1
+            writer.writerow([id] + parameters)
+
+    with open(os.path.join(outputdir, "templates.csv"), "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(["id", "count", "template"])
+
+        for (template, id) in ids.items():
+            writer.writerow([id, counts[id - 1], placeholders(template, dialect)])
+
+    return (sum(counts), len(ids))
@@ -0,0 +1,338 @@
+import re
+
+from tsqllexer import tokenize, iter_batches, iter_statements, is_significant, significant_words, render, whitespace
+from tsqlparallel import ordered_map
+
+'''
+Single pass version of the transform_schema pipeline of tsqlschematosql.py. Instead of running
+every regex of functions.py over the whole script, the script is split in statements once and
+every statement is tokenized and converted on its own, so the time taken grows linearly with the
+size of the script.
+
+The conversions are the ones of the pipeline, on tokens instead of text:
+
+- USE and SET statements, GO lines, comments and ALTER TABLE statements are left out
+- [sysname] becomes nvarchar(128) and the brackets around identifiers are removed
+- WITH (...) ON PRIMARY, CLUSTERED, NONCLUSTERED, TEXTIMAGE_ON and the INCLUDE columns of
+  indexes are removed
+- ASC is removed from the columns of primary keys, unique constraints and indexes
+- the ON PRIMARY at the end of a CREATE TABLE or CREATE INDEX is removed
+- Value, Date and Key are quoted when they are a word on their own
+- every statement ends with ; and statements are separated by an empty line
+
+Unlike the regexes, nothing is changed inside strings, comments or longer identifiers. For the
+scripts SQL Server Management Studio generates the output is the same, except that the ON PRIMARY
+of the last CREATE TABLE before the ALTER TABLE statements is removed as well (the pipeline only
+removes it when another CREATE follows) and that every kept statement ends with a ;.
+'''
+
+removedwords = ("CLUSTERED", "NONCLUSTERED", "TEXTIMAGE_ON")
+
+quotedkeywords = ("Value", "Date", "Key")
+
+newlinesregex = re.compile(r'\n{2,}')
+
+
+def remove_with_on_primary(tokens):
+    result = []
+    i = 0
+
+    while i < len(tokens):
+        end = match_with_on_primary(tokens, i)
+
+        if end is None:
+            result.append(tokens[i])
+            i += 1
+        else:
+            i = end
+
+    return result
+
+
+'''
+Returns the position after WITH (...) ON PRIMARY when it starts at position i of tokens
+'''
+
+
+def match_with_on_primary(tokens, i):
+    if tokens[i][0] != "word" or tokens[i][1].upper() != "WITH":
+        return None
+
+    i = skip_whitespace(tokens, i + 1)
+
+    if i >= len(tokens) or tokens[i] != ("punct", "("):
+        return None
+
+    i = matching_parenthesis(tokens, i)
+
+    if i is None:
+        return None
+
+    i = skip_whitespace(tokens, i + 1)
+
+    if i + 2 < len(tokens) and tokens[i][0] == "word" and tokens[i][1].upper() == "ON" and \
+            tokens[i + 1][0] == "space" and tokens[i + 2][0] == "word" and tokens[i + 2][1].upper() == "PRIMARY":
+        return i + 3
+
+    return None
+
+
+def skip_whitespace(tokens, i):
+    while i < len(tokens) and tokens[i][0] in whitespace:
+        i += 1
+
+    return i
+
+
+def matching_parenthesis(tokens, i):
+    depth = 0
+
+    for j in range(i, len(tokens)):
+        if tokens[j] == ("punct", "("):
+            depth += 1
+        elif tokens[j] == ("punct", ")"):
+            depth -= 1
+
+            if depth == 0:
+                return j
+
+    return None
+
+
+def previous_significant(tokens, i):
+    while i > 0:
+        i -= 1
+
+        if is_significant(tokens[i]):
+            return tokens[i]
+
+    return None
+
+
+'''
+Removes ASC after the column names of the key column lists: the parentheses after PRIMARY KEY
+or UNIQUE, and the first ones of a CREATE INDEX
+'''
+
+
+def remove_asc(tokens, isindex):
+    result = []
+    depth = 0
+    # Depth of the key column list the tokens are in, if any
+    keydepth = None
+    indexcolumns = isindex
+
+    for (i, token) in enumerate(tokens):
+        if token == ("punct", "("):
+            depth += 1
+            previous = previous_significant(tokens, i)
+
+            if keydepth is None and ((previous is not None and previous[0] == "word" and
+                                      previous[1].upper() in ("KEY", "UNIQUE")) or (indexcolumns and depth == 1)):
+                keydepth = depth
+                indexcolumns = False
+        elif token == ("punct", ")"):
+            if depth == keydepth:
+                keydepth = None
+
+            depth -= 1
+        elif token[0] == "word" and token[1].upper() == "ASC" and depth == keydepth:
+            previous = previous_significant(tokens, i)
+
+            if previous is not None and previous[0] == "word":
+                continue
+
+        result.append(token)
+
+    return result
+
+
+def remove_include(tokens):
+    result = []
+    i = 0
+
+    while i < len(tokens):
+        token = tokens[i]
+
+        if token[0] == "word" and token[1].upper() == "INCLUDE":
+            start = skip_whitespace(tokens, i + 1)
+
+            if start < len(tokens) and tokens[start] == ("punct", "("):
+                end = matching_parenthesis(tokens, start)
+
+                if end is not None:
+                    while result and result[-1][0] in whitespace:
+                        result.pop()
+
+                    i = end + 1
+                    continue
+
+        result.append(token)
+        i += 1
+
+    return result
+
+
+'''
+Removes ON PRIMARY (and the PRIMARY left of TEXTIMAGE_ON PRIMARY) after the closing parenthesis
+at the end of a statement
+'''
+
+
+def remove_on_primary(tokens):
+    words = [token[1].upper() for token in tokens if is_significant(token)]
+
+    if len(words) < 3 or words[-2:] not in (["ON", "PRIMARY"], ["PRIMARY", "PRIMARY"]):
+        return tokens
+
+    end = len(tokens)
+
+    while end > 0:
+        end -= 1
+
+        if tokens[end] == ("punct", ")"):
+            return tokens[:end + 1]
+
+        if is_significant(tokens[end]) and (tokens[end][0] != "word" or
+                                            tokens[end][1].upper() not in ("ON", "PRIMARY")):
+            return tokens
+
+    return tokens
+
+
+def quote_keywords(tokens):
+    result = list(tokens)
+
+    for i in range(1, len(tokens) - 1):
+        if tokens[i][0] == "word" and tokens[i][1] in quotedkeywords and tokens[i - 1][0] in whitespace and \
+                tokens[i + 1][0] in whitespace:
+            result[i] = ("quoted", '"%s"' % tokens[i][1])
+
+    return result
+
+
+'''
+Tokenizes a statement without its comments and its final ;
+'''
+
+
+def statement_tokens(statement):
+    tokens = [token for token in tokenize(statement) if token[0] != "comment"]
+
+    while tokens and not is_significant(tokens[-1]):
+        tokens.pop()
+
+    if tokens and tokens[-1] == ("punct", ";"):
+        tokens.pop()
+
+    return tokens
+
+
+'''
+Converts one statement. Returns the converted statement without its ; or None when it is left
+out, and whether it is an ALTER TABLE statement that was left out.
+'''
+
+
+def convert_statement(statement):
+    tokens = statement_tokens(statement)
+    words = significant_words(tokens, 4)
+
+    if not words or words[0] in ("USE", "SET"):
+        return (None, False)
+
+    if words[:2] == ["ALTER", "TABLE"]:
+        return (None, True)
+
+    return (convert_tokens(tokens, words), False)
+
+
+'''
+Converts the tokens of a statement, words being its first significant words. Returns the
+converted text or None when nothing is left of it.
+'''
+
+
+def convert_tokens(tokens, words):
+    isindex = words[0] == "CREATE" and "INDEX" in words[1:]
+    istable = words[:2] == ["CREATE", "TABLE"]
+    converted = []
+
+    for token in tokens:
+        if token == ("bracket", "[sysname]"):
+            converted.append(("word", "nvarchar(128)"))
+        elif token[0] == "bracket":
+            converted.append(("word", token[1][1:-1].replace("]]", "]")))
+        elif token[0] == "word" and token[1] in removedwords:
+            continue
+        else:
+            converted.append(token)
+
+    converted = remove_with_on_primary(converted)
+
+    if istable or isindex:
+        converted = remove_asc(converted, isindex)
+
+    if isindex:
+        converted = remove_include(converted)
+
+    if istable or isindex:
+        converted = remove_on_primary(converted)
+
+    converted = quote_keywords(converted)
+    text = render(converted).strip()
+
+    if not text:
+        return None
+
+    return newlinesregex.sub("\n\n", text)
+
+
+'''
+Joins converted statements, as given by convert_statement, into the converted script. Yields the
+script in pieces, one per statement.
+'''
+
+
+def join_statements(results):
+    previous = None
+    droppedafter = False
+
+    for (converted, droppedalter) in results:
+        if converted is None:
+            droppedafter = droppedafter or droppedalter
+            continue
+
+        if previous is not None:
+            yield previous + ";\n\n"
+
+        previous = converted
+        droppedafter = False
+
+    if previous is not None:
+        # Like the pipeline, which leaves the empty line of the ALTER TABLE statements it removes
+        yield previous + (";\n\n" if droppedafter else ";")
+
+
+def convert_schema(data):
+    return "".join(join_statements(convert_statement(statement) for statement in iter_statements(data)))
+
+
+def convert_batch(batch):
+    return [convert_statement(statement) for statement in iter_statements(batch)]
+
+
+'''
+Streaming version of convert_schema: reads the script at filename in GO batches and writes the
+converted script to output as it goes, the batches being converted in workers processes. With a
+cache (see tsqlcache.py) the batches converted before are taken from it.
+'''
+
+
+def convert_schema_file(filename, output, workers=1, cache=None):
+    with open(filename, "r") as file:
+        results = (result for converted in ordered_map(convert_batch, iter_batches(file), workers, cache)
+                   for result in converted)
+
+        for piece in join_statements(results):
+            output.write(piece)
@@ -1,9 +1,22 @@
 from functions import *
+from tsqlcache import BatchCache, source_version
+from tsqldeferred import defer_schema_file
+from tsqlschemaconverter import convert_schema, convert_schema_file
 
+import argparse
+import os
 import sys
+import tsqldeferred
+import tsqllexer
+import tsqlschemaconverter
 
 
 def transform_schema(filename):
+    return convert_schema(load_data_from_file(filename))
+
+
+# The original pipeline of full document regexes, kept for comparison. Slow on large scripts
+def transform_schema_regex(filename):
     data = load_data_from_file(filename)
     data = remove_use_db(data)
     data = replace_sysname(data)
@@ -27,9 +40,51 @@ def transform_schema(filename):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Call program with filename parameter:")
-        print("{} filename".format(sys.argv[0]))
-        exit(1)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', help="T-SQL schema script to convert")
+    parser.add_argument('--regex', action='store_true',
+                        help="Convert with the original pipeline of regexes instead of the single pass converter")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read and write the script statement by statement instead of as a whole")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes converting statements with --stream. Defaults to the number of cores")
+    parser.add_argument('--cache', help="Database of converted batches to reuse, implies --stream")
+    parser.add_argument('--cachesize', type=int, default=256, help="Size of the --cache in MB")
+    parser.add_argument('--postload', metavar="FILE",
+                        help="Leave the keys, indexes and constraints out of the tables and write them to this "
+                             "post-load script instead, implies --stream")
+
+    args = parser.parse_args()
+
+    if args.regex:
+        for (option, given) in (("--stream", args.stream), ("--workers", args.workers is not None),
+                                ("--cache", args.cache is not None), ("--postload", args.postload is not None)):
+            if given:
+                parser.error("%s can not be combined with --regex" % option)
+
+    workers = args.workers or os.cpu_count()
+
+    if args.postload is not None:
+        with open(args.postload, "w") as postload:
+            if args.cache is not None:
+                version = source_version(tsqllexer, tsqlschemaconverter, tsqldeferred)
+
+                with BatchCache(args.cache, version, args.cachesize << 20) as cache:
+                    defer_schema_file(args.filename, sys.stdout, postload, workers, cache)
+
+                print("Cache hit rate %.1f%%" % (100 * cache.hitrate()), file=sys.stderr)
+            else:
+                defer_schema_file(args.filename, sys.stdout, postload, workers)
+
+        print()
+    elif args.cache is not None:
+        with BatchCache(args.cache, source_version(tsqllexer, tsqlschemaconverter), args.cachesize << 20) as cache:
+            convert_schema_file(args.filename, sys.stdout, workers, cache)
+            print()
 
-    print(transform_schema(sys.argv[1]))
+        print("Cache hit rate %.1f%%" % (100 * cache.hitrate()), file=sys.stderr)
+    elif args.stream:
+        convert_schema_file(args.filename, sys.stdout, workers)
+        print()
+    else:
+        print(transform_schema_regex(args.filename) if args.regex else transform_schema(args.filename))
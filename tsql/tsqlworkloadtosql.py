@@ -1,39 +1,31 @@
 from functions import *
+from tsqlcache import BatchCache, source_version
+from tsqlparameters import bind_parameters
+from tsqlparallel import ordered_map
 
+import argparse
+import functions
+import os
 import re
 import sys
-
-def extract_vars(query):
-    vardecls = re.findall(r'(?P<varname>@(\w*?)\d+)=(?P<value>.*?)(,|$)', query)
-    vars = {}
-
-    for vardecl in vardecls:
-        vars[vardecl[0]] = re.sub(r"^N'", "'", vardecl[2])  # Remove N prefix if present
-    return vars
+import tsqllexer
+import tsqlparameters
 
 
 def replace_vars(query):
-    vars = extract_vars(query)
-    query = re.sub(r"exec sp_executesql N'(?P<query>.*?)',N'(.*)", '\g<query>', query, flags=re.M | re.S)
+    bound = bind_parameters(query)
 
-    for varname, value in vars.items():
-        query = re.sub(r'' + varname + '', value, query, flags=re.M | re.I)
-    return query
+    return query if bound is None else bound
 
 
 def remove_parentheses(query):
     return re.sub(r'WHERE\s+\(\((?P<inner>.*?)\)\)\)\s+AND', 'WHERE (\g<inner>)) AND', query)
 
 
-def replace_double_single_quotes(query):
-    return re.sub(r"''(?P<inner>[^']*?)''", "'\g<inner>'", query, flags=re.M)
-
-
 def transform_query(query):
     query = remove_brackets(query)
     query = replace_vars(query)
     query = remove_parentheses(query)
-    query = replace_double_single_quotes(query)
     query = query.strip() + ";"
 
     return query
@@ -53,25 +45,97 @@ def is_valid_query(query):
            "create table" not in query
 
 
-def transform_workload(filename):
-    data = load_data_from_file(filename)
+'''
+Splits the lines of a trace in batches at the go lines, without reading more than a batch
+'''
+
+
+def iter_batches(lines):
+    batch = []
+
+    for line in lines:
+        if line.rstrip("\n") == "go":
+            yield "".join(batch)
+            batch = []
+        else:
+            batch.append(line)
+
+    yield "".join(batch)
 
-    queries = re.split(r'^go$', data, flags=re.M)
 
+'''
+Transforms one batch of the trace. Returns the query or None when the batch holds no query to keep
+'''
+
+
+def transform_batch(batch):
     # First do global filtering
-    queries = [q for q in queries if "select" in q.lower()]
+    if "select" not in batch.lower():
+        return None
 
     # Transform and do final filtering
-    return [query for query in (transform_query(q) for q in queries) if is_valid_query(query)]
+    query = transform_query(batch)
 
+    return query if is_valid_query(query) else None
+
+
+'''
+Yields the queries of the trace at filename in order, reading the trace batch by batch and
+transforming the batches in workers processes, or taking them from cache when given
+'''
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Call program with filename parameter:")
-        print("{} filename".format(sys.argv[0]))
-        exit(1)
 
-    workload = transform_workload(sys.argv[1])
+def iter_workload(filename, workers=1, cache=None):
+    with open(filename, "r") as file:
+        for query in ordered_map(transform_batch, iter_batches(file), workers, cache):
+            if query is not None:
+                yield query
 
-    for query in workload:
-        print(query)
+
+def transform_workload(filename):
+    return list(iter_workload(filename))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', help="SQL Profiler trace to transform")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes transforming queries")
+    parser.add_argument('--prepared', metavar="DIRECTORY",
+                        help="Write templates with placeholders and their parameters to this directory instead")
+    parser.add_argument('--dialect', choices=["mysql", "postgres", "monetdb"], default="mysql",
+                        help="Placeholder style of the --prepared templates")
+    parser.add_argument('--cache', help="Database of transformed batches to reuse, also for --prepared")
+    parser.add_argument('--cachesize', type=int, default=256, help="Size of the --cache in MB")
+
+    args = parser.parse_args()
+
+    if args.prepared is not None:
+        # Imported here, as tsqlprepared builds on this module
+        import tsqlfingerprint
+        import tsqlprepared
+
+        if args.cache is not None:
+            version = source_version(functions, tsqllexer, tsqlparameters, sys.modules[__name__], tsqlfingerprint,
+                                     tsqlprepared)
+
+            with BatchCache(args.cache, version, args.cachesize << 20) as cache:
+                (queries, templates) = tsqlprepared.export_prepared(args.filename, args.prepared, args.dialect,
+                                                                    args.workers, cache)
+
+            print("Cache hit rate %.1f%%" % (100 * cache.hitrate()), file=sys.stderr)
+        else:
+            (queries, templates) = tsqlprepared.export_prepared(args.filename, args.prepared, args.dialect,
+                                                                args.workers)
+
+        print("Wrote %d queries of %d templates to %s" % (queries, templates, args.prepared))
+    elif args.cache is not None:
+        version = source_version(functions, tsqllexer, tsqlparameters, sys.modules[__name__])
+
+        with BatchCache(args.cache, version, args.cachesize << 20) as cache:
+            for query in iter_workload(args.filename, args.workers, cache):
+                print(query)
+
+        print("Cache hit rate %.1f%%" % (100 * cache.hitrate()), file=sys.stderr)
+    else:
+        for query in iter_workload(args.filename, args.workers):
+            print(query)